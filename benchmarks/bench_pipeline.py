@@ -0,0 +1,227 @@
+"""
+This module times every stage of edit_model2.py and analyze_model2.py on
+synthetic models of growing sizes (see synthetic_model.py), and measures the
+peak memory allocated by each stage with tracemalloc in a second run. The
+results can be saved as a baseline, and a later run compared with it : the
+stages that became slower than the baseline by more than the tolerance are
+reported as regressions, and the program then exits with code 1.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'code'))
+# pylint: disable=wrong-import-position
+import analyze_model2
+import cytoscape_export
+import edit_model2
+import model2
+import rule_firing
+import synthetic_model
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Sizes, depletion pattern and number of repeats
+        - Baseline and result files, tolerance of the comparison
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="500x200x40,2000x1000x200",
+                        help="Comma separated sizes, each one given as \
+                        RULESxELEMENTSxTIMESTEPS")
+    parser.add_argument("--pattern", choices=synthetic_model.PATTERNS,
+                        default="random",
+                        help="How the elements disappear over time")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of timed runs, the best one is kept")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Skip the run measuring the memory")
+    parser.add_argument("--json", default=None,
+                        help="Write the results in a JSON file")
+    parser.add_argument("--baseline", default=None,
+                        help="Compare the results with a baseline JSON file")
+    parser.add_argument("--save-baseline", default=None,
+                        help="Save the results as a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative slowdown reported as a regression")
+    return parser.parse_args()
+
+
+def pipeline_stages(modelfile, poefile, porfile):
+    """
+    Lists the stages of both programs, in the order of their main
+    functions. Every stage takes and updates a dictionary of the results
+    of the previous stages. The outputs are written in ./results.
+    Returns :
+        - A list of (name, function) pairs
+    """
+    def load_model(state):
+        state['model'] = model2.load_model2(modelfile)
+
+    def list_all_elts(state):
+        state['elts'] = edit_model2.list_all_elts(poefile)
+
+    def sugg_element(state):
+        state['sugg'] = edit_model2.sugg_element(state['elts'],
+                                                 state['model'])
+
+    def rules_to_weigh(state):
+        state['weigh'] = edit_model2.rules_to_weigh(state['model'],
+                                                    state['sugg'])
+
+    def change_weight(state):
+        state['changed'] = edit_model2.change_weight(state['model'],
+                                                     state['weigh'])
+
+    def export_network(state):
+        cytoscape_export.export_network(state['model'], state['changed'],
+                                        state['sugg']['Element'], "./results")
+
+    def firing_matrix(state):
+        state['firing'] = rule_firing.firing_matrix(porfile)
+
+    def rules_in_timesteps(state):
+        analyze_model2.rules_in_timesteps(state['firing'])
+
+    def write_firing_reports(state):
+        rule_firing.write_firing_reports(state['firing'], "./results")
+
+    def compute_possible_rules(state):
+        state['computed'] = analyze_model2.compute_possible_rules(
+            state['model'], poefile)
+
+    def sim_possible_rules(state):
+        state['missing'] = analyze_model2.sim_possible_rules(
+            state['model'], poefile, computed=state['computed'])
+
+    def summary_missing_elements(state):
+        analyze_model2.summary_missing_elements(
+            state['missing'],
+            analyze_model2.load_annot_nodes("./results/annot_node.csv"))
+
+    return [("edit.load_model", load_model),
+            ("edit.list_all_elts", list_all_elts),
+            ("edit.sugg_element", sugg_element),
+            ("edit.rules_to_weigh", rules_to_weigh),
+            ("edit.change_weight", change_weight),
+            ("edit.export_network", export_network),
+            ("analyze.firing_matrix", firing_matrix),
+            ("analyze.rules_in_timesteps", rules_in_timesteps),
+            ("analyze.write_firing_reports", write_firing_reports),
+            ("analyze.compute_possible_rules", compute_possible_rules),
+            ("analyze.sim_possible_rules", sim_possible_rules),
+            ("analyze.summary_missing_elements", summary_missing_elements)]
+
+
+def run_stages(stages, memory=False):
+    """
+    Runs all the stages once.
+    Returns :
+        - A dictionary giving the time (or the peak memory in bytes) of
+          every stage
+    """
+    state = {}
+    measures = {}
+    for name, function in stages:
+        if memory:
+            tracemalloc.start()
+            function(state)
+            measures[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            function(state)
+            measures[name] = time.perf_counter() - start
+    return measures
+
+
+def bench_size(size, pattern, repeat, memory):
+    """
+    This function generates a synthetic model of the given size in a
+    temporary directory and measures its stages.
+    Returns :
+        - A dictionary giving, for every stage, its best time in seconds
+          and its peak memory in bytes
+    """
+    nb_rules, nb_elements, nb_timesteps = (int(value) for value
+                                           in size.split('x'))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            os.makedirs("results")
+            files = synthetic_model.write_synthetic("synthetic", nb_rules,
+                                                    nb_elements, nb_timesteps,
+                                                    pattern)
+            stages = pipeline_stages(*files)
+            times = [run_stages(stages) for _ in range(max(1, repeat))]
+            peaks = run_stages(stages, memory=True) if memory else {}
+        finally:
+            os.chdir(cwd)
+    return dict((name, {'time': min(run[name] for run in times),
+                        'peak': peaks.get(name)})
+                for name, _ in stages)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Finds the stages slower than in the baseline by more than the
+    tolerance. Differences under a millisecond are ignored.
+    Returns :
+        - A list of (size, stage, baseline time, time) tuples
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, measure in stages.items():
+            reference = baseline.get(size, {}).get(stage)
+            if reference is None:
+                continue
+            if measure['time'] > reference['time']*(1 + tolerance) \
+               and measure['time'] - reference['time'] > 0.001:
+                regressions.append((size, stage, reference['time'],
+                                    measure['time']))
+    return regressions
+
+
+def main():
+    """
+    Main function of the program. Measures every size and compares the
+    results with the baseline.
+    """
+    args = args_parse()
+    results = {}
+    for size in args.sizes.split(','):
+        results[size] = bench_size(size, args.pattern, args.repeat,
+                                   not args.no_memory)
+        print("Size " + size + " (rules x elements x timesteps)")
+        for stage, measure in results[size].items():
+            peak = measure['peak']
+            print("  {0:<36}{1:>10.4f} s{2}".format(
+                stage, measure['time'],
+                '' if peak is None else "{0:>12.1f} kB".format(peak/1024)))
+    for path in (args.json, args.save_baseline):
+        if path is not None:
+            with open(path, 'w') as outfile:
+                json.dump(results, outfile, indent=1)
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as infile:
+            baseline = json.load(infile)
+        regressions = compare(results, baseline, args.tolerance)
+        for size, stage, reference, measure in regressions:
+            print("Regression {0} {1} : {2:.4f} s -> {3:.4f} s (x{4:.2f})"
+                  .format(size, stage, reference, measure,
+                          measure/reference))
+        if regressions:
+            sys.exit(1)
+        print("No regression against " + args.baseline)
+
+if __name__ == "__main__":
+    main()
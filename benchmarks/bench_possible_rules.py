@@ -0,0 +1,113 @@
+"""
+This module measures the speedup of the bitset engine used by
+sim_possible_rules against the former list based computation, on a random
+model of a given size. Both results are compared before the timings are
+displayed.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'code'))
+# pylint: disable=wrong-import-position
+import model2
+import rule_bitsets
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Number of rules, elements and timesteps of the random model
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=2000,
+                        help="Number of rules of the random model")
+    parser.add_argument("--elements", type=int, default=1000,
+                        help="Number of elements of the random model")
+    parser.add_argument("--timesteps", type=int, default=200,
+                        help="Number of timesteps of the random simulation")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the random generator")
+    return parser.parse_args()
+
+
+def random_model(nb_rules, nb_elements, nb_timesteps, seed):
+    """
+    Creates random reactive lists, compiled into a model whose rules all
+    produce NONE, and a random depletion of the elements over time, each
+    element disappearing at most once.
+    Returns :
+        - elements : The element names
+        - reactives : The reactive lists of the rules
+        - model : The compiled model of the rules
+        - missing_rows : The indexes of the missing elements in each timestep
+    """
+    rand = random.Random(seed)
+    elements = ['elt' + str(index) for index in range(nb_elements)]
+    reactives = [rand.sample(elements, rand.randint(1, 4))
+                 for _ in range(nb_rules)]
+    model = model2.Model2()
+    for reactivelist in reactives:
+        model.add_rule(' + '.join(reactivelist) + ' => NONE', '1.0')
+    depletion = [rand.randint(0, 2*nb_timesteps) for _ in elements]
+    missing_rows = [[index for index, step in enumerate(depletion)
+                     if step <= timestep] for timestep in range(nb_timesteps)]
+    return elements, reactives, model, missing_rows
+
+
+def legacy_possible_rules(elements, reactives, missing_rows):
+    """
+    The former computation, with linear lookups in the list of the present
+    elements of each timestep.
+    """
+    result = []
+    for missing in missing_rows:
+        missing = set(missing)
+        present = [elt for index, elt in enumerate(elements)
+                   if index not in missing]
+        possible = []
+        for index, reactivelist in enumerate(reactives):
+            if all(reac in present for reac in reactivelist):
+                possible.append(index)
+        result.append(possible)
+    return result
+
+
+def bitset_possible_rules(elements, model, missing_rows):
+    """
+    The computation done by sim_possible_rules.
+    """
+    consumers, never_possible = rule_bitsets.compile_model(model, elements)
+    masks = rule_bitsets.possible_rules_masks(len(model.names), consumers,
+                                              never_possible, missing_rows)
+    return [rule_bitsets.bit_indexes(mask) for mask in masks]
+
+
+def main():
+    """
+    Main function of the program. Times both computations.
+    """
+    args = args_parse()
+    elements, reactives, model, missing_rows = random_model(
+        args.rules, args.elements, args.timesteps, args.seed)
+    start = time.perf_counter()
+    legacy = legacy_possible_rules(elements, reactives, missing_rows)
+    legacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    bitset = bitset_possible_rules(elements, model, missing_rows)
+    bitset_time = time.perf_counter() - start
+    if legacy != bitset:
+        sys.exit("The bitset engine and the list computation disagree")
+    print("Rules : {0}, elements : {1}, timesteps : {2}".format(
+        args.rules, args.elements, args.timesteps))
+    print("List computation : {0:.3f} s".format(legacy_time))
+    print("Bitset engine : {0:.3f} s".format(bitset_time))
+    print("Speedup : x{0:.1f}".format(legacy_time/bitset_time))
+
+if __name__ == "__main__":
+    main()
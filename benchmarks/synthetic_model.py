@@ -0,0 +1,165 @@
+"""
+This module generates synthetic models and simulations of any size, to
+measure how the programs scale beyond the small e_coli_core example. It
+writes a model2 file (random reactions between the elements, some of them
+catalysed by an element found on both sides, a NONE => NONE rule and an
+--INITIAL section) and matching .poe and .por files, where the elements
+disappear over time following a depletion pattern :
+    - none : no element ever disappears
+    - random : every element may disappear once, at a random timestep
+    - cascade : the elements disappear one group after the other, the
+      elements of the same group at the same timestep
+    - sudden : a fraction of the elements disappears at once, halfway
+The percentage of the events of every rule is drawn at random among the
+rules whose reactives are all present.
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'code'))
+import simulate_model2  # pylint: disable=wrong-import-position
+
+PATTERNS = ("none", "random", "cascade", "sudden")
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Prefix of the generated files
+        - Size, depletion pattern and seed of the synthetic model
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out", metavar="PREFIX",
+                        help="Prefix of the generated model2, Poe and Por \
+                        files")
+    parser.add_argument("--rules", type=int, default=2000,
+                        help="Number of rules of the model")
+    parser.add_argument("--elements", type=int, default=1000,
+                        help="Number of elements of the model")
+    parser.add_argument("--timesteps", type=int, default=200,
+                        help="Number of timesteps of the simulation")
+    parser.add_argument("--pattern", choices=PATTERNS, default="random",
+                        help="How the elements disappear over time")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the random generator")
+    return parser.parse_args()
+
+
+def synthetic_rules(nb_rules, nb_elements, rand):
+    """
+    Creates random rules. Every rule has 1 to 3 reactives and 1 to 3
+    products, and one rule out of two is catalysed by an element on both
+    sides. The last rule is NONE => NONE.
+    Returns :
+        - elements : The element names, NONE first
+        - rules : The (reactives, products) lists of the rules
+    """
+    elements = ['NONE'] + ['m' + str(index) for index in range(nb_elements - 1)]
+    pool = elements[1:]
+    rules = []
+    for _ in range(nb_rules - 1):
+        reactives = rand.sample(pool, rand.randint(1, 3))
+        products = rand.sample(pool, rand.randint(1, 3))
+        if rand.random() < 0.5:
+            catalyst = rand.choice(pool)
+            reactives.append(catalyst)
+            products.insert(0, catalyst)
+        rules.append((reactives, products))
+    rules.append((['NONE'], ['NONE']))
+    return elements, rules
+
+
+def depletion_times(elements, nb_timesteps, pattern, rand):
+    """
+    Gives the timestep where every element disappears (nb_timesteps if it
+    never does). NONE never disappears.
+    """
+    never = nb_timesteps
+    if pattern == "none":
+        times = [never]*len(elements)
+    elif pattern == "random":
+        times = [rand.randint(1, 2*nb_timesteps) for _ in elements]
+    elif pattern == "cascade":
+        nb_groups = max(1, nb_timesteps//4)
+        order = list(range(len(elements)))
+        rand.shuffle(order)
+        times = [never]*len(elements)
+        for rank, elt in enumerate(order[:len(order)//2]):
+            times[elt] = 1 + (rank*nb_groups//max(1, len(order)//2))*4
+    else:
+        times = [nb_timesteps//2 if rand.random() < 0.2 else never
+                 for _ in elements]
+    times[0] = never
+    return [min(time, never) for time in times]
+
+
+def write_synthetic(outprefix, nb_rules, nb_elements, nb_timesteps,
+                    pattern="random", seed=0):
+    """
+    This function writes a synthetic model and its simulation.
+    Returns :
+        - modelfile, poefile, porfile : The paths of the generated files
+    Files generated :
+        - <outprefix>.model2 : The synthetic model.
+        - <outprefix>.poe, <outprefix>.por : Its synthetic simulation, with
+          one timestep every 1000 units of time.
+    """
+    rand = random.Random(seed)
+    elements, rules = synthetic_rules(nb_rules, nb_elements, rand)
+    index = dict((elt, pos) for pos, elt in enumerate(elements))
+    times = depletion_times(elements, nb_timesteps, pattern, rand)
+    names = ['R' + str(rule) for rule in range(len(rules))]
+    modelfile = outprefix + '.model2'
+    with open(modelfile, 'w') as model_out:
+        for reactives, products in rules:
+            model_out.write(' + '.join(reactives) + ' => '
+                            + ' + '.join(products) + '\t'
+                            + rand.choice(['0.5', '1.0', '2.0', '4.0'])
+                            + '\n')
+        model_out.write('--INITIAL\n')
+        model_out.write(''.join(elt + '\t' + str(rand.randint(1, 50)) + '\n'
+                                for elt in elements))
+    poefile = outprefix + '.poe'
+    porfile = outprefix + '.por'
+    reactive_ids = [[index[elt] for elt in reactives]
+                    for reactives, _ in rules]
+    with open(poefile, 'w') as poe, open(porfile, 'w') as por:
+        poe.write('\t'.join(['#Tps', '#Evts'] + elements) + '\n')
+        por.write('\t'.join(['#Tps', '#Evts'] + names) + '\n')
+        for timestep in range(nb_timesteps):
+            time = 500.0 + 1000.0*timestep
+            presence = []
+            for elt in range(len(elements)):
+                if timestep < times[elt]:
+                    presence.append(100.0)
+                elif timestep == times[elt]:
+                    presence.append(rand.uniform(0.0, 100.0))
+                else:
+                    presence.append(0.0)
+            events = [0]*len(rules)
+            for rule, reactives in enumerate(reactive_ids):
+                if all(presence[elt] > 0 for elt in reactives):
+                    events[rule] = rand.randint(0, 5)
+            nb_events = sum(events)
+            poe.write(simulate_model2.format_row(time, nb_events, presence))
+            por.write(simulate_model2.format_row(
+                time, nb_events, [100*count/nb_events if nb_events else 0.0
+                                  for count in events]))
+    return modelfile, poefile, porfile
+
+
+def main():
+    """
+    Main function of the program. Writes the synthetic files.
+    """
+    args = args_parse()
+    write_synthetic(args.out, args.rules, args.elements, args.timesteps,
+                    args.pattern, args.seed)
+
+if __name__ == "__main__":
+    main()
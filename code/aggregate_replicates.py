@@ -0,0 +1,311 @@
+"""
+This module aggregates the .poe files of many stochastic replicates of the
+same model. The replicates are folded one at a time, row by row, into online
+accumulators (Welford mean and variance, depletion counts and P2 quantile
+sketches), so the memory used does not depend on the number of replicates.
+It generates a summary trajectory with confidence bands for every element,
+the distribution of the first depletion time of every element, and a report
+giving, for every rule, the proportion of runs where it dies.
+"""
+import argparse
+import array
+import math
+import os
+import model2
+import rule_bitsets
+import trajectory_store
+
+QUANTILES = (0.05, 0.5, 0.95)
+Z_95 = 1.959964
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Model2 file
+        - Poe files of the replicates
+        - Output directory
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("m2", metavar="MODEL2",
+                        help="Enter a valid model 2 file")
+    parser.add_argument("poe", metavar="POE", nargs='+',
+                        help="Enter the Poe files of the replicates")
+    parser.add_argument("-o", "--outdir", default="./results",
+                        help="Directory of the generated files")
+    return parser.parse_args()
+
+
+class P2Quantile:
+    """
+    The P2 algorithm of Jain and Chlamtac, estimating a quantile of a stream
+    of values with five markers, without storing the values.
+    """
+
+    def __init__(self, prob):
+        self.prob = prob
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2*prob, 1 + 4*prob, 3 + 2*prob, 5]
+        self.increments = [0, prob/2, prob, (1 + prob)/2, 1]
+
+    def add(self, value):
+        """
+        Adds a value to the sketch.
+        """
+        self.count += 1
+        if self.count <= 5:
+            self.heights.append(value)
+            self.heights.sort()
+            return
+        heights = self.heights
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+        for index in range(cell + 1, 5):
+            self.positions[index] += 1
+        for index in range(5):
+            self.desired[index] += self.increments[index]
+        for index in range(1, 4):
+            delta = self.desired[index] - self.positions[index]
+            if (delta >= 1 and self.positions[index + 1]
+                    - self.positions[index] > 1) \
+               or (delta <= -1 and self.positions[index - 1]
+                   - self.positions[index] < -1):
+                step = 1 if delta > 0 else -1
+                height = self._parabolic(index, step)
+                if not heights[index - 1] < height < heights[index + 1]:
+                    height = self._linear(index, step)
+                heights[index] = height
+                self.positions[index] += step
+
+    def _parabolic(self, index, step):
+        heights, pos = self.heights, self.positions
+        return heights[index] + step/(pos[index + 1] - pos[index - 1]) * (
+            (pos[index] - pos[index - 1] + step)
+            * (heights[index + 1] - heights[index])
+            / (pos[index + 1] - pos[index])
+            + (pos[index + 1] - pos[index] - step)
+            * (heights[index] - heights[index - 1])
+            / (pos[index] - pos[index - 1]))
+
+    def _linear(self, index, step):
+        heights, pos = self.heights, self.positions
+        return heights[index] + step*(heights[index + step] - heights[index]) \
+            / (pos[index + step] - pos[index])
+
+    def value(self):
+        """
+        Returns the estimated quantile, None if no value has been added.
+        """
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            rank = self.prob*(self.count - 1)
+            low = int(math.floor(rank))
+            high = min(low + 1, self.count - 1)
+            return self.heights[low] + (rank - low)*(self.heights[high]
+                                                    - self.heights[low])
+        return self.heights[2]
+
+
+class ReplicateAggregator:
+    """
+    The online accumulators of the replicates. Rows are aligned by their
+    position in the files, the labels of the longest replicate being kept.
+    Attributes :
+        - nb_runs : The number of replicates folded so far
+        - counts, means, m2s, depleted : The number of replicates, the
+          Welford mean and sum of squared deviations, and the number of
+          depleted replicates, for every (timestep, element)
+        - first_depletion : The quantile sketches of the first depletion
+          time of every element, and the number of runs where it happens
+        - rule_death : The number of runs where every rule is impossible at
+          the last timestep, and the sketches of the time it is first blocked
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.nb_runs = 0
+        self.elements = None
+        self.labels = []
+        self.counts = array.array('l')
+        self.means = array.array('d')
+        self.m2s = array.array('d')
+        self.depleted = array.array('l')
+        self.first_depletion = None
+        self.nb_depleted_runs = None
+        self.rule_death = array.array('l', [0])*len(model.names)
+        self.first_blocked = [[P2Quantile(prob) for prob in QUANTILES]
+                              for _ in model.names]
+        self.compiled = None
+
+    def _grow(self, nb_rows):
+        """
+        Adds accumulators for the rows that were never seen.
+        """
+        nb_elts = len(self.elements)
+        missing = nb_rows*nb_elts - len(self.means)
+        if missing > 0:
+            self.counts.extend([0]*(nb_rows - len(self.counts)))
+            self.means.extend([0.0]*missing)
+            self.m2s.extend([0.0]*missing)
+            self.depleted.extend([0]*missing)
+
+    def add_replicate(self, poefile):
+        """
+        Folds one replicate, read row by row, into the accumulators.
+        """
+        rows = trajectory_store.iter_rows(poefile)
+        names = next(rows)
+        if self.elements is None:
+            self.elements = names[2:]
+            self.first_depletion = [[P2Quantile(prob) for prob in QUANTILES]
+                                    for _ in self.elements]
+            self.nb_depleted_runs = array.array('l', [0])*len(self.elements)
+            self.compiled = rule_bitsets.compile_model(self.model,
+                                                       self.elements)
+        elif names[2:] != self.elements:
+            raise ValueError(poefile + " does not simulate the same elements")
+        nb_elts = len(self.elements)
+        consumers, never_possible = self.compiled
+        never_blocked = (1 << len(self.model.names)) - 1
+        first_seen = [None]*nb_elts
+        first_blocked = [None]*len(self.model.names)
+        mask = never_blocked
+        for row, (label, values) in enumerate(rows):
+            if row >= len(self.labels):
+                self.labels.append(label)
+                self._grow(row + 1)
+            self.counts[row] += 1
+            count = self.counts[row]
+            base = row*nb_elts
+            time = float(label)
+            missing = []
+            for elt in range(nb_elts):
+                value = values[elt + 2]
+                delta = value - self.means[base + elt]
+                self.means[base + elt] += delta/count
+                self.m2s[base + elt] += delta*(value - self.means[base + elt])
+                if value == 0:
+                    self.depleted[base + elt] += 1
+                    missing.append(elt)
+                    if first_seen[elt] is None:
+                        first_seen[elt] = time
+            mask = rule_bitsets.possible_rules_masks(len(self.model.names),
+                                                     consumers,
+                                                     never_possible,
+                                                     [missing])[0]
+            for rule in rule_bitsets.bit_indexes(never_blocked & ~mask):
+                first_blocked[rule] = time
+            never_blocked &= mask
+        self.nb_runs += 1
+        for elt, time in enumerate(first_seen):
+            if time is not None:
+                self.nb_depleted_runs[elt] += 1
+                for sketch in self.first_depletion[elt]:
+                    sketch.add(time)
+        for rule, time in enumerate(first_blocked):
+            if time is not None:
+                for sketch in self.first_blocked[rule]:
+                    sketch.add(time)
+        for rule in rule_bitsets.bit_indexes(
+                ((1 << len(self.model.names)) - 1) & ~mask):
+            self.rule_death[rule] += 1
+
+    def write_summary(self, outdir):
+        """
+        Writes the summary trajectory of the replicates.
+        File generated :
+            - replicates_summary.tsv : For every timestep and element, the
+              mean, standard deviation, 95% confidence band of the mean and
+              the probability to be depleted.
+        """
+        nb_elts = len(self.elements)
+        with open(os.path.join(outdir, "replicates_summary.tsv"), "w") \
+             as outfile:
+            outfile.write('\t'.join(["Timestep", "Element", "N", "Mean", "Sd",
+                                     "Lower", "Upper", "P_depleted"]) + '\n')
+            for row, label in enumerate(self.labels):
+                count = self.counts[row]
+                lines = []
+                for elt in range(nb_elts):
+                    pos = row*nb_elts + elt
+                    mean = self.means[pos]
+                    std = math.sqrt(self.m2s[pos]/(count - 1)) \
+                        if count > 1 else 0.0
+                    half = Z_95*std/math.sqrt(count)
+                    lines.append('\t'.join([
+                        label, self.elements[elt], str(count),
+                        '{0:.6f}'.format(mean), '{0:.6f}'.format(std),
+                        '{0:.6f}'.format(max(mean - half, 0.0)),
+                        '{0:.6f}'.format(mean + half),
+                        '{0:.3f}'.format(self.depleted[pos]/count)]))
+                outfile.write('\n'.join(lines) + '\n')
+
+    def write_depletion_times(self, outdir):
+        """
+        Writes the distribution of the first depletion time of the elements.
+        File generated :
+            - depletion_times.csv : For every element, the proportion of runs
+              where it is depleted and the quantiles of its first depletion.
+        """
+        with open(os.path.join(outdir, "depletion_times.csv"), "w") \
+             as outfile:
+            outfile.write("Element,Depleted_pct,Q05,Q50,Q95\n")
+            for elt, name in enumerate(self.elements):
+                outfile.write(name + ',' + '{0:.1f}'.format(
+                    100*self.nb_depleted_runs[elt]/self.nb_runs) + ','
+                              + ','.join(format_time(sketch.value()) for sketch
+                                         in self.first_depletion[elt]) + '\n')
+
+    def write_rule_death(self, outdir):
+        """
+        Writes the report on the death of the rules.
+        File generated :
+            - rules_death.csv : For every rule, the proportion of runs where
+              it cannot be applied at the end of the simulation, and the
+              quantiles of the time it is first blocked.
+        """
+        with open(os.path.join(outdir, "rules_death.csv"), "w") as outfile:
+            outfile.write("Rule,Dies_pct,Q05,Q50,Q95\n")
+            for rule, name in enumerate(self.model.names):
+                outfile.write(name + ',' + '{0:.1f}'.format(
+                    100*self.rule_death[rule]/self.nb_runs) + ','
+                              + ','.join(format_time(sketch.value()) for sketch
+                                         in self.first_blocked[rule]) + '\n')
+
+
+def format_time(time):
+    """
+    Formats a time of the reports, NA if it never happened.
+    """
+    return 'NA' if time is None else '{0:.6f}'.format(time)
+
+
+def main():
+    """
+    Main function of the program. Folds every replicate and writes the
+    reports.
+    """
+    args = args_parse()
+    aggregator = ReplicateAggregator(model2.load_model2(args.m2))
+    for poefile in args.poe:
+        aggregator.add_replicate(poefile)
+    os.makedirs(args.outdir, exist_ok=True)
+    aggregator.write_summary(args.outdir)
+    aggregator.write_depletion_times(args.outdir)
+    aggregator.write_rule_death(args.outdir)
+
+if __name__ == "__main__":
+    main()
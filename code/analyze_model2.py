@@ -3,8 +3,20 @@ This module allows the analysis of a simulation generated with a model2 file.
 It computes several analysis files to understand the problems in the
 simulation.
 """
+import gzip
+import itertools
+import os
 import textwrap
 import argparse
+import delta_reports
+import trajectory_store
+import rule_bitsets
+import model2
+import parse_cache
+import rule_firing
+import run_metrics
+
+RESULTS_DIR = "./results"
 
 
 def args_parse():
@@ -14,8 +26,11 @@ def args_parse():
         - New Poe file
         - New Por file
         - Node annotation file
+        - Stream, delta, cache and metrics options
     Returns :
-        - The four mandatory arguments as arguments
+        - The four mandatory arguments as arguments, the stream and delta
+          options, the parse cache (None if it is not used) and the Metrics of
+          the run
     """
     parser = argparse.ArgumentParser()
     # Argument for Modified Model2 file
@@ -30,104 +45,178 @@ def args_parse():
     # Argument for Node annotation Poe file
     parser.add_argument("node", metavar="node",
                         help="Enter a valid Node annotation file")
+    # Option to read the Poe and Por files row by row
+    parser.add_argument("--stream", action="store_true",
+                        help="Process the Poe and Por files row by row with \
+                        a constant memory")
+    # Option to write the per-timestep reports as changes between timesteps
+    parser.add_argument("--delta", action="store_true",
+                        help="Write the possible rules and missing elements \
+                        as delta reports (.delta.npz and .delta.jsonl) \
+                        instead of text files")
+    parse_cache.add_arguments(parser)
+    run_metrics.add_arguments(parser)
     args = parser.parse_args()
     modelfile = args.m2
     poefile = args.poe
     porfile = args.por
     annot_nodes = args.node
-    return modelfile, poefile, porfile, annot_nodes
+    return modelfile, poefile, porfile, annot_nodes, args.stream, args.delta, \
+        parse_cache.from_args(args), run_metrics.from_args(args,
+                                                           "analyze_model2")
 
 
-def list_all_rules(modelfile):
+def rules_in_timesteps(firing, outdir=RESULTS_DIR):
     """
-    As in the other program, this function creates a dictionary containing
-    the rules and the weights of the model2 file.
-    Returns :
-        - The rule dictionary
-    """
-    dict_rules = {}
-    index = 0
-    with open(modelfile, 'r') as model_new:
-        current_line = model_new.readline()
-        while current_line != '':
-            if current_line.rstrip() == "--INITIAL":
-                break
-            if current_line[0] != '%' and current_line != '\n':
-                num_rule = 'R' + str(index)
-                dict_rules[num_rule] = current_line.rstrip().split("\t")
-                index += 1
-            current_line = model_new.readline()
-    return dict_rules
-
-
-def find_used_rules(porfile):
-    """
-    This function uses the Por file to find all the rules that have been used
-    during the simulation.
-    It also computes the number of times each one has been used.
+    This function creates a file that shows the rules used in each timestep
+    of the simulation, from the matrix of the uses of the rules computed
+    from the Por file. As before, the rules that were always at 0 or always
+    at 100 percent are left out.
+    File generated :
+        - rules_applied.txt : In each timestep, the rules used by the
+          simulation.
+    """
+    t_indptr, t_rules, t_counts = firing.by_timestep()
+    with open(os.path.join(outdir, "rules_applied.txt"), "w") as rules_file:
+        for step, timestep in enumerate(firing.labels):
+            tmp_rule_list = []
+            tmp_nb_used_rule = []
+            for pos in range(t_indptr[step], t_indptr[step + 1]):
+                if firing.varied[t_rules[pos]]:
+                    tmp_rule_list.append(firing.rules[t_rules[pos]])
+                    tmp_nb_used_rule.append(t_counts[pos])
+            rules_file.write(rules_applied_text(timestep, tmp_rule_list,
+                                                tmp_nb_used_rule))
+
+
+def rules_applied_text(timestep, rule_list, nb_used_rule):
+    """
+    Formats the paragraph of rules_applied.txt for one timestep.
+    """
+    return textwrap.fill("At " + str(timestep) + ", the rule(s) " \
+                         + ", ".join(rule_list) + " has or have been used " \
+                         + ", ".join(str(int(x)) for x in nb_used_rule) \
+                         + " times respectively", width=80) + "\n"
+
+
+def stream_used_rules(porfile):
+    """
+    This function is the streaming version of the search of the used rules.
+    It reads the Por file row by row and only keeps a running flag for each
+    rule, telling if it has always been at 0, always at 100, or has varied.
     Returns :
-        - used_rules : A list of the used rules for each timestep.
-        - nb_events : A dictionary that contains a list of the timesteps of
-          the simulation and the number of events that occurred in each
-          timestep
+        - used_columns : The column indexes of the rules used during the
+          simulation
     """
-    used_rules = []
-    # Creating the dictionary of events from the porfile
-    nb_events = {"Timestep":[], "Nb_events":[]}
-    with open(porfile, 'r') as por:
-        por_data = [[data for data in line.rstrip().split('\t')] \
-                    for line in por]
-    for timestep in por_data[1:]:
-        nb_events["Timestep"].append(timestep[0])
-        nb_events["Nb_events"].append(int(float(timestep[1])))
-    # From the por file, it is possible to know every rule used in each
-    # timestep
-    for rule in range(2, len(por_data[0])):
-    # We check for variations throughout the simulation, which shows the use
-    # of a given rule
-        if all(timestep[rule] == '0.000000' for timestep in por_data[1:]):
-            pass
-        elif all(timestep[rule] == '100.000000' for timestep in por_data[1:]):
-            pass
+    rows = trajectory_store.iter_rows(porfile)
+    names = next(rows)
+    first_values = None
+    varied = []
+    for _, values in rows:
+        if first_values is None:
+            first_values = values
+            varied = [value not in (0, 100) for value in values]
         else:
-            tmp_list = []
-            for timestep in por_data[0:]:
-                tmp_list.append(timestep[rule])
-            used_rules.append(tmp_list)
-    return used_rules, nb_events
+            for index, value in enumerate(values):
+                if value != first_values[index]:
+                    varied[index] = True
+    if first_values is None:
+        return []
+    return [index for index in range(2, len(names)) if varied[index]]
 
 
-def rules_in_timesteps(used_rules, nb_events):
+def stream_rules_in_timesteps(porfile, used_columns, outdir=RESULTS_DIR):
     """
-    This function creates a file that shows the rules used in each timestep
-    of the simulation from the previous function
+    This function is the streaming version of rules_in_timesteps. The Por
+    file is read a second time, row by row, and each timestep is written as
+    soon as it is read.
     File generated :
         - rules_applied.txt : In each timestep, the rules used by the
           simulation.
     """
-    with open("./results/rules_applied.txt", "w") as rules_file:
-        for step in range(0, len(nb_events["Timestep"])):
+    rows = trajectory_store.iter_rows(porfile)
+    names = next(rows)
+    with open(os.path.join(outdir, "rules_applied.txt"), "w") as rules_file:
+        for timestep, values in rows:
+            nb_events = int(values[1])
             tmp_rule_list = []
             tmp_nb_used_rule = []
-            for used_rule in used_rules:
-                if used_rule[step+1] != "0.000000":
-                    tmp_rule_list.append(used_rule[0])
-                    tmp_nb_used_rule.append(round(float(used_rule[step+1]) \
-                        *nb_events["Nb_events"][step])/100)
-            rules_file.write(textwrap.fill("At " + str(nb_events["Timestep"] \
-                    [step]) + ", the rule(s) " + ", ".join(tmp_rule_list) + \
-                    " has or have been used " + \
-                    ", ".join(str(int(x)) for x in tmp_nb_used_rule) + \
-                    " times respectively", width=80) + "\n")
+            for index in used_columns:
+                if values[index] != 0:
+                    tmp_rule_list.append(names[index])
+                    tmp_nb_used_rule.append(round(values[index] \
+                        *nb_events)/100)
+            rules_file.write(rules_applied_text(timestep, tmp_rule_list,
+                                                tmp_nb_used_rule))
+
+
+def compute_possible_rules(model, poefile, cache=None):
+    """
+    This function computes the missing elements and the possible rules of
+    each timestep of the simulation from the poefile, parsed or taken from
+    the parse cache.
+    Returns :
+        - elements : The element names of the simulation
+        - missing_rows : A dictionary giving, for each timestep, the indexes
+          of its missing elements
+        - possible_masks : The bitset of the possible rules of each timestep
+    """
+    poe = trajectory_store.load_trajectory(poefile, cache)
+    elements = poe.names[2:]
+    # The missing elements of every timestep are gathered column by column
+    rows_missing = [[] for _ in poe.labels]
+    for index in range(2, len(poe.names)):
+        for row in poe.zero_rows(index):
+            rows_missing[row].append(index - 2)
+    poe.close()
+    # The first timestep is the initial state, where nothing is missing
+    missing_rows = {"0.000000": []}
+    for row, label in enumerate(poe.labels):
+        missing_rows[label] = rows_missing[row]
+    # The reactives of every rule are compiled into bitsets and all the
+    # timesteps are resolved at once.
+    consumers, never_possible = rule_bitsets.compile_model(model, elements)
+    possible_masks = rule_bitsets.possible_rules_masks(len(model.names),
+                                                       consumers,
+                                                       never_possible,
+                                                       missing_rows.values())
+    return elements, missing_rows, possible_masks
 
 
-def sim_possible_rules(dict_rules, poefile):
+def find_death(model, computed):
+    """
+    This function finds when a simulation dies, that is the first timestep
+    where only the trivial rules of the model (like NONE => NONE) can be
+    applied, from the result of compute_possible_rules.
+    Returns :
+        - death : The label of that timestep, None if the run does not die
+        - nb_possible : The number of non trivial rules possible at every
+          timestep
+    """
+    non_trivial = 0
+    for rule in range(len(model.names)):
+        if not model.is_trivial(rule):
+            non_trivial |= 1 << rule
+    death = None
+    nb_possible = []
+    for timestep, mask in zip(computed[1], computed[2]):
+        nb_possible.append(bin(mask & non_trivial).count('1'))
+        if death is None and nb_possible[-1] == 0:
+            death = timestep
+    return death, nb_possible
+
+
+def sim_possible_rules(model, poefile, outdir=RESULTS_DIR, computed=None,
+                       delta=False):
     """
     This functions computes the possible rules to be used in each step of the
     simulation from the poefile.
     It also gather the missing elements in each timestep and store them in
     a file.
     It creates another file containing the computed possible rules.
+    The result of compute_possible_rules can be given if it is already known.
+    With delta, only the changes from one timestep to the next are written,
+    as delta reports (see delta_reports.py) instead of the text files.
     Returns :
         - missing_elements : A list of the missing elements in the last
           timestep.
@@ -136,76 +225,140 @@ def sim_possible_rules(dict_rules, poefile):
           timestep.
         - possible_rules.txt : A file containing the possible rules to be used
           in each timestep.
+        - Or, with delta, lost_reactives.delta.npz/.jsonl and
+          possible_rules.delta.npz/.jsonl
     """
-    reactives = []
+    if computed is None:
+        computed = compute_possible_rules(model, poefile)
+    elements, missing_rows, possible_masks = computed
+    if delta:
+        lost_writer = delta_reports.DeltaWriter(
+            os.path.join(outdir, "lost_reactives"), 'lost_reactives',
+            elements)
+        possible_writer = delta_reports.DeltaWriter(
+            os.path.join(outdir, "possible_rules"), 'possible_rules',
+            model.names)
+        for timestep, mask in zip(missing_rows, possible_masks):
+            lost_writer.add(timestep,
+                            rule_bitsets.element_mask(missing_rows[timestep]))
+            possible_writer.add(timestep, mask)
+        lost_writer.close()
+        possible_writer.close()
+        return [elements[i] for i in missing_rows[timestep]]
     dict_possible_time = {}
-    # Computes the reactives from the rule dictionary to compare with the
-    # possible elements in each timestep.
-    for rule in dict_rules:
-        reactives.append(list(map(str.strip, \
-            dict_rules[rule][0].split(sep='=>')[0].split(sep=' + '))))
-    with open(poefile, 'r') as poe:
-        poe_data = [[data for data in line.rstrip().split('\t')] \
-        for line in poe]
-    possible_elements = {"0.000000":[100]*(len(poe_data[0])-2)}
-    title = 0
-    for elt in poe_data[0:]:
-        tmp_list = []
-        if title == 0:
-            possible_elements["Elements"] = elt[2:]
-            title = 1
-        else:
-            tmp_list = elt[2:]
-            for index, value in enumerate(tmp_list):
-                if value == "0.000000":
-                    tmp_list[index] = 0
-                elif value == "100.000000":
-                    tmp_list[index] = 100
-                else:
-                    tmp_list[index] = float(tmp_list[index])
-            possible_elements[str(elt[0])] = tmp_list
-    list_index = list(possible_elements.keys())
-    list_index.remove("Elements")
-    dict_possible_rules = {}
+    for timestep, mask in zip(missing_rows, possible_masks):
+        dict_possible_time[timestep] = [model.names[index] for index \
+                                        in rule_bitsets.bit_indexes(mask)]
     # Computes the missing elements in each time step and add them in the
     # summary file.
-    lost_reactives = open("./results/lost_reactives.txt", "w")
-    for timestep in list_index:
-        time_possible_elements_values = []
-        time_possible_elements_keys = []
-        missing_elements = []
-        for i in range(0, len(possible_elements[timestep])):
-            if possible_elements[timestep][i] != 0:
-                time_possible_elements_keys.append(possible_elements["Elements"][i])
-                time_possible_elements_values.append(possible_elements[timestep][i])
-            else:
-                missing_elements.append(possible_elements["Elements"][i])
-        lost_reactives.write("Timestep : " + timestep + ", missing elements : \n")
-        lost_reactives.write(str(missing_elements) + "\n")
-        index = 0
-        for reactivelist in reactives:
-            rule_possible = True
-            for reac in reactivelist:
-                if reac not in time_possible_elements_keys:
-                    rule_possible = False
-            if rule_possible:
-                rule = "R" + str(index)
-                dict_possible_rules[rule] = dict_rules[rule]
-            index += 1
-        dict_possible_time[timestep] = dict.copy(dict_possible_rules)
-        dict_possible_rules.clear()
-    lost_reactives.close()
+    with open(os.path.join(outdir, "lost_reactives.txt"), "w") \
+         as lost_reactives:
+        for timestep in missing_rows:
+            missing_elements = [elements[i] for i in missing_rows[timestep]]
+            lost_reactives.write(delta_reports.lost_reactives_text(
+                timestep, missing_elements))
     # Creates the file containing the possible rules in each timestep.
-    with open("./results/possible_rules.txt", "w") as possible_file:
+    with open(os.path.join(outdir, "possible_rules.txt"), "w") \
+         as possible_file:
         for dict_possible_rule in dict_possible_time:
-            possible_file.write("Timestep : " + dict_possible_rule + "\n")
-            possible_file.write(textwrap.fill(str(dict_possible_time \
-                                [dict_possible_rule].keys()), width=80) \
-                                + "\n")
+            possible_file.write(delta_reports.possible_rules_text(
+                dict_possible_rule, dict_possible_time[dict_possible_rule]))
     return missing_elements
 
 
-def summary_missing_elements(missing_elements, annot_nodes):
+def stream_possible_rules(model, poefile, outdir=RESULTS_DIR, delta=False):
+    """
+    This function is the streaming version of sim_possible_rules. The Poe
+    file is read row by row and both files are written as the timesteps come,
+    so only the compiled rules and the current timestep are kept in memory
+    (with delta, the .npz archives keep the changes until the end).
+    Returns :
+        - missing_elements : A list of the missing elements in the last
+          timestep.
+    Files generated :
+        - lost_reactives.txt : A file containing the missing elements in each
+          timestep.
+        - possible_rules.txt : A file containing the possible rules to be used
+          in each timestep.
+        - Or, with delta, lost_reactives.delta.npz/.jsonl and
+          possible_rules.delta.npz/.jsonl
+    """
+    rows = trajectory_store.iter_rows(poefile)
+    elements = next(rows)[2:]
+    consumers, never_possible = rule_bitsets.compile_model(model, elements)
+    if delta:
+        lost_writer = delta_reports.DeltaWriter(
+            os.path.join(outdir, "lost_reactives"), 'lost_reactives',
+            elements)
+        possible_writer = delta_reports.DeltaWriter(
+            os.path.join(outdir, "possible_rules"), 'possible_rules',
+            model.names)
+    else:
+        lost_reactives = open(os.path.join(outdir, "lost_reactives.txt"), "w")
+        possible_file = open(os.path.join(outdir, "possible_rules.txt"), "w")
+    # The first timestep is the initial state, where nothing is missing,
+    # unless the file has its own row at 0.000000 (which replaces it, as in
+    # sim_possible_rules)
+    timestep, missing = "0.000000", []
+    first, values = next(rows, (None, None))
+    if first == timestep:
+        missing = [index - 2 for index in range(2, len(values)) \
+                   if values[index] == 0]
+    else:
+        rows = itertools.chain([(first, values)], rows) \
+            if first is not None else rows
+    while timestep is not None:
+        mask = rule_bitsets.possible_rules_masks(len(model.names), consumers,
+                                                 never_possible, [missing])[0]
+        missing_elements = [elements[i] for i in missing]
+        if delta:
+            lost_writer.add(timestep, rule_bitsets.element_mask(missing))
+            possible_writer.add(timestep, mask)
+        else:
+            lost_reactives.write(delta_reports.lost_reactives_text(
+                timestep, missing_elements))
+            possible_file.write(delta_reports.possible_rules_text(
+                timestep, [model.names[index] for index
+                           in rule_bitsets.bit_indexes(mask)]))
+        timestep, values = next(rows, (None, None))
+        if timestep is not None:
+            missing = [index - 2 for index in range(2, len(values)) \
+                       if values[index] == 0]
+    if delta:
+        lost_writer.close()
+        possible_writer.close()
+    else:
+        lost_reactives.close()
+        possible_file.close()
+    return missing_elements
+
+
+def read_annot_nodes(annot_nodes):
+    """
+    Reads the node annotation file generated by edit_model2.py, compressed
+    if its name ends with .gz (edit_model2.py --gzip).
+    Returns :
+        - annot_lines : The lines of the file
+    """
+    opener = gzip.open if annot_nodes.endswith('.gz') else open
+    with opener(annot_nodes, 'rt') as elts_file:
+        annot_lines = elts_file.readlines()
+    return annot_lines
+
+
+def load_annot_nodes(annot_nodes, cache=None):
+    """
+    Loads the node annotation file, from the parse cache if one is given.
+    Returns :
+        - annot_lines : The lines of the file
+    """
+    if cache is not None:
+        return cache.fetch('annot_nodes', annot_nodes, read_annot_nodes)
+    return read_annot_nodes(annot_nodes)
+
+
+def summary_missing_elements(missing_elements, annot_lines,
+                             outdir=RESULTS_DIR):
     """
     This function creates a file similar to the edge annotation file containing
     only the information on the missing elements in the last timestep of the
@@ -220,27 +373,71 @@ def summary_missing_elements(missing_elements, annot_nodes):
         - missing_elts_summary.txt : The file summarizing the missing elements
           in the last timestep of the simulation.
     """
-    missing_elts_file = open("./results/missing_elts_summary.txt", "w")
-    missing_elts_file.write("Element,Nreac,Nprod,Ratio\n")
-    with open(annot_nodes, 'r') as elts_file:
-        current_line = elts_file.readline()
-        while current_line != "":
-            line_as_list = current_line.split(",")
-            if line_as_list[0] in missing_elements:
-                missing_elts_file.write(current_line)
-            current_line = elts_file.readline()
+    with open(os.path.join(outdir, "missing_elts_summary.txt"), "w") \
+         as missing_elts_file:
+        missing_elts_file.write(''.join(missing_summary_lines(
+            missing_elements, annot_lines)))
+
+
+def missing_summary_lines(missing_elements, annot_lines):
+    """
+    Selects the lines of the node annotations of the missing elements.
+    Returns :
+        - summary_lines : The lines of missing_elts_summary.txt
+    """
+    missing_elements = set(missing_elements)
+    summary_lines = ["Element,Nreac,Nprod,Ratio\n"]
+    for current_line in annot_lines:
+        line_as_list = current_line.split(",")
+        if line_as_list[0] in missing_elements:
+            summary_lines.append(current_line)
+    return summary_lines
 
 
 def main():
     """
-    Main function of the program. Executes all the other defined functions.
+    Main function of the program. Executes all the other defined functions,
+    measuring each of them if it is asked for.
     """
-    modelfile, poefile, porfile, annot_nodes = args_parse()
-    dict_rules = list_all_rules(modelfile)
-    used_rules, nb_events = find_used_rules(porfile)
-    rules_in_timesteps(used_rules, nb_events)
-    missing_elements = sim_possible_rules(dict_rules, poefile)
-    summary_missing_elements(missing_elements, annot_nodes)
+    modelfile, poefile, porfile, annot_nodes, stream, delta, cache, \
+        metrics = args_parse()
+    with metrics.stage("load_model2") as stage:
+        model = model2.load_model2(modelfile, cache)
+        stage.rules = len(model.names)
+    if stream:
+        with metrics.stage("stream_used_rules") as stage:
+            used_columns = stream_used_rules(porfile)
+            stage.rules = len(model.names)
+        with metrics.stage("stream_rules_in_timesteps"):
+            stream_rules_in_timesteps(porfile, used_columns)
+        with metrics.stage("stream_possible_rules") as stage:
+            missing_elements = stream_possible_rules(model, poefile,
+                                                     delta=delta)
+            stage.rules = len(model.names)
+    else:
+        with metrics.stage("firing_matrix") as stage:
+            firing = rule_firing.firing_matrix(porfile, cache)
+            stage.rows = len(firing.labels)
+            stage.rules = len(firing.rules)
+        with metrics.stage("rules_in_timesteps") as stage:
+            rules_in_timesteps(firing)
+            stage.rows = len(firing.labels)
+        with metrics.stage("write_firing_reports") as stage:
+            rule_firing.write_firing_reports(firing, RESULTS_DIR)
+            stage.rows = len(firing.labels)
+        with metrics.stage("compute_possible_rules") as stage:
+            computed = compute_possible_rules(model, poefile, cache)
+            stage.rows = len(computed[1])
+            stage.rules = len(model.names)
+        with metrics.stage("sim_possible_rules") as stage:
+            missing_elements = sim_possible_rules(model, poefile,
+                                                  computed=computed,
+                                                  delta=delta)
+            stage.rows = len(computed[1])
+    with metrics.stage("summary_missing_elements"):
+        summary_missing_elements(missing_elements,
+                                 load_annot_nodes(annot_nodes, cache))
+    metrics.write()
 
 if __name__ == "__main__":
     main()
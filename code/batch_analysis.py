@@ -0,0 +1,204 @@
+"""
+This module runs the analysis of analyze_model2.py on many simulations at
+once, typically the replicates and weight variants of a model. Each distinct
+model2 file and node annotation file is parsed only once and shared with the
+worker processes, the runs are spread over all the cores, and every run gets
+its own output directory. A summary table of all the runs is written at the
+end.
+"""
+import argparse
+import csv
+import glob
+import multiprocessing
+import os
+import analyze_model2
+import model2
+import rule_firing
+
+SUMMARY_FIELDS = ["Run", "Timesteps", "Used_rules", "Death", "Missing_last",
+                  "Possible_last"]
+
+# Parsed inputs shared with the worker processes
+SHARED = {}
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - A directory of simulations or a manifest file
+        - Output directory, default model2/node files and number of processes
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", metavar="DIR/MANIFEST",
+                        help="Enter a directory containing Poe/Por files or a \
+                        manifest file with one 'model2 poe por [node]' run \
+                        per line, separated by tabulations")
+    parser.add_argument("-o", "--outdir", default="./results/batch",
+                        help="Directory where each run gets its own folder")
+    parser.add_argument("--model", default=None,
+                        help="Model2 file used for the runs of a directory \
+                        without their own")
+    parser.add_argument("--node", default=None,
+                        help="Node annotation file used for the runs without \
+                        their own")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of worker processes (all cores by \
+                        default)")
+    return parser.parse_args()
+
+
+def read_manifest(manifest, default_node=None):
+    """
+    Reads a manifest file. Empty lines and lines starting with '#' are
+    ignored, and relative paths are relative to the manifest.
+    Returns :
+        - runs : A list of (model2, poe, por, node) tuples
+    """
+    root = os.path.dirname(os.path.abspath(manifest))
+    runs = []
+    with open(manifest, 'r') as manifest_file:
+        for line in manifest_file:
+            if line.strip() == '' or line[0] == '#':
+                continue
+            fields = [os.path.join(root, field.strip())
+                      for field in line.rstrip('\n').split('\t')]
+            if len(fields) < 3:
+                raise ValueError("Manifest lines need a model2, a poe and a \
+por file : " + line.strip())
+            node = fields[3] if len(fields) > 3 else default_node
+            runs.append((fields[0], fields[1], fields[2], node))
+    return runs
+
+
+def scan_directory(directory, default_model=None, default_node=None):
+    """
+    Finds the simulations of a directory and its subdirectories. Every Poe
+    file needs a Por file with the same name. Its model2 file is the one
+    with the same name, or the only model2 file of its folder, or the
+    default one. The same goes for the node annotation file (annot_node.csv,
+    or annot_node.csv.gz).
+    Returns :
+        - runs : A list of (model2, poe, por, node) tuples
+    """
+    runs = []
+    pattern = os.path.join(directory, '**', '*.poe')
+    for poefile in sorted(glob.glob(pattern, recursive=True)):
+        stem = poefile[:-len('.poe')]
+        porfile = stem + '.por'
+        if not os.path.exists(porfile):
+            continue
+        folder = os.path.dirname(poefile)
+        modelfile = stem + '.model2'
+        if not os.path.exists(modelfile):
+            candidates = glob.glob(os.path.join(folder, '*.model2'))
+            modelfile = candidates[0] if len(candidates) == 1 \
+                else default_model
+        if modelfile is None:
+            raise ValueError("No model2 file found for " + poefile)
+        node = os.path.join(folder, 'annot_node.csv')
+        if not os.path.exists(node):
+            node += '.gz'
+        if not os.path.exists(node):
+            node = default_node
+        runs.append((modelfile, poefile, porfile, node))
+    return runs
+
+
+def run_names(runs):
+    """
+    Gives a unique name to every run, from the name of its Poe file.
+    """
+    names = []
+    seen = set()
+    for run in runs:
+        base = os.path.splitext(os.path.basename(run[1]))[0]
+        name = base
+        suffix = 1
+        while name in seen:
+            suffix += 1
+            name = base + '_' + str(suffix)
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def init_worker(shared):
+    """
+    Receives the parsed models and node annotations in a worker process.
+    """
+    SHARED.update(shared)
+
+
+def analyze_run(task):
+    """
+    Analyzes one simulation in its own output directory, with the model and
+    node annotations parsed by the main process.
+    Returns :
+        - A row of the summary table
+    """
+    name, modelfile, poefile, porfile, node, outdir = task
+    model = SHARED['models'][modelfile]
+    os.makedirs(outdir, exist_ok=True)
+    firing = rule_firing.firing_matrix(porfile)
+    analyze_model2.rules_in_timesteps(firing, outdir)
+    rule_firing.write_firing_reports(firing, outdir)
+    computed = analyze_model2.compute_possible_rules(model, poefile)
+    missing_elements = analyze_model2.sim_possible_rules(model, poefile,
+                                                         outdir, computed)
+    if node is not None:
+        analyze_model2.summary_missing_elements(missing_elements,
+                                                SHARED['nodes'][node],
+                                                outdir)
+    # The run dies at the first timestep where only trivial rules remain
+    death, nb_possible = analyze_model2.find_death(model, computed)
+    return {"Run": name,
+            "Timesteps": len(firing.labels),
+            "Used_rules": sum(firing.varied),
+            "Death": death if death is not None else 'NA',
+            "Missing_last": len(missing_elements),
+            "Possible_last": nb_possible[-1]}
+
+
+def batch_analysis(runs, outdir, jobs=None):
+    """
+    This function analyzes all the given runs on a pool of processes.
+    Returns :
+        - summary : The rows of the summary table, in the order of the runs
+    File generated :
+        - summary.csv : One line per run, in the output directory.
+    """
+    shared = {'models': {}, 'nodes': {}}
+    for modelfile, _, _, node in runs:
+        if modelfile not in shared['models']:
+            shared['models'][modelfile] = model2.load_model2(modelfile)
+        if node is not None and node not in shared['nodes']:
+            shared['nodes'][node] = analyze_model2.load_annot_nodes(node)
+    tasks = [(name, run[0], run[1], run[2], run[3],
+              os.path.join(outdir, name))
+             for name, run in zip(run_names(runs), runs)]
+    os.makedirs(outdir, exist_ok=True)
+    with multiprocessing.Pool(jobs, init_worker, (shared,)) as pool:
+        summary = pool.map(analyze_run, tasks, chunksize=1)
+    with open(os.path.join(outdir, "summary.csv"), "w", newline='') \
+         as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summary)
+    return summary
+
+
+def main():
+    """
+    Main function of the program. Finds the runs and analyzes them.
+    """
+    args = args_parse()
+    if os.path.isdir(args.source):
+        runs = scan_directory(args.source, args.model, args.node)
+    else:
+        runs = read_manifest(args.source, args.node)
+    batch_analysis(runs, args.outdir, args.jobs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+This module writes the files of the Cytoscape network of a model : the SIF
+network, the edge and node annotation files, and an XGMML network where the
+node attributes (Nreac, Nprod, Ratio) and the edge scores are already
+embedded, so that it can be opened in Cytoscape without importing the
+annotation tables. All the files are written in one pass over the compiled
+rules, every reactive -> product edge going to every file at once, through
+buffers flushed in large chunks. The files can be compressed with gzip.
+"""
+import gzip
+import os
+from xml.sax.saxutils import quoteattr
+
+CHUNK_SIZE = 1 << 20
+FORMATS = ('sif', 'edge', 'node', 'xgmml')
+FILE_NAMES = {'sif': "cytoscape_network.sif",
+              'edge': "annot_edge.csv",
+              'node': "annot_node.csv",
+              'xgmml': "cytoscape_network.xgmml"}
+XGMML_NAMESPACES = ('xmlns:dc="http://purl.org/dc/elements/1.1/" '
+                    'xmlns:xlink="http://www.w3.org/1999/xlink" '
+                    'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" '
+                    'xmlns:cy="http://www.cytoscape.org" '
+                    'xmlns="http://www.cs.rpi.edu/XGMML"')
+
+
+class ChunkedWriter:
+    """
+    A text file written by chunks : the lines are gathered in a buffer which
+    is written when it reaches chunk_size characters. With compress, the
+    file is written with gzip and '.gz' is added to its name.
+    """
+
+    def __init__(self, path, compress=False, chunk_size=CHUNK_SIZE):
+        if compress:
+            self.path = path + '.gz'
+            self.file = gzip.open(self.path, 'wt', encoding='utf-8')
+        else:
+            self.path = path
+            self.file = open(path, 'w')
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.size = 0
+
+    def write(self, text):
+        """
+        Adds text to the buffer, writing the buffer if it is full.
+        """
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffer into the file.
+        """
+        self.file.write(''.join(self.buffer))
+        self.buffer = []
+        self.size = 0
+
+    def close(self):
+        """
+        Writes what remains in the buffer and closes the file.
+        """
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def node_line(elt, nb_reac, nb_prod):
+    """
+    Formats the line of an element in annot_node.csv.
+    Returns :
+        - line : The line of the file
+        - ratio : The ratio Nreac/Nprod, rounded to 3 decimals (0 if the
+          element is never a reactive or never a product)
+    """
+    if nb_prod != 0 and nb_reac != 0:
+        ratio = nb_reac/nb_prod
+        line = elt + ',' + str(nb_reac) + ',' + str(nb_prod) + ',' \
+            + '{0:.3f}'.format(ratio) + '\n'
+    else:
+        ratio = 0
+        line = elt + ',' + str(nb_reac) + ',' + str(nb_prod) + ',0\n'
+    return line, float('{0:.3f}'.format(ratio))
+
+
+def sif_lines(model, rule):
+    """
+    Returns the lines of a rule in the SIF network : every reactive is
+    linked to every product.
+    """
+    products = model.product_names(rule)
+    return ''.join(reac + " pp " + prod + "\n"
+                   for reac in model.reactive_names(rule) for prod in products)
+
+
+def edge_lines(model, rule, changed):
+    """
+    Returns the lines of a rule in annot_edge.csv, with its weight in the
+    model2 file and its changed weight.
+    """
+    products = model.product_names(rule)
+    scores = "\t" + model.weight_text[rule] + "\t" + str(changed) + "\n"
+    return ''.join(reac + " (pp) " + prod + scores
+                   for reac in model.reactive_names(rule) for prod in products)
+
+
+def xgmml_att(name, value, kind):
+    """
+    Formats an attribute of a node or an edge.
+    """
+    cy_type = {'string': 'String', 'integer': 'Integer', 'real': 'Double'}
+    return '    <att name=' + quoteattr(name) + ' value=' \
+        + quoteattr(str(value)) + ' type="' + kind + '" cy:type="' \
+        + cy_type[kind] + '"/>\n'
+
+
+def xgmml_header(title):
+    """
+    Returns the beginning of an XGMML network.
+    """
+    return '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' \
+        + '<graph label=' + quoteattr(title) + ' directed="1" ' \
+        + XGMML_NAMESPACES + '>\n' \
+        + '  <att name="name" value=' + quoteattr(title) \
+        + ' type="string" cy:type="String"/>\n'
+
+
+def xgmml_node(node_id, name, attributes):
+    """
+    Returns a node of an XGMML network with its (name, value, type)
+    attributes.
+    """
+    return '  <node id="' + str(node_id) + '" label=' + quoteattr(name) \
+        + '>\n' + xgmml_att('name', name, 'string') \
+        + ''.join(xgmml_att(*attribute) for attribute in attributes) \
+        + '  </node>\n'
+
+
+def xgmml_edge(edge_id, source, target, label, score_init, score_changed):
+    """
+    Returns an edge of an XGMML network with its scores.
+    """
+    return '  <edge id="' + str(edge_id) + '" label=' + quoteattr(label) \
+        + ' source="' + str(source) + '" target="' + str(target) \
+        + '" cy:directed="1">\n' + xgmml_att('name', label, 'string') \
+        + xgmml_att('interaction', 'pp', 'string') \
+        + xgmml_att('Score_init', score_init, 'real') \
+        + xgmml_att('Score_changed', score_changed, 'real') \
+        + '  </edge>\n'
+
+
+def xgmml_nodes(model, title):
+    """
+    Returns the beginning of the XGMML network of a model, with all its
+    nodes and their Nreac, Nprod and Ratio.
+    """
+    count_reac, count_prod = model.counts()
+    parts = [xgmml_header(title)]
+    for index, elt in enumerate(model.elements):
+        ratio = node_line(elt, count_reac[index], count_prod[index])[1]
+        parts.append(xgmml_node(index, elt,
+                                [('Nreac', count_reac[index], 'integer'),
+                                 ('Nprod', count_prod[index], 'integer'),
+                                 ('Ratio', ratio, 'real')]))
+    return ''.join(parts)
+
+
+def xgmml_edges(model, rule, changed, edge_id):
+    """
+    Returns the edges of a rule in the XGMML network, numbered from edge_id,
+    with its weight in the model2 file and its changed weight.
+    """
+    score_init = float(model.weight_text[rule])
+    score_changed = float(changed)
+    parts = []
+    for reac in model.reactives(rule):
+        for prod in model.products(rule):
+            parts.append(xgmml_edge(edge_id + len(parts), reac, prod,
+                                    model.elements[reac] + " (pp) "
+                                    + model.elements[prod],
+                                    score_init, score_changed))
+    return ''.join(parts)
+
+
+def export_network(model, changed, node_elements, outdir, formats=FORMATS,
+                   compress=False, chunk_size=CHUNK_SIZE, title="network"):
+    """
+    This function writes the Cytoscape files of a model in one pass over
+    its rules.
+    - changed : The changed weight of every rule, as written in
+      annot_edge.csv
+    - node_elements : The elements of annot_node.csv, in its order
+    Returns :
+        - paths : The path of every generated file, by format
+    Files generated (the ones asked for in formats) :
+        - cytoscape_network.sif : A network file for Cytoscape.
+        - annot_edge.csv : An edge annotation file for the Cytoscape network.
+        - annot_node.csv : A node annotation file for the Cytoscape network.
+        - cytoscape_network.xgmml : The network with its annotations.
+    """
+    writers = {}
+    for kind in formats:
+        writers[kind] = ChunkedWriter(os.path.join(outdir, FILE_NAMES[kind]),
+                                      compress, chunk_size)
+    try:
+        count_reac, count_prod = model.counts()
+        if 'node' in writers:
+            writers['node'].write('Element,Nreac,Nprod,Ratio\n')
+            for elt in node_elements:
+                index = model.element_index.get(elt)
+                writers['node'].write(node_line(
+                    elt, count_reac[index] if index is not None else 0,
+                    count_prod[index] if index is not None else 0)[0])
+        if 'edge' in writers:
+            writers['edge'].write('\t'.join(["Edge", "Score_init",
+                                             "Score_changed"]) + "\n")
+        xgmml = writers.get('xgmml')
+        if xgmml is not None:
+            xgmml.write(xgmml_nodes(model, title))
+        sif = writers.get('sif')
+        edge = writers.get('edge')
+        edge_id = len(model.elements)
+        for rule in range(len(model.names)):
+            if sif is not None:
+                sif.write(sif_lines(model, rule))
+            if edge is not None:
+                edge.write(edge_lines(model, rule, changed[rule]))
+            if xgmml is not None:
+                xgmml.write(xgmml_edges(model, rule, changed[rule], edge_id))
+                edge_id += len(model.reactives(rule)) \
+                    * len(model.products(rule))
+        if xgmml is not None:
+            xgmml.write('</graph>\n')
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return dict((kind, writer.path) for kind, writer in writers.items())
@@ -0,0 +1,307 @@
+"""
+This module writes the per-timestep reports of analyze_model2.py (the
+possible rules and the missing elements of every timestep) in a compact
+form. Consecutive timesteps are nearly identical, so only the changes of the
+set from one timestep to the next are stored, with the full set every
+'every' timesteps as a checkpoint. Each report is written as a .npz archive
+(CSR arrays of the added and removed indexes, readable with numpy.load) and
+as a JSON-lines file, whose last line gives the position of every
+checkpoint. The state of any timestep is rebuilt from its checkpoint, and a
+report can be converted back into the text files of analyze_model2.py.
+"""
+import argparse
+import array
+import json
+import textwrap
+import npz_io
+import rule_bitsets
+
+DELTA_VERSION = 1
+CHECKPOINT_EVERY = 64
+KINDS = ('possible_rules', 'lost_reactives')
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Delta report (.npz or .jsonl)
+        - Text file to write
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("report", metavar="REPORT",
+                        help="Enter a delta report (.delta.npz or \
+                        .delta.jsonl)")
+    parser.add_argument("-o", "--out", default=None,
+                        help="Text file to write (the report name ending \
+                        with .txt by default)")
+    return parser.parse_args()
+
+
+def lost_reactives_text(timestep, missing_elements):
+    """
+    Formats the paragraph of lost_reactives.txt for one timestep.
+    """
+    return "Timestep : " + timestep + ", missing elements : \n" \
+        + str(missing_elements) + "\n"
+
+
+def possible_rules_text(timestep, rule_names):
+    """
+    Formats the paragraph of possible_rules.txt for one timestep.
+    """
+    return "Timestep : " + timestep + "\n" \
+        + textwrap.fill("dict_keys(" + str(rule_names) + ")", width=80) + "\n"
+
+
+TEXT_FORMATS = {'possible_rules': possible_rules_text,
+                'lost_reactives': lost_reactives_text}
+
+
+class DeltaWriter:
+    """
+    Writes a delta report one timestep at a time. The sets are given as
+    bitsets of indexes in names.
+    """
+
+    def __init__(self, prefix, kind, names, formats=('npz', 'jsonl'),
+                 every=CHECKPOINT_EVERY):
+        self.prefix = prefix
+        self.kind = kind
+        self.names = names
+        self.every = every
+        self.previous = 0
+        self.labels = []
+        self.add_indptr = array.array('q', [0])
+        self.add_indices = array.array('q')
+        self.del_indptr = array.array('q', [0])
+        self.del_indices = array.array('q')
+        self.checkpoint_indptr = array.array('q', [0])
+        self.checkpoint_indices = array.array('q')
+        self.npz = 'npz' in formats
+        self.jsonl = None
+        self.offsets = []
+        if 'jsonl' in formats:
+            self.jsonl = open(prefix + '.delta.jsonl', 'wb')
+            self.write_line({'format': 'delta', 'version': DELTA_VERSION,
+                             'kind': kind, 'names': names, 'every': every})
+
+    def write_line(self, record):
+        """
+        Writes a record of the JSON-lines file.
+        """
+        self.jsonl.write(json.dumps(record, separators=(',', ':'))
+                         .encode('utf-8') + b'\n')
+
+    def add(self, label, mask):
+        """
+        Adds the set of a timestep.
+        """
+        row = len(self.labels)
+        added = rule_bitsets.bit_indexes(mask & ~self.previous)
+        removed = rule_bitsets.bit_indexes(self.previous & ~mask)
+        self.previous = mask
+        self.labels.append(label)
+        checkpoint = None
+        if row % self.every == 0:
+            checkpoint = rule_bitsets.bit_indexes(mask)
+        if self.npz:
+            self.add_indices.extend(added)
+            self.add_indptr.append(len(self.add_indices))
+            self.del_indices.extend(removed)
+            self.del_indptr.append(len(self.del_indices))
+            if checkpoint is not None:
+                self.checkpoint_indices.extend(checkpoint)
+                self.checkpoint_indptr.append(len(self.checkpoint_indices))
+        if self.jsonl is not None:
+            if checkpoint is not None:
+                self.offsets.append(self.jsonl.tell())
+                self.write_line({'t': label, 'full': checkpoint})
+            else:
+                self.write_line({'t': label, 'add': added, 'del': removed})
+
+    def close(self):
+        """
+        Writes the .npz archive and the last line of the JSON-lines file.
+        Returns :
+            - paths : The paths of the generated files
+        """
+        paths = []
+        if self.jsonl is not None:
+            self.write_line({'rows': len(self.labels),
+                             'checkpoints': self.offsets})
+            self.jsonl.close()
+            paths.append(self.prefix + '.delta.jsonl')
+        if self.npz:
+            npz_io.write_npz(self.prefix + '.delta.npz', {
+                'kind': [self.kind],
+                'names': self.names,
+                'labels': self.labels,
+                'every': array.array('q', [self.every]),
+                'add_indptr': self.add_indptr,
+                'add_indices': self.add_indices,
+                'del_indptr': self.del_indptr,
+                'del_indices': self.del_indices,
+                'checkpoint_indptr': self.checkpoint_indptr,
+                'checkpoint_indices': self.checkpoint_indices})
+            paths.append(self.prefix + '.delta.npz')
+        return paths
+
+
+class NpzDelta:
+    """
+    Reads a delta report from its .npz archive.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        arrays = dict((name, values) for name, (values, _)
+                      in npz_io.read_npz(path).items())
+        self.kind = arrays['kind'][0]
+        self.names = arrays['names']
+        self.labels = arrays['labels']
+        self.every = arrays['every'][0]
+        self.nrows = len(self.labels)
+        self.arrays = arrays
+
+    def changes(self, row):
+        """
+        Returns the indexes added and removed at a timestep.
+        """
+        arrays = self.arrays
+        return (arrays['add_indices'][arrays['add_indptr'][row]:
+                                      arrays['add_indptr'][row + 1]],
+                arrays['del_indices'][arrays['del_indptr'][row]:
+                                      arrays['del_indptr'][row + 1]])
+
+    def state(self, row):
+        """
+        Rebuilds the set of a timestep from its checkpoint.
+        Returns :
+            - label : The label of the timestep
+            - indexes : The sorted indexes of the set
+        """
+        if not 0 <= row < self.nrows:
+            raise IndexError("No timestep " + str(row) + " in " + self.path)
+        checkpoint = row//self.every
+        ptr = self.arrays['checkpoint_indptr']
+        current = set(self.arrays['checkpoint_indices'][ptr[checkpoint]:
+                                                        ptr[checkpoint + 1]])
+        for step in range(checkpoint*self.every + 1, row + 1):
+            added, removed = self.changes(step)
+            current.difference_update(removed)
+            current.update(added)
+        return self.labels[row], sorted(current)
+
+    def __iter__(self):
+        current = set()
+        for row in range(self.nrows):
+            added, removed = self.changes(row)
+            current.difference_update(removed)
+            current.update(added)
+            yield self.labels[row], sorted(current)
+
+
+class JsonlDelta:
+    """
+    Reads a delta report from its JSON-lines file, seeking to the checkpoint
+    of a timestep instead of reading the file from its beginning.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as infile:
+            header = json.loads(infile.readline())
+            self.start = infile.tell()
+            # The last line gives the positions of the checkpoints
+            infile.seek(0, 2)
+            end = infile.tell()
+            size = min(end, 1 << 16)
+            while True:
+                infile.seek(end - size)
+                tail = infile.read(size).rstrip(b'\n')
+                if b'\n' in tail or size == end:
+                    break
+                size = min(end, size*2)
+            footer = json.loads(tail[tail.rfind(b'\n') + 1:])
+        self.kind = header['kind']
+        self.names = header['names']
+        self.every = header['every']
+        self.nrows = footer['rows']
+        self.offsets = footer['checkpoints']
+
+    def state(self, row):
+        """
+        Rebuilds the set of a timestep from its checkpoint.
+        Returns :
+            - label : The label of the timestep
+            - indexes : The sorted indexes of the set
+        """
+        if not 0 <= row < self.nrows:
+            raise IndexError("No timestep " + str(row) + " in " + self.path)
+        checkpoint = row//self.every
+        with open(self.path, 'rb') as infile:
+            infile.seek(self.offsets[checkpoint])
+            for _ in range(row - checkpoint*self.every + 1):
+                record = json.loads(infile.readline())
+                if 'full' in record:
+                    current = set(record['full'])
+                else:
+                    current.difference_update(record['del'])
+                    current.update(record['add'])
+        return record['t'], sorted(current)
+
+    def __iter__(self):
+        current = set()
+        with open(self.path, 'rb') as infile:
+            infile.seek(self.start)
+            for _ in range(self.nrows):
+                record = json.loads(infile.readline())
+                if 'full' in record:
+                    current = set(record['full'])
+                else:
+                    current.difference_update(record['del'])
+                    current.update(record['add'])
+                yield record['t'], sorted(current)
+
+
+def open_delta(path):
+    """
+    Opens a delta report, from its .npz archive or its JSON-lines file.
+    """
+    if path.endswith('.npz'):
+        return NpzDelta(path)
+    return JsonlDelta(path)
+
+
+def delta_to_text(path, outfile):
+    """
+    This function converts a delta report into the text file written by
+    analyze_model2.py (possible_rules.txt or lost_reactives.txt).
+    """
+    report = open_delta(path)
+    text_format = TEXT_FORMATS[report.kind]
+    names = report.names
+    with open(outfile, 'w') as text_file:
+        for label, indexes in report:
+            text_file.write(text_format(label, [names[index]
+                                                for index in indexes]))
+
+
+def main():
+    """
+    Main function of the program. Converts a delta report into text.
+    """
+    args = args_parse()
+    outfile = args.out
+    if outfile is None:
+        for ext in ('.delta.npz', '.delta.jsonl'):
+            if args.report.endswith(ext):
+                outfile = args.report[:-len(ext)] + '.txt'
+        if outfile is None:
+            outfile = args.report + '.txt'
+    delta_to_text(args.report, outfile)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+This module traces the cascades of depletions of a simulation back to their
+root causes. The model2 rules give a producer -> element -> consumer index
+(the transposed incidence matrices of the compiled model), so the rules
+producing or consuming an element are found without any search.
+At each timestep, the rules blocked by the missing elements are propagated
+downstream : a blocked rule stops producing its products, and an element
+whose producers are all blocked is starved and blocks its own consumers in
+turn. A newly missing element that was already starved, or that is starved
+by another element missing since the same timestep, is a consequence of
+that depletion, otherwise it is a root cause. Root causes are ranked by
+the number of downstream rules they disable.
+"""
+import argparse
+import array
+import collections
+import os
+import model2
+import trajectory_store
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Model2 file
+        - Poe file
+        - Output directory
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("m2", metavar="MODEL2",
+                        help="Enter a valid model 2 file")
+    parser.add_argument("poe", metavar="POE",
+                        help="Enter a valid Poe file")
+    parser.add_argument("-o", "--outdir", default="./results",
+                        help="Directory of the generated files")
+    return parser.parse_args()
+
+
+class DepletionIndex:
+    """
+    The producer/consumer index of a model and the propagation of blocked
+    rules through it.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.consumer_ptr, self.consumer_rules = model.consumers()
+        self.producer_ptr, self.producer_rules = model.producers()
+
+    def producers_of(self, elt):
+        """
+        Returns the ids of the rules producing an element.
+        """
+        return self.producer_rules[self.producer_ptr[elt]:
+                                   self.producer_ptr[elt + 1]]
+
+    def consumers_of(self, elt):
+        """
+        Returns the ids of the rules consuming an element.
+        """
+        return self.consumer_rules[self.consumer_ptr[elt]:
+                                   self.consumer_ptr[elt + 1]]
+
+    def starved_sources(self, sources, rule_cause, elt_cause, active):
+        """
+        Propagates the depletion of a group of elements on a copy of the
+        state, without labelling anything.
+        Returns :
+            - starved : The elements of the group starved by the group
+        """
+        model = self.model
+        active = array.array('l', active)
+        source_set = set(sources)
+        reached = set(sources)
+        blocked = set()
+        starved = set()
+        queue = collections.deque(sources)
+        while queue:
+            elt = queue.popleft()
+            for rule in self.consumers_of(elt):
+                if rule_cause[rule] != -1 or rule in blocked:
+                    continue
+                blocked.add(rule)
+                for prod in model.products(rule):
+                    active[prod] -= 1
+                    if active[prod] != 0 or elt_cause[prod] != -1:
+                        continue
+                    if prod in source_set:
+                        starved.add(prod)
+                    elif prod not in reached:
+                        reached.add(prod)
+                        queue.append(prod)
+        return starved
+
+    def cascade(self, phases):
+        """
+        This function propagates the depletion of groups of elements, one
+        group after the other, in O(V+E). Every blocked rule and starved
+        element is labelled with the missing element it comes from.
+        In a group, the elements that the rest of the group does not starve
+        are propagated first : an element of the group starved by them is
+        labelled with the element starving it. The elements left, only
+        starved by each other, are then propagated one after the other.
+        Returns :
+            - rule_cause : For every rule, the id of the element that blocks
+              it, -1 if it is not blocked
+            - elt_cause : For every element, the id of the element that
+              starves it (itself if it is missing), -1 if it is not reached
+        """
+        model = self.model
+        nb_elts = len(model.elements)
+        rule_cause = array.array('l', [-1])*len(model.names)
+        elt_cause = array.array('l', [-1])*nb_elts
+        active = array.array('l', (self.producer_ptr[elt + 1]
+                                   - self.producer_ptr[elt]
+                                   for elt in range(nb_elts)))
+        for sources in phases:
+            sources = [elt for elt in sources if elt_cause[elt] == -1]
+            starved = self.starved_sources(sources, rule_cause, elt_cause,
+                                           active)
+            for elt in [elt for elt in sources if elt not in starved] \
+                    + [elt for elt in sources if elt in starved]:
+                if elt_cause[elt] != -1:
+                    continue
+                elt_cause[elt] = elt
+                queue = collections.deque([elt])
+                while queue:
+                    elt = queue.popleft()
+                    cause = elt_cause[elt]
+                    for rule in self.consumers_of(elt):
+                        if rule_cause[rule] != -1:
+                            continue
+                        rule_cause[rule] = cause
+                        for prod in model.products(rule):
+                            active[prod] -= 1
+                            if active[prod] == 0 and elt_cause[prod] == -1:
+                                elt_cause[prod] = cause
+                                queue.append(prod)
+        return rule_cause, elt_cause
+
+
+def trace_depletions(model, poefile):
+    """
+    This function follows the missing elements of a simulation and sorts the
+    newly missing elements of each timestep into root causes and
+    consequences. Elements of the model that are not in the simulation are
+    considered missing from the start.
+    Returns :
+        - steps : For each timestep with new missing elements, a tuple of
+          its label, its root causes as (element, disabled rules) and its
+          consequences as (element, cause, blocked producers)
+        - roots : For every root cause, its first timestep, number of
+          consumers and number of disabled rules
+    """
+    index = DepletionIndex(model)
+    rows = trajectory_store.iter_rows(poefile)
+    names = next(rows)
+    columns = [(col, model.element_index[elt]) for col, elt
+               in enumerate(names) if col >= 2 and elt in model.element_index]
+    simulated = set(elt for _, elt in columns)
+    missing = [elt for elt in range(len(model.elements))
+               if elt not in simulated]
+    steps = []
+    roots = {}
+    for label, values in rows:
+        missing_now = set(elt for col, elt in columns if values[col] == 0)
+        missing_now.update(elt for elt in missing if elt not in simulated)
+        new = sorted(missing_now.difference(missing))
+        if new:
+            # The previous depletions are propagated first, so the new ones
+            # are only credited with the rules they disable themselves
+            rule_cause, elt_cause = index.cascade([missing, new])
+            disabled = collections.defaultdict(list)
+            for rule, cause in enumerate(rule_cause):
+                disabled[cause].append(rule)
+            root_list = []
+            consequences = []
+            for elt in new:
+                if elt_cause[elt] != elt:
+                    blocked = [rule for rule in index.producers_of(elt)
+                               if rule_cause[rule] != -1]
+                    consequences.append((elt, elt_cause[elt], blocked))
+                else:
+                    root_list.append((elt, disabled[elt]))
+                    if elt not in roots:
+                        roots[elt] = (label, len(set(index.consumers_of(elt))),
+                                      len(disabled[elt]))
+            root_list.sort(key=lambda root: -len(root[1]))
+            steps.append((label, root_list, consequences))
+        missing = sorted(missing_now)
+    return steps, roots
+
+
+def write_causes(model, steps, roots, outdir):
+    """
+    This function writes the causal chains of the depletions and the ranking
+    of the root causes.
+    Files generated :
+        - depletion_causes.txt : For each timestep with new missing
+          elements, the root causes with the rules they disable, and the
+          consequences with the element starving them.
+        - depletion_roots.csv : The root causes ranked by the number of
+          downstream rules they disable.
+    """
+    elements = model.elements
+    with open(os.path.join(outdir, "depletion_causes.txt"), "w") as outfile:
+        for label, root_list, consequences in steps:
+            outfile.write("Timestep : " + label + "\n")
+            for elt, rules in root_list:
+                outfile.write(("  Root " + elements[elt] + " disables "
+                               + str(len(rules)) + " rule(s) : "
+                               + ", ".join(model.names[rule]
+                                           for rule in rules)).rstrip(" :")
+                              + "\n")
+            for elt, cause, blocked in consequences:
+                outfile.write("  " + elements[elt] + " <- " + elements[cause]
+                              + " (producers blocked : " + ", ".join(
+                                  model.names[rule] for rule in blocked)
+                              + ")\n")
+    with open(os.path.join(outdir, "depletion_roots.csv"), "w") as outfile:
+        outfile.write("Element,First_missing,Consumers,Disabled_rules\n")
+        for elt in sorted(roots, key=lambda elt: -roots[elt][2]):
+            label, nb_consumers, nb_disabled = roots[elt]
+            outfile.write(elements[elt] + "," + label + ","
+                          + str(nb_consumers) + "," + str(nb_disabled) + "\n")
+
+
+def main():
+    """
+    Main function of the program. Traces the depletions of a simulation.
+    """
+    args = args_parse()
+    model = model2.load_model2(args.m2)
+    steps, roots = trace_depletions(model, args.poe)
+    os.makedirs(args.outdir, exist_ok=True)
+    write_causes(model, steps, roots, args.outdir)
+
+if __name__ == "__main__":
+    main()
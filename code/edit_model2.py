@@ -5,6 +5,16 @@ reactives and products. It also generates the files destined to a
 cytoscape visualization.
 """
 import argparse
+import os
+import cytoscape_export
+import incremental_edit
+import trajectory_store
+import model2
+import parse_cache
+import run_metrics
+import weight_policies
+
+NONE_WEIGHT = weight_policies.NONE_WEIGHT
 
 
 def args_parse():
@@ -12,8 +22,11 @@ def args_parse():
     Parses the given arguments when function is called.
         - Original Model2 file
         - Original Poe file
+        - Incremental, export, cache and metrics options
     Returns :
-        - The two mandatory arguments as variables modelfile and poefile
+        - The two mandatory arguments as variables modelfile and poefile, the
+          incremental option, the Cytoscape formats to write, the gzip option,
+          the parse cache (None if it is not used) and the Metrics of the run
     """
     parser = argparse.ArgumentParser()
     # Argument for Original Model2 file
@@ -22,253 +35,222 @@ def args_parse():
     # Argument for Original Poe file
     parser.add_argument("poe", metavar="POE", default=21,
                         help="Enter a valid Poe file")
+    # Option to only recompute the rules changed since the previous edit
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only recompute what changed since the previous \
+                        edit in ./results")
+    # Options of the Cytoscape files
+    parser.add_argument("--xgmml", action="store_true",
+                        help="Also write the network with its annotations as \
+                        an XGMML file")
+    parser.add_argument("--gzip", action="store_true",
+                        help="Compress the Cytoscape files with gzip")
+    parse_cache.add_arguments(parser)
+    run_metrics.add_arguments(parser)
 
     args = parser.parse_args()
     modelfile = args.m2
     poefile = args.poe
-    return modelfile, poefile
+    formats = ['sif', 'node', 'edge']
+    if args.xgmml:
+        formats.append('xgmml')
+    return modelfile, poefile, args.incremental, formats, args.gzip, \
+        parse_cache.from_args(args), run_metrics.from_args(args, "edit_model2")
 
 
-def list_all_rules(modelfile):
+def list_all_rules(modelfile, cache=None):
     """
-    This function takes the given model2 file and creates a dictionary
-    containing all the model rules. The keys are the rule numbers and the
-    values are lists containing the associated rules and their weights.
-    It also creates the cytoscape file containing every interaction, protein
-    to protein in all the rules, destined to generate a network.
+    This function takes the given model2 file and compiles it into a Model2
+    object containing all the model rules, their weights and the --INITIAL
+    section. It is parsed only once for the whole program, or taken from the
+    parse cache. The interactions of the rules, protein to protein, are
+    written to the Cytoscape files by cytoscape_export.py at the end.
     Returns :
-        - dict_rules : The rule dictionary
-        - network_inters : A dictionnary linked to the cytoscape network, that
-          will be used later to create the edge annotation file
-    File generated :
-        - cytoscape_network.sif : A network file for Cytoscape.
+        - model : The compiled model
     """
-    dict_rules = {}
-    index = 0
-    cytosfile = open("./results/cytoscape_network.sif", "w")
-    network_inters = {}
-    with open(modelfile, 'r') as model2:
-        current_line = model2.readline()
-        while current_line != '':
-            # Parsing the model2 file to create the dictionary
-            if current_line.rstrip() == "--INITIAL":
-                break
-            if current_line[0] != '%' and current_line != '\n':
-                num_rule = 'R' + str(index)
-                dict_rules[num_rule] = current_line.rstrip().split("\t")
-                network_inters[num_rule] = []
-                index += 1
-                #Creating cytoscape network
-                for reac in current_line.rstrip().split("\t")[0]. \
-                            split(sep='=>')[0].split(sep=' + '):
-                    for prod in current_line.rstrip().split("\t")[0]. \
-                            split(sep='=>')[1].split(sep=' + '):
-                        to_network = reac.strip() + " pp " + prod.strip() + "\n"
-                        to_edge_att = reac.strip() + " (pp) " + prod.strip()
-                        network_inters[num_rule].append([to_edge_att,
-                                                         current_line.rstrip() \
-                                                         .split("\t")[1], 0.0])
-                        cytosfile.write(to_network)
-            current_line = model2.readline()
-    return dict_rules, network_inters
+    return model2.load_model2(modelfile, cache)
 
 
 def list_all_elts(poefile):
     """
     This functions creates a list that contains all unique elements in the
-    model2 file. The poe file is used to ease the computation.
+    model2 file. The poe file is used to ease the computation, and only its
+    header (or the header index of its binary store) is read.
     Returns :
         - all_elts_list : A list that contains every element in the model.
     """
-    with open(poefile, 'r') as poe:
-        all_elts_list = poe.readline().strip().split(sep='\t')
+    all_elts_list = trajectory_store.read_names(poefile)
     return all_elts_list
 
-def make_list_reac_prod(dict_rules):
-    """
-    This function returns two lists, one containing every reactive in the model
-    and one containing every product. Both will be used later to estimate
-    better weights more easily
-    Returns :
-        - reac_list : A list of all the reactives in the model
-        - prod_list : A list of all the products in the model
-    """
-    tmp_reac_list = []
-    tmp_prod_list = []
-    reac_list = []
-    prod_list = []
-    # Every rule in the rule dictionary is split between reactive and product
-    for rule in dict_rules:
-        tmp_reac_list.append(dict_rules[rule][0].split(sep='=>')[0] \
-                            .split(sep=' + '))
-        tmp_prod_list.append(dict_rules[rule][0].split(sep='=>')[1] \
-                            .split(sep=' + '))
-    # The program parses both sublists and splits reactives and products
-    for lists_reac in tmp_reac_list:
-        for reac in lists_reac:
-            reac_list.append(reac.strip())
-    for lists_prod in tmp_prod_list:
-        for prod in lists_prod:
-            prod_list.append(prod.strip())
-    return reac_list, prod_list
-
-
-def sugg_element(all_elts_list, reac_list, prod_list):
+def sugg_element(all_elts_list, model):
     """
-    This function creates the node annotation file for the cytoscape network
-    visualization. It contains :
+    This function computes the node annotations of the cytoscape network
+    visualization. Nreac and Nprod are counted for all the elements in one
+    pass over the incidence matrices of the model. It contains :
         - Element : The name of the element
         - Nreac : The number of times the element is a reactive in a rule
         - Nprod : The number of times the element is a product in a rule
-        - Ratio : The ratio Nreac/Nprod
-    It creates the file on the fly.
+        - Ratio : The ratio Nreac/Nprod (0 if the element is never a reactive
+          or never a product)
     Returns :
-        dict_sugg_elt : The dictionary corresponding to the generated file for 
-        further use.
-    File generated :
-        annot_node.csv : A node annotation file for the Cytoscape network.
+        dict_sugg_elt : The dictionary corresponding to the node annotation
+        file, written by cytoscape_export.py.
     """
     dict_sugg_elt = {'Element' : [],
                      'Nreac' : [],
                      'Nprod' : [],
                      'Ratio' : []
                     }
-    # The annotation file is generated at the same time as the dictionary
-    with open('./results/annot_node.csv', 'w') as outfile:
-        outfile.write('Element,Nreac,Nprod,Ratio\n')
-        for elt in all_elts_list[2:]:
-            nb_reac = reac_list.count(elt)
-            nb_prod = prod_list.count(elt)
-            # Verifying the possibility to calculate the ratio. Otherwise value
-            # is put to 0
-            if nb_prod != 0 and nb_reac != 0:
-                ratio = nb_reac/nb_prod
-                strout = elt + ',' + str(nb_reac) + ',' \
-                + str(nb_prod) + ',' + '{0:.3f}'.format(ratio)
-                outfile.write(strout)
-            elif nb_prod == 0 or nb_reac == 0:
-                ratio = 0
-                strout = elt + ',' + str(nb_reac) + ',' \
-                + str(nb_prod) + ',' + '0'
-                outfile.write(strout)
-            # Checking if there are unused elements in the model
-            elif nb_prod == 0 and nb_reac == 0:
-                ratio = 0
-                strout = elt + ' is never used in the simulation and \
-                                can be removed'
-                outfile.write(strout)
-            dict_sugg_elt['Element'].append(elt)
-            dict_sugg_elt['Nreac'].append(nb_reac)
-            dict_sugg_elt['Nprod'].append(nb_prod)
-            dict_sugg_elt['Ratio'].append(float('{0:.3f}'.format(ratio)))
-            outfile.write('\n')
+    count_reac, count_prod = model.counts()
+    for elt in all_elts_list[2:]:
+        index = model.element_index.get(elt)
+        nb_reac = count_reac[index] if index is not None else 0
+        nb_prod = count_prod[index] if index is not None else 0
+        dict_sugg_elt['Element'].append(elt)
+        dict_sugg_elt['Nreac'].append(nb_reac)
+        dict_sugg_elt['Nprod'].append(nb_prod)
+        dict_sugg_elt['Ratio'].append(
+            cytoscape_export.node_line(elt, nb_reac, nb_prod)[1])
     return dict_sugg_elt
 
 
-def rules_to_weigh(dict_rules, dict_sugg_elt):
+def rules_to_weigh(model, dict_sugg_elt):
     """
     This function computes the mean ratios for reactives and products
     separately for each rule. Every ratio calculated for an element is
     summed with the others in a given rule and the average is taken.
+    The ratios are first indexed by element id, then averaged over the rows
+    of the reactive and product matrices.
     Returns :
         dict_to_weigh : The dictionnary containing mean ratios for every rule.
     """
+    ratio_of = {}
+    for elt, ratio in zip(dict_sugg_elt['Element'], dict_sugg_elt['Ratio']):
+        ratio_of.setdefault(elt, ratio)
+    ratios = []
+    for elt in model.elements:
+        if elt not in ratio_of:
+            raise ValueError(elt + " is not an element of the simulation")
+        ratios.append(ratio_of[elt])
+    mean_reac_ratios = model2.segment_means(model.reac_indptr,
+                                            model.reac_indices, ratios)
+    mean_prod_ratios = model2.segment_means(model.prod_indptr,
+                                            model.prod_indices, ratios)
     dict_to_weigh = {}
-    for rule in dict_rules:
-        dict_to_weigh[rule] = [0, 0]
-        reactives = dict_rules[rule][0].split(sep='=>')[0].split(sep=' + ')
-        products = dict_rules[rule][0].split(sep='=>')[1].split(sep=' + ')
-        mean_reac_ratio = 0
-        mean_prod_ratio = 0
-        for reac in reactives:
-            mean_reac_ratio += dict_sugg_elt['Ratio'][dict_sugg_elt['Element']\
-                                .index(reac.strip())]
-        for prod in products:
-            mean_prod_ratio += dict_sugg_elt['Ratio'][dict_sugg_elt['Element']\
-                                .index(prod.strip())]
-        dict_to_weigh[rule][0] = float(mean_reac_ratio/len(reactives))
-        dict_to_weigh[rule][1] = float(mean_prod_ratio/len(products))
+    for index, rule in enumerate(model.names):
+        dict_to_weigh[rule] = [mean_reac_ratios[index],
+                               mean_prod_ratios[index]]
     return dict_to_weigh
 
 
-def change_weight(dict_rules, dict_to_weigh, modelfile,
-                  network_inters):
+def element_ratios(model):
+    """
+    This function computes the Nreac/Nprod ratio of every element of the
+    model, like in annot_node.csv, without writing the file.
+    Returns :
+        - dict_sugg_elt : The elements and their ratios, as in sugg_element
+    """
+    count_reac = model.count_reactives()
+    count_prod = model.count_products()
+    ratios = []
+    for nb_reac, nb_prod in zip(count_reac, count_prod):
+        ratio = nb_reac/nb_prod if nb_reac != 0 and nb_prod != 0 else 0
+        ratios.append(float('{0:.3f}'.format(ratio)))
+    return {'Element': model.elements, 'Ratio': ratios}
+
+
+def update_weights(model, weights, dict_to_weigh,
+                   policy=weight_policies.DEFAULT_POLICY):
     """
-    This function creates a new model2 file containing the updated ratios for
-    every rule in the original model2 file. New ratios are calculated
-    arbitrarily given several conditions (*4, *2, /4, /2) and can be modified
-    It also computes edge and node annotation files for the cytoscape network
-    representation.
-    Files generated :
+    This function applies a weight policy (the rules of change_weight by
+    default) to a weight vector, without generating any file.
+    Returns :
+        - new_weights : The list of the new weights
+    """
+    pairs, pair_index = weight_policies.ratio_pairs(model, dict_to_weigh)
+    return weight_policies.policy_weights(model, weights, pairs, pair_index,
+                                          policy, NONE_WEIGHT)[0]
+
+
+def new_weights(model, dict_to_weigh, policy=weight_policies.DEFAULT_POLICY):
+    """
+    This function computes the updated weight of every rule in the original
+    model2 file. New weights are calculated arbitrarily given several
+    conditions (*4, *2, /4, /2) and can be modified with another policy of
+    weight_policies.py.
+    Returns :
+        - changed : The changed weight of every rule, as written in the edge
+          annotation file (the weight of the model2 file if it is unchanged)
+        - weights : The weight of every rule in the updated model2 file
+    """
+    # The weights are kept as written in the file until they are changed, as
+    # they appear in the edge annotation file. The rules that do not change
+    # the state of the model, like the last rule NONE => NONE, are not
+    # weighed and are reset to 0.001 in the updated file.
+    pairs, pair_index = weight_policies.ratio_pairs(model, dict_to_weigh)
+    weights = weight_policies.policy_weights(model, model.weight_text, pairs,
+                                             pair_index, policy,
+                                             NONE_WEIGHT)[0]
+    changed = [model.weight_text[rule] if model.is_trivial(rule)
+               else weights[rule] for rule in range(len(model.names))]
+    return changed, weights
+
+
+def change_weight(model, dict_to_weigh, policy=weight_policies.DEFAULT_POLICY,
+                  outfile="./results/updated_modelfile.model2"):
+    """
+    This function creates a new model2 file containing the updated weights
+    (see new_weights) for every rule in the original model2 file.
+    Returns :
+        - changed : The changed weight of every rule, as written in the edge
+          annotation file (the weight of the model2 file if it is unchanged)
+    File generated :
         - updated_modelfile.model2 : An updated model2 file with new weights.
-        - annot_edge.csv : An edge annotation file for the Cytoscape network.
     """
-    # For each rule, a new weight value is added given the values of reactive
-    # and product mean ratios for each rule.
-    for rule in dict_to_weigh:
-        if dict_to_weigh[rule][0] > 1 and dict_to_weigh[rule][1] <= 1:
-            dict_rules[rule][1] = float(dict_rules[rule][1])*4
-        elif dict_to_weigh[rule][0] <= 1 and dict_to_weigh[rule][1] > 1:
-            dict_rules[rule][1] = float(dict_rules[rule][1])/4
-        elif dict_to_weigh[rule][0] < 1 and dict_to_weigh[rule][1] < 1 \
-            and dict_to_weigh[rule][0] > dict_to_weigh[rule][1]:
-            dict_rules[rule][1] = float(dict_rules[rule][1])*2
-        elif dict_to_weigh[rule][0] < 1 and dict_to_weigh[rule][1] < 1 \
-            and dict_to_weigh[rule][0] < dict_to_weigh[rule][1]:
-            dict_rules[rule][1] = float(dict_rules[rule][1])/2
-        elif dict_to_weigh[rule][0] > 1 and dict_to_weigh[rule][1] > 1 \
-            and dict_to_weigh[rule][0] > dict_to_weigh[rule][1]:
-            dict_rules[rule][1] = float(dict_rules[rule][1])/2
-        elif dict_to_weigh[rule][0] > 1 and dict_to_weigh[rule][1] > 1 \
-            and dict_to_weigh[rule][0] < dict_to_weigh[rule][1]:
-            dict_rules[rule][1] = float(dict_rules[rule][1])*2
-        # Values are updated in the future edge annotation file
-        for interaction in network_inters[rule]:
-            interaction[2] = dict_rules[rule][1]
-    # The last rule of the model NONE => NONE is reset to 0.001
-    dict_rules['R95'][1] = '0.001'
-    # The model2 file is generated with new weigths and base on the original
-    with open("./results/updated_modelfile.model2", 'w') as outfile:
-        for rule in dict_rules:
-            strout = dict_rules[rule][0] + '\t' \
-                     + str(float(dict_rules[rule][1]))
-            outfile.write(strout)
-            outfile.write('\n')
-        modelfile_old = open(modelfile, 'r')
-        current_line = modelfile_old.readline().strip()
-        cond = 0
-        while current_line != '':
-            if current_line == '--INITIAL':
-                cond = 1
-            if cond == 1:
-                outfile.write(current_line)
-                outfile.write('\n')
-            current_line = modelfile_old.readline().strip()
-        modelfile_old.close()
-    # The edge annotation file is generated based on the informations collected
-    # throughout the program.
-    with open('./results/annot_edge.csv', 'w') as edgefile:
-        edgefile.write('\t'.join(["Edge", "Score_init", "Score_changed"]) \
-                        + "\n")
-        for rule in network_inters:
-            for interaction in network_inters[rule]:
-                edgefile.write('\t'.join(map(str, interaction)) + "\n")
+    changed, weights = new_weights(model, dict_to_weigh, policy)
+    # The model2 file is generated with new weigths and the --INITIAL section
+    # parsed from the original
+    model.write_model2(outfile, weights)
+    return changed
 
 
 def main():
     """
-    Main function of the program. Executes all the other defined functions.
+    Main function of the program. Executes all the other defined functions,
+    measuring each of them if it is asked for.
     """
-    modelfile, poefile = args_parse()
-    dict_rules, network_inters = list_all_rules(modelfile)
-    all_elts_list = list_all_elts(poefile)
-    reac_list, prod_list = make_list_reac_prod(dict_rules)
+    modelfile, poefile, incremental, formats, compress, cache, metrics = \
+        args_parse()
+    if incremental:
+        with metrics.stage("incremental_edit") as stage:
+            model, stage.rules = incremental_edit.incremental_edit(
+                modelfile, poefile, "./results", cache,
+                formats=formats, compress=compress)
+        metrics.write()
+        return
+    with metrics.stage("list_all_rules") as stage:
+        model = list_all_rules(modelfile, cache)
+        stage.rules = len(model.names)
+    with metrics.stage("list_all_elts"):
+        all_elts_list = list_all_elts(poefile)
 
-    dict_sugg_elt = sugg_element(all_elts_list, reac_list, prod_list)
-    dict_to_weigh = rules_to_weigh(dict_rules, dict_sugg_elt)
+    with metrics.stage("sugg_element"):
+        dict_sugg_elt = sugg_element(all_elts_list, model)
+    with metrics.stage("rules_to_weigh") as stage:
+        dict_to_weigh = rules_to_weigh(model, dict_sugg_elt)
+        stage.rules = len(model.names)
 
-    change_weight(dict_rules, dict_to_weigh, modelfile,
-                  network_inters)
+    with metrics.stage("change_weight") as stage:
+        changed = change_weight(model, dict_to_weigh)
+        stage.rules = len(model.names)
+    # The Cytoscape files are written in one pass over the rules
+    with metrics.stage("export_network") as stage:
+        cytoscape_export.export_network(model, changed,
+                                        dict_sugg_elt['Element'], "./results",
+                                        formats, compress,
+                                        title=os.path.basename(modelfile))
+        stage.rules = len(model.names)
+    metrics.write()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,256 @@
+"""
+This module follows a BESS5 simulation while it is still running. The .poe
+and .por files are watched like with 'tail -f' : only the newly appended
+lines are parsed, and the possible rules, the missing elements and the number
+of times each rule has been used are updated from the elements that changed
+since the previous timestep. The first timestep where no rule other than the
+trivial ones (like NONE => NONE) is possible is reported as the moment the
+simulation dies, so that the run can be stopped early.
+"""
+import argparse
+import array
+import os
+import sys
+import time
+import model2
+
+DEATH_EXIT_CODE = 3
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Model2 file
+        - Poe file
+        - Por file
+        - Polling interval, inactivity timeout and exit option
+        - Output directory
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    # Argument for Model2 file
+    parser.add_argument("m2", metavar="MODEL2",
+                        help="Enter a valid model 2 file")
+    # Argument for the Poe file being written
+    parser.add_argument("poe", metavar="POE",
+                        help="Enter the Poe file of the running simulation")
+    # Argument for the Por file being written
+    parser.add_argument("por", metavar="POR",
+                        help="Enter the Por file of the running simulation")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Seconds between two checks of the files")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="Seconds without new lines before stopping")
+    parser.add_argument("--exit-on-death", action="store_true",
+                        help="Stop as soon as the simulation dies, with exit \
+                        code 3")
+    parser.add_argument("-o", "--outdir", default="./results",
+                        help="Directory of the generated file")
+    return parser.parse_args()
+
+
+class FileFollower:
+    """
+    Reads the lines appended to a file since the previous call. A line is
+    only returned once it is complete.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = ''
+
+    def read_new_lines(self):
+        """
+        Returns the list of the complete lines appended since the last call,
+        without their end of line.
+        """
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r') as followed:
+            followed.seek(self.offset)
+            data = followed.read()
+            self.offset = followed.tell()
+        if not data:
+            return []
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        return [line.rstrip() for line in lines if line.strip() != '']
+
+
+class SimulationFollower:
+    """
+    The incremental state of a followed simulation. For every rule, the
+    number of its reactives currently missing is kept, so that a change of
+    an element only updates the rules that consume it.
+    Attributes :
+        - missing : The set of the ids of the missing elements
+        - nb_possible : The number of possible non trivial rules
+        - nb_fired : The number of times every rule has been used
+        - death : The timestep where the simulation died, None if alive
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.consumers = model.consumers()
+        self.trivial = [model.is_trivial(rule)
+                        for rule in range(len(model.names))]
+        self.missing_count = array.array('l', [0])*len(model.names)
+        self.nb_possible = self.trivial.count(False)
+        self.nb_fired = array.array('l', [0])*len(model.names)
+        self.missing = set()
+        self.columns = None
+        self.rule_columns = None
+        self.death = None
+
+    def _block(self, elt, step):
+        """
+        Updates the missing reactive counts of the consumers of an element.
+        """
+        for pos in range(self.consumers[0][elt], self.consumers[0][elt + 1]):
+            rule = self.consumers[1][pos]
+            before = self.missing_count[rule]
+            self.missing_count[rule] += step
+            if not self.trivial[rule]:
+                if before == 0 and step > 0:
+                    self.nb_possible -= 1
+                elif before == 1 and step < 0:
+                    self.nb_possible += 1
+
+    def set_poe_header(self, names):
+        """
+        Reads the header of the Poe file. The elements of the model that are
+        not simulated are considered as missing from the beginning.
+        """
+        column_of = {elt: index for index, elt in enumerate(names)}
+        self.columns = [(column_of[elt], elt_id) for elt_id, elt
+                        in enumerate(self.model.elements)
+                        if elt in column_of]
+        for elt_id, elt in enumerate(self.model.elements):
+            if elt not in column_of:
+                self.missing.add(elt_id)
+                self._block(elt_id, 1)
+
+    def set_por_header(self, names):
+        """
+        Reads the header of the Por file.
+        """
+        rule_of = {name: rule for rule, name in enumerate(self.model.names)}
+        self.rule_columns = [(index, rule_of[name]) for index, name
+                             in enumerate(names) if name in rule_of]
+
+    def add_poe_row(self, fields):
+        """
+        Updates the state with a new timestep of the Poe file.
+        Returns :
+            - lost : The ids of the elements that disappeared
+            - restored : The ids of the elements that came back
+        """
+        lost = []
+        restored = []
+        for column, elt in self.columns:
+            is_missing = float(fields[column]) == 0
+            if is_missing and elt not in self.missing:
+                lost.append(elt)
+            elif not is_missing and elt in self.missing:
+                restored.append(elt)
+        for elt in lost:
+            self.missing.add(elt)
+            self._block(elt, 1)
+        for elt in restored:
+            self.missing.discard(elt)
+            self._block(elt, -1)
+        if self.nb_possible == 0 and self.death is None:
+            self.death = fields[0]
+        return lost, restored
+
+    def add_por_row(self, fields):
+        """
+        Updates the number of times every rule has been used with a new
+        timestep of the Por file.
+        Returns :
+            - The number of events of the timestep
+        """
+        nb_events = int(float(fields[1]))
+        for column, rule in self.rule_columns:
+            percentage = float(fields[column])
+            if percentage != 0:
+                self.nb_fired[rule] += int(round(percentage*nb_events)/100)
+        return nb_events
+
+
+def write_fired_rules(model, follower, outdir="./results"):
+    """
+    Writes the number of times every rule has been used during the followed
+    part of the simulation, in outdir (created if needed).
+    File generated :
+        - rules_fired.csv : The rules and their number of uses.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    with open(os.path.join(outdir, "rules_fired.csv"), "w") as fired_file:
+        fired_file.write("Rule,Nb_fired\n")
+        for name, nb_fired in zip(model.names, follower.nb_fired):
+            fired_file.write(name + "," + str(nb_fired) + "\n")
+
+
+def follow(model, poefile, porfile, interval, timeout, exit_on_death):
+    """
+    This function watches the Poe and Por files and prints the evolution of
+    the simulation for every new timestep, until no line has been appended
+    for the timeout or, if asked, until the simulation dies.
+    Returns :
+        - follower : The final state of the simulation
+    """
+    follower = SimulationFollower(model)
+    poe = FileFollower(poefile)
+    por = FileFollower(porfile)
+    last_change = time.monotonic()
+    while time.monotonic() - last_change < timeout:
+        poe_lines = poe.read_new_lines()
+        por_lines = por.read_new_lines()
+        if poe_lines or por_lines:
+            last_change = time.monotonic()
+        for line in por_lines:
+            fields = line.split('\t')
+            if follower.rule_columns is None:
+                follower.set_por_header(fields)
+            else:
+                follower.add_por_row(fields)
+        for line in poe_lines:
+            fields = line.split('\t')
+            if follower.columns is None:
+                follower.set_poe_header(fields)
+                continue
+            lost, restored = follower.add_poe_row(fields)
+            print("Timestep : " + fields[0] + ", possible rules : "
+                  + str(follower.nb_possible) + ", missing elements : "
+                  + str(len(follower.missing)) + " (+" + str(len(lost))
+                  + "/-" + str(len(restored)) + ")")
+            if follower.death == fields[0]:
+                print("The simulation dies at " + fields[0]
+                      + ", no rule can be applied anymore. Missing : "
+                      + ", ".join(sorted(model.elements[elt]
+                                         for elt in follower.missing)))
+                if exit_on_death:
+                    return follower
+        sys.stdout.flush()
+        time.sleep(interval)
+    return follower
+
+
+def main():
+    """
+    Main function of the program. Follows the simulation and writes the
+    number of uses of every rule when it stops.
+    """
+    args = args_parse()
+    model = model2.load_model2(args.m2)
+    follower = follow(model, args.poe, args.por, args.interval, args.timeout,
+                      args.exit_on_death)
+    write_fired_rules(model, follower, args.outdir)
+    if follower.death is not None and args.exit_on_death:
+        sys.exit(DEATH_EXIT_CODE)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+This module is the incremental mode of edit_model2.py. The outputs of an edit
+(cytoscape_network.sif, annot_node.csv, annot_edge.csv and
+updated_modelfile.model2) are kept per rule and per element in a state file
+next to them, with a hash of every rule. When the model2 file is edited
+again, it is compared to the previous one rule by rule : only the counts of
+the elements of the added and removed rules are updated, only the rules
+touching those elements get new ratios and weights, and the output files are
+rebuilt from the kept parts and the recomputed ones.
+The files are the same as those of a full edit, in the same formats. The
+state is only used by an edit with the same Poe header and weight policy.
+"""
+import collections
+import cytoscape_export
+import hashlib
+import os
+import pickle
+import model2
+import trajectory_store
+import weight_policies
+
+STATE_FILE = "edit_state.pkl"
+STATE_VERSION = 3
+
+
+def rule_hash(model, rule):
+    """
+    Returns the hash of a rule, from its reaction and its weight.
+    """
+    return hashlib.blake2b((model.reactions[rule] + '\t'
+                            + model.weight_text[rule]).encode('utf-8'),
+                           digest_size=16).digest()
+
+
+def rule_outputs(model, rule, ratio_of, policy):
+    """
+    This function computes the new weight of a rule and its parts of the
+    output files, like change_weight.
+    Returns :
+        - sif : The lines of the rule in cytoscape_network.sif
+        - edges : The lines of the rule in annot_edge.csv
+        - model_line : The line of the rule in updated_modelfile.model2
+        - changed : The changed weight of the rule, as in annot_edge.csv
+    """
+    reactives = model.reactive_names(rule)
+    products = model.product_names(rule)
+    mean_reac = sum(ratio_of[elt] for elt in reactives)/len(reactives) \
+        if reactives else 0.0
+    mean_prod = sum(ratio_of[elt] for elt in products)/len(products) \
+        if products else 0.0
+    weight = model.weight_text[rule]
+    if not model.is_trivial(rule):
+        factor = policy.factor(mean_reac, mean_prod)
+        if factor != 1:
+            weight = float(weight)*factor
+    sif = cytoscape_export.sif_lines(model, rule)
+    edges = cytoscape_export.edge_lines(model, rule, weight)
+    changed = weight
+    if model.is_trivial(rule):
+        weight = weight_policies.NONE_WEIGHT
+    model_line = model.reactions[rule] + '\t' + str(float(weight)) + '\n'
+    return sif, edges, model_line, changed
+
+
+def load_state(statefile, poe_names, policy):
+    """
+    Reads the state of the previous edit, None if there is none or if it was
+    made with another Poe header or weight policy.
+    """
+    try:
+        with open(statefile, 'rb') as infile:
+            state = pickle.load(infile)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if state.get('version') != STATE_VERSION \
+       or state['poe_names'] != poe_names \
+       or state['policy'] != policy.description():
+        return None
+    return state
+
+
+def diff_rules(model, state):
+    """
+    This function matches the rules of the model with those of the previous
+    edit by their hashes.
+    Returns :
+        - hashes : The hash of every rule of the model
+        - kept : For every rule, the position of the same rule in the
+          previous edit, None if it is new
+        - removed : The positions of the previous rules that are gone
+    """
+    hashes = [rule_hash(model, rule) for rule in range(len(model.names))]
+    previous = collections.defaultdict(list)
+    if state is not None:
+        for position in range(len(state['hashes']) - 1, -1, -1):
+            previous[state['hashes'][position]].append(position)
+    kept = []
+    for digest in hashes:
+        kept.append(previous[digest].pop() if previous[digest] else None)
+    removed = sorted(position for positions in previous.values()
+                     for position in positions)
+    return hashes, kept, removed
+
+
+def incremental_edit(modelfile, poefile, outdir="./results", cache=None,
+                     policy=weight_policies.DEFAULT_POLICY,
+                     formats=('sif', 'node', 'edge'), compress=False):
+    """
+    This function edits a model2 file, reusing what did not change since the
+    previous edit in the same output directory. Without a usable previous
+    state, everything is computed.
+    Returns :
+        - model : The compiled model
+        - nb_recomputed : The number of rules whose outputs were recomputed
+    Files generated :
+        - updated_modelfile.model2 and the Cytoscape files asked for in
+          formats, compressed with compress : The files of edit_model2.py.
+        - edit_state.pkl : The state used by the next edit.
+    """
+    model = model2.load_model2(modelfile, cache)
+    poe_names = trajectory_store.read_names(poefile)
+    statefile = os.path.join(outdir, STATE_FILE)
+    state = load_state(statefile, poe_names, policy)
+    hashes, kept, removed = diff_rules(model, state)
+    if state is None:
+        counts = collections.defaultdict(lambda: [0, 0])
+        ratio_of = {}
+        node_lines = [None]*(len(poe_names) - 2)
+        touched = set(elt for elt in poe_names[2:])
+    else:
+        counts = collections.defaultdict(lambda: [0, 0], state['counts'])
+        ratio_of = state['ratio_of']
+        node_lines = state['node_lines']
+        touched = set()
+    # The counts of the elements follow the removed and added rules. Only
+    # the elements whose counts really change are touched (a rule whose
+    # weight changed is removed and added again).
+    before = {}
+    for position in removed:
+        reactives, products = state['elements'][position]
+        for elt in reactives + products:
+            before.setdefault(elt, tuple(counts[elt]))
+        for elt in reactives:
+            counts[elt][0] -= 1
+        for elt in products:
+            counts[elt][1] -= 1
+    for rule, position in enumerate(kept):
+        if position is None:
+            for elt in model.reactive_names(rule):
+                before.setdefault(elt, tuple(counts[elt]))
+                counts[elt][0] += 1
+            for elt in model.product_names(rule):
+                before.setdefault(elt, tuple(counts[elt]))
+                counts[elt][1] += 1
+    touched.update(elt for elt in before if tuple(counts[elt]) != before[elt])
+    # The node annotation lines and ratios of the touched elements
+    seen = set()
+    for column, elt in enumerate(poe_names[2:]):
+        if elt in touched:
+            nb_reac, nb_prod = counts[elt] if elt in counts else (0, 0)
+            node_lines[column], ratio = cytoscape_export.node_line(
+                elt, nb_reac, nb_prod)
+            if elt not in seen:
+                ratio_of[elt] = ratio
+                seen.add(elt)
+    for elt in model.elements:
+        if elt not in ratio_of:
+            raise ValueError(elt + " is not an element of the simulation")
+    # The rules touching those elements get new weights
+    consumer_ptr, consumer_rules = model.consumers()
+    producer_ptr, producer_rules = model.producers()
+    recompute = set(rule for rule, position in enumerate(kept)
+                    if position is None)
+    for elt in touched:
+        index = model.element_index.get(elt)
+        if index is not None:
+            recompute.update(consumer_rules[consumer_ptr[index]:
+                                            consumer_ptr[index + 1]])
+            recompute.update(producer_rules[producer_ptr[index]:
+                                            producer_ptr[index + 1]])
+    outputs = []
+    for rule, position in enumerate(kept):
+        if rule in recompute:
+            outputs.append(rule_outputs(model, rule, ratio_of, policy))
+        else:
+            outputs.append(state['outputs'][position])
+    writers = {}
+    for kind in formats:
+        writers[kind] = cytoscape_export.ChunkedWriter(
+            os.path.join(outdir, cytoscape_export.FILE_NAMES[kind]), compress)
+    try:
+        if 'sif' in writers:
+            for output in outputs:
+                writers['sif'].write(output[0])
+        if 'node' in writers:
+            writers['node'].write('Element,Nreac,Nprod,Ratio\n')
+            for line in node_lines:
+                writers['node'].write(line)
+        if 'edge' in writers:
+            writers['edge'].write('\t'.join(["Edge", "Score_init",
+                                             "Score_changed"]) + "\n")
+            for output in outputs:
+                writers['edge'].write(output[1])
+        if 'xgmml' in writers:
+            xgmml = writers['xgmml']
+            xgmml.write(cytoscape_export.xgmml_nodes(
+                model, os.path.basename(modelfile)))
+            edge_id = len(model.elements)
+            for rule, output in enumerate(outputs):
+                xgmml.write(cytoscape_export.xgmml_edges(model, rule,
+                                                         output[3], edge_id))
+                edge_id += len(model.reactives(rule)) \
+                    * len(model.products(rule))
+            xgmml.write('</graph>\n')
+    finally:
+        for writer in writers.values():
+            writer.close()
+    with open(os.path.join(outdir, "updated_modelfile.model2"), "w") \
+         as outfile:
+        outfile.write(''.join(output[2] for output in outputs))
+        outfile.write(''.join(line + '\n' for line in model.initial_lines))
+    state = {'version': STATE_VERSION,
+             'poe_names': poe_names,
+             'policy': policy.description(),
+             'hashes': hashes,
+             'elements': [(model.reactive_names(rule),
+                           model.product_names(rule))
+                          for rule in range(len(model.names))],
+             'counts': dict(counts),
+             'ratio_of': ratio_of,
+             'node_lines': node_lines,
+             'outputs': outputs}
+    with open(statefile, 'wb') as outfile:
+        pickle.dump(state, outfile, pickle.HIGHEST_PROTOCOL)
+    return model, len(recompute)
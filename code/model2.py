@@ -0,0 +1,313 @@
+"""
+This module parses a .model2 file once into a compiled structure shared by
+both analysis programs. Element names are interned to integer ids, the
+reactives and products of the rules are stored as sparse CSR incidence
+matrices (one row per rule, one column per element), the weights as a float
+array, and the --INITIAL section is kept as parsed data.
+"""
+import array
+import copy
+
+
+def split_reaction(reaction):
+    """
+    Splits a reaction of the model2 file into its reactives and products.
+    Returns :
+        - reactives : The list of the reactive names
+        - products : The list of the product names
+    """
+    sides = reaction.split(sep='=>')
+    reactives = [reac.strip() for reac in sides[0].split(sep=' + ')]
+    products = [prod.strip() for prod in sides[1].split(sep=' + ')]
+    return reactives, products
+
+
+def transpose(indptr, indices, nb_cols):
+    """
+    Transposes a CSR matrix given by its row pointers and column indexes.
+    Returns :
+        - t_indptr : The row pointers of the transposed matrix
+        - t_indices : The column indexes of the transposed matrix, in
+          increasing order in each row
+    """
+    counts = array.array('l', [0])*(nb_cols + 1)
+    for col in indices:
+        counts[col + 1] += 1
+    for col in range(nb_cols):
+        counts[col + 1] += counts[col]
+    t_indptr = array.array('l', counts)
+    t_indices = array.array('l', [0])*len(indices)
+    for row in range(len(indptr) - 1):
+        for pos in range(indptr[row], indptr[row + 1]):
+            col = indices[pos]
+            t_indices[counts[col]] = row
+            counts[col] += 1
+    return t_indptr, t_indices
+
+
+def bincount(indices, nb_cols):
+    """
+    Counts the occurrences of every column index of a CSR matrix.
+    Returns :
+        - counts : An array with the number of occurrences of every column
+    """
+    counts = array.array('l', [0])*nb_cols
+    for col in indices:
+        counts[col] += 1
+    return counts
+
+
+def segment_means(indptr, indices, values):
+    """
+    Computes, for every row of a CSR matrix, the mean of the given values
+    over its column indexes (0 for an empty row).
+    Returns :
+        - means : An array of floats with one mean per row
+    """
+    means = array.array('d')
+    for row in range(len(indptr) - 1):
+        start, end = indptr[row], indptr[row + 1]
+        if end > start:
+            means.append(sum(values[col] for col in indices[start:end])
+                         / (end - start))
+        else:
+            means.append(0.0)
+    return means
+
+
+class Model2:
+    """
+    A compiled model2 file.
+    Attributes :
+        - names : The rule names, R0 to Rn in the order of the file
+        - reactions : The reaction of every rule, as written in the file
+        - weight_text : The weight of every rule, as written in the file
+        - weights : The weights as an array of floats
+        - elements : The element names, in order of first appearance
+        - element_index : The dictionary giving the id of every element
+        - reac_indptr, reac_indices : The CSR matrix of the reactives
+        - prod_indptr, prod_indices : The CSR matrix of the products
+        - initial_lines : The --INITIAL section, as written in the file
+        - initial : The dictionary giving the initial quantity of every
+          element listed in the --INITIAL section
+    """
+
+    def __init__(self):
+        self.names = []
+        self.reactions = []
+        self.weight_text = []
+        self.weights = array.array('d')
+        self.elements = []
+        self.element_index = {}
+        self.reac_indptr = array.array('l', [0])
+        self.reac_indices = array.array('l')
+        self.prod_indptr = array.array('l', [0])
+        self.prod_indices = array.array('l')
+        self.initial_lines = []
+        self.initial = {}
+        self._consumers = None
+        self._producers = None
+        self._counts = None
+
+    def intern(self, elt):
+        """
+        Returns the id of an element, creating it if it is new.
+        """
+        index = self.element_index.get(elt)
+        if index is None:
+            index = len(self.elements)
+            self.element_index[elt] = index
+            self.elements.append(elt)
+        return index
+
+    def add_rule(self, reaction, weight):
+        """
+        Adds a rule at the end of the model.
+        """
+        reactives, products = split_reaction(reaction)
+        self.names.append('R' + str(len(self.names)))
+        self.reactions.append(reaction)
+        self.weight_text.append(weight)
+        self.weights.append(float(weight))
+        self.reac_indices.extend(self.intern(reac) for reac in reactives)
+        self.reac_indptr.append(len(self.reac_indices))
+        self.prod_indices.extend(self.intern(prod) for prod in products)
+        self.prod_indptr.append(len(self.prod_indices))
+        self._consumers = None
+        self._producers = None
+        self._counts = None
+
+    def reactives(self, rule):
+        """
+        Returns the element ids of the reactives of a rule (given by index).
+        """
+        return self.reac_indices[self.reac_indptr[rule]:
+                                 self.reac_indptr[rule + 1]]
+
+    def products(self, rule):
+        """
+        Returns the element ids of the products of a rule (given by index).
+        """
+        return self.prod_indices[self.prod_indptr[rule]:
+                                 self.prod_indptr[rule + 1]]
+
+    def reactive_names(self, rule):
+        """
+        Returns the names of the reactives of a rule (given by index).
+        """
+        return [self.elements[elt] for elt in self.reactives(rule)]
+
+    def product_names(self, rule):
+        """
+        Returns the names of the products of a rule (given by index).
+        """
+        return [self.elements[elt] for elt in self.products(rule)]
+
+    def is_trivial(self, rule):
+        """
+        Tells if a rule (given by index) leaves the state unchanged, its
+        reactives being exactly its products, like the NONE => NONE rule.
+        """
+        return sorted(self.reactives(rule)) == sorted(self.products(rule))
+
+    def consumers(self):
+        """
+        Returns the transposed reactive matrix (element -> rules) as a tuple
+        of row pointers and rule ids. It is computed once.
+        """
+        if self._consumers is None:
+            self._consumers = transpose(self.reac_indptr, self.reac_indices,
+                                        len(self.elements))
+        return self._consumers
+
+    def producers(self):
+        """
+        Returns the transposed product matrix (element -> rules) as a tuple
+        of row pointers and rule ids. It is computed once.
+        """
+        if self._producers is None:
+            self._producers = transpose(self.prod_indptr, self.prod_indices,
+                                        len(self.elements))
+        return self._producers
+
+    def counts(self):
+        """
+        Returns the number of times every element is a reactive and a product
+        in a rule (Nreac and Nprod). It is computed once.
+        """
+        if self._counts is None:
+            self._counts = (bincount(self.reac_indices, len(self.elements)),
+                            bincount(self.prod_indices, len(self.elements)))
+        return self._counts
+
+    def count_reactives(self):
+        """
+        Returns the number of times every element is a reactive in a rule.
+        """
+        return self.counts()[0]
+
+    def count_products(self):
+        """
+        Returns the number of times every element is a product in a rule.
+        """
+        return self.counts()[1]
+
+    def to_dict_rules(self):
+        """
+        Returns the rule dictionary used by the first versions of the
+        programs : the keys are the rule numbers and the values are lists
+        containing the rule and its weight.
+        """
+        return {name: [reaction, weight] for name, reaction, weight
+                in zip(self.names, self.reactions, self.weight_text)}
+
+    def with_weights(self, weights):
+        """
+        Returns a copy of the model with new weights, as it would be parsed
+        from the model2 file written with these weights. The rules and the
+        --INITIAL section are shared with the model.
+        """
+        model = copy.copy(self)
+        model.weight_text = [str(float(weight)) for weight in weights]
+        model.weights = array.array('d', (float(weight)
+                                          for weight in model.weight_text))
+        return model
+
+    def write_model2(self, outfile, weights=None):
+        """
+        Writes the model in the model2 format, with new weights if they are
+        given.
+        """
+        if weights is None:
+            weights = self.weights
+        with open(outfile, 'w') as model_out:
+            model_out.write(''.join(reaction + '\t' + str(float(weight))
+                                    + '\n' for reaction, weight
+                                    in zip(self.reactions, weights)))
+            model_out.write(''.join(line + '\n'
+                                    for line in self.initial_lines))
+
+
+def parse_initial(initial_lines):
+    """
+    Parses the --INITIAL section of a model2 file. Each line contains an
+    element name, optionally followed by its quantity (1 by default).
+    Returns :
+        - initial : The dictionary of the initial quantities
+    """
+    initial = {}
+    for line in initial_lines[1:]:
+        fields = line.split()
+        quantity = float(fields[1]) if len(fields) > 1 else 1.0
+        initial[fields[0]] = initial.get(fields[0], 0.0) + quantity
+    return initial
+
+
+def load_model2(modelfile, cache=None):
+    """
+    This function loads a model2 file, from the parse cache if one is given
+    (see parse_cache.py). The cached model comes with its transposed
+    matrices and its Nreac/Nprod counts.
+    Returns :
+        - model : The compiled Model2
+    """
+    if cache is not None:
+        return cache.fetch('model2', modelfile, compile_model2)
+    return parse_model2(modelfile)
+
+
+def compile_model2(modelfile):
+    """
+    Parses a model2 file and computes everything derived from its rules.
+    """
+    model = parse_model2(modelfile)
+    model.consumers()
+    model.producers()
+    model.counts()
+    return model
+
+
+def parse_model2(modelfile):
+    """
+    This function parses a model2 file. Lines starting with '%' and empty
+    lines are ignored in the rule section. The --INITIAL section is kept as
+    the original programs copied it, up to its first empty line.
+    Returns :
+        - model : The compiled Model2
+    """
+    model = Model2()
+    with open(modelfile, 'r') as model2:
+        current_line = model2.readline()
+        while current_line != '':
+            if current_line.rstrip() == "--INITIAL":
+                break
+            if current_line[0] != '%' and current_line != '\n':
+                fields = current_line.rstrip().split("\t")
+                model.add_rule(fields[0], fields[1])
+            current_line = model2.readline()
+        current_line = current_line.strip()
+        while current_line != '':
+            model.initial_lines.append(current_line)
+            current_line = model2.readline().strip()
+    model.initial = parse_initial(model.initial_lines)
+    return model
@@ -0,0 +1,107 @@
+"""
+This module writes and reads .npz archives (zipped .npy arrays, as made by
+numpy.savez) with the standard library only, so that the results of the
+analysis can be loaded directly with numpy.load without NumPy being needed
+here. Numbers are stored from array.array objects and strings as fixed width
+unicode arrays.
+"""
+import array
+import ast
+import sys
+import zipfile
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+DESCR = {'q': '<i8', 'd': '<f8', 'f': '<f4', 'l': '<i8', 'i': '<i4',
+         'B': '|u1'}
+TYPECODE = {'<i8': 'q', '<f8': 'd', '<f4': 'f', '<i4': 'i', '|u1': 'B'}
+
+
+def npy_header(descr, shape):
+    """
+    Builds the header of a .npy file, padded so that the data is aligned on
+    64 bytes.
+    """
+    header = "{'descr': '" + descr + "', 'fortran_order': False, 'shape': " \
+             + str(tuple(shape)) + ", }"
+    padding = -(len(NPY_MAGIC) + 2 + len(header) + 1) % 64
+    header = (header + ' '*padding + '\n').encode('latin1')
+    return NPY_MAGIC + len(header).to_bytes(2, 'little') + header
+
+
+def npy_bytes(values, shape=None):
+    """
+    Encodes an array.array or a list of strings as the content of a .npy
+    file. The shape is one-dimensional unless it is given.
+    """
+    if isinstance(values, array.array):
+        if shape is None:
+            shape = (len(values),)
+        descr = DESCR[values.typecode]
+        data = array.array(TYPECODE[descr], values)
+        if sys.byteorder == 'big' and data.itemsize > 1:
+            data.byteswap()
+        return npy_header(descr, shape) + data.tobytes()
+    width = max([len(value) for value in values] + [1])
+    data = b''.join(value.ljust(width, '\0').encode('utf-32-le')
+                    for value in values)
+    return npy_header('<U' + str(width), (len(values),)) + data
+
+
+def write_npz(npzfile, arrays, compress=True):
+    """
+    Writes a dictionary of arrays (array.array, list of strings, or a tuple
+    of an array.array and its shape) into a .npz archive.
+    """
+    method = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(npzfile, 'w', method) as archive:
+        for name, values in arrays.items():
+            shape = None
+            if isinstance(values, tuple):
+                values, shape = values
+            archive.writestr(name + '.npy', npy_bytes(values, shape))
+
+
+def parse_npy(content):
+    """
+    Decodes the content of a .npy file written by this module or by NumPy
+    (little endian numbers or unicode strings, C order).
+    Returns :
+        - values : An array.array, or a list of strings
+        - shape : The shape of the array
+    """
+    if content[:6] != NPY_MAGIC[:6]:
+        raise ValueError("Not a .npy file")
+    if content[6] == 1:
+        header_len = int.from_bytes(content[8:10], 'little')
+        start = 10
+    else:
+        header_len = int.from_bytes(content[8:12], 'little')
+        start = 12
+    header = ast.literal_eval(content[start:start + header_len]
+                              .decode('latin1'))
+    data = content[start + header_len:]
+    shape = header['shape']
+    descr = header['descr']
+    if descr.startswith('<U'):
+        size = 4*int(descr[2:])
+        return [data[pos:pos + size].decode('utf-32-le').rstrip('\0')
+                for pos in range(0, len(data), size)], shape
+    values = array.array(TYPECODE[descr])
+    values.frombytes(data)
+    if sys.byteorder == 'big' and values.itemsize > 1:
+        values.byteswap()
+    return values, shape
+
+
+def read_npz(npzfile):
+    """
+    Reads all the arrays of a .npz archive.
+    Returns :
+        - A dictionary giving, for each name, the tuple (values, shape)
+    """
+    arrays = {}
+    with zipfile.ZipFile(npzfile, 'r') as archive:
+        for name in archive.namelist():
+            if name.endswith('.npy'):
+                arrays[name[:-len('.npy')]] = parse_npy(archive.read(name))
+    return arrays
@@ -0,0 +1,197 @@
+"""
+This module keeps the parsed input files of the programs in an on-disk cache,
+so that the same model2, poe, por or node annotation file is parsed only
+once across runs. An entry is found by the kind of object and the SHA-256 of
+the content of the file, not by its path : a copied file is a hit, a
+modified file is a miss. The digests are remembered by path, size and
+modification time so that unchanged files are not read again to be hashed.
+Entries are pickled files, the least recently used ones being removed when
+the cache grows over its size limit, with the digests that no longer have
+any entry.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+CACHE_VERSION = 1
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache",
+                           "model2_analysis")
+DEFAULT_MAX_BYTES = 512*1024*1024
+DIGEST_INDEX = "digests.json"
+ENTRY_EXT = ".pkl"
+
+
+def file_digest(path):
+    """
+    Returns the SHA-256 of the content of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def atomic_write(path, data):
+    """
+    Writes a file through a temporary file, so that a concurrent reader
+    never sees it half written.
+    """
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, 'wb') as outfile:
+            outfile.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class ParseCache:
+    """
+    A content-addressed cache of parsed files.
+    Attributes :
+        - directory : The directory of the entries
+        - max_bytes : The size over which the least recently used entries
+          are removed
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, DIGEST_INDEX)
+        try:
+            with open(self.index_path, 'r') as index_file:
+                self.digests = json.load(index_file)
+        except (OSError, ValueError):
+            self.digests = {}
+
+    def digest(self, path):
+        """
+        Returns the digest of a file, hashing it only if it changed since it
+        was last hashed.
+        """
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        known = self.digests.get(path)
+        if known is not None and known[0] == stat.st_size \
+           and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = file_digest(path)
+        self.digests[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self.write_index()
+        return digest
+
+    def write_index(self):
+        """
+        Writes the remembered digests.
+        """
+        atomic_write(self.index_path,
+                     json.dumps(self.digests).encode('utf-8'))
+
+    def entry_path(self, kind, digest):
+        """
+        Returns the path of the entry of an object made from a file.
+        """
+        return os.path.join(self.directory, kind + '-v' + str(CACHE_VERSION)
+                            + '-' + digest + ENTRY_EXT)
+
+    def fetch(self, kind, path, build):
+        """
+        Returns the object of the given kind made from a file : the cached
+        one if the content of the file is known, build(path) otherwise, which
+        is then stored.
+        """
+        entry = self.entry_path(kind, self.digest(path))
+        try:
+            with open(entry, 'rb') as infile:
+                value = pickle.load(infile)
+            # The modification time of an entry is its last use
+            os.utime(entry)
+            return value
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        value = build(path)
+        atomic_write(entry, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        self.evict()
+        return value
+
+    def entries(self):
+        """
+        Returns the (last use, size, path) of every entry, the least
+        recently used first.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_EXT):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in its
+        size limit, and forgets the digests of the files whose entries are
+        all removed.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        kept = set()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                # Entry names end with -<digest>.pkl
+                kept.add(os.path.basename(path)[:-len(ENTRY_EXT)]
+                         .rsplit('-', 1)[1])
+                continue
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+        evicted = [path for path, known in self.digests.items()
+                   if known[2] not in kept]
+        if evicted:
+            for path in evicted:
+                del self.digests[path]
+            self.write_index()
+
+    def clear(self):
+        """
+        Removes all the entries and remembered digests.
+        """
+        for _, _, path in self.entries():
+            os.unlink(path)
+        self.digests = {}
+        if os.path.exists(self.index_path):
+            os.unlink(self.index_path)
+
+
+def add_arguments(parser):
+    """
+    Adds the options of the parse cache to the parser of a program.
+    """
+    parser.add_argument("--cache", action="store_true",
+                        help="Keep the parsed files in a cache (" + DEFAULT_DIR
+                        + " unless --cache-dir is given)")
+    parser.add_argument("--cache-dir", default=None, metavar="DIR",
+                        help="Directory of the cache, which implies --cache")
+    parser.add_argument("--cache-size", type=int,
+                        default=DEFAULT_MAX_BYTES//(1024*1024), metavar="MB",
+                        help="Size limit of the cache in MB")
+
+
+def from_args(args):
+    """
+    Returns the parse cache asked for by the options, None if there is none.
+    """
+    if not args.cache and args.cache_dir is None:
+        return None
+    return ParseCache(args.cache_dir if args.cache_dir is not None
+                      else DEFAULT_DIR, args.cache_size*1024*1024)
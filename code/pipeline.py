@@ -0,0 +1,427 @@
+"""
+This module runs edit_model2.py and analyze_model2.py in one process, for
+programs that embed the analysis (an orchestration service, a notebook)
+instead of running both scripts one after the other. The results of the edit
+are given to the analysis in memory : the node annotations come from the
+element counts of the edit instead of annot_node.csv, and the edited model
+from the new weights instead of updated_modelfile.model2.
+Every stage is computed on demand, the first time its result is asked for,
+and kept for the next ones. No file is written unless it is asked for, with
+the write_* methods, in the output directory of the pipeline (or in the
+directory given to the method).
+    pipe = pipeline.Pipeline("model.model2", "run.poe")
+    analysis = pipe.analyze("new_run.poe", "new_run.por")
+    analysis.missing_summary
+"""
+import argparse
+import os
+import analyze_model2
+import cytoscape_export
+import edit_model2
+import model2
+import parse_cache
+import rule_bitsets
+import rule_firing
+import run_metrics
+import weight_policies
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Original Model2 file
+        - Original Poe file
+        - Poe and Por files of the simulation of the edited model
+        - Output directory, export, delta, cache and metrics options
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("m2", metavar="MODEL2",
+                        help="Enter a valid model 2 file")
+    parser.add_argument("poe", metavar="POE",
+                        help="Enter a valid Poe file")
+    parser.add_argument("--analyze", nargs=2, default=None,
+                        metavar=("POE", "POR"),
+                        help="Analyze the simulation of the edited model, \
+                        with the node annotations of the edit")
+    parser.add_argument("-o", "--outdir", default=analyze_model2.RESULTS_DIR,
+                        help="Directory of the generated files")
+    parser.add_argument("--xgmml", action="store_true",
+                        help="Also write the network as an XGMML file")
+    parser.add_argument("--gzip", action="store_true",
+                        help="Compress the Cytoscape files with gzip")
+    parser.add_argument("--delta", action="store_true",
+                        help="Write the possible rules and missing elements \
+                        as delta reports")
+    parse_cache.add_arguments(parser)
+    run_metrics.add_arguments(parser)
+    return parser.parse_args()
+
+
+def node_annotation_lines(dict_sugg_elt):
+    """
+    Formats the node annotations of the edit as the lines of annot_node.csv.
+    """
+    return ['Element,Nreac,Nprod,Ratio\n'] + [
+        cytoscape_export.node_line(elt, nb_reac, nb_prod)[0]
+        for elt, nb_reac, nb_prod in zip(dict_sugg_elt['Element'],
+                                         dict_sugg_elt['Nreac'],
+                                         dict_sugg_elt['Nprod'])]
+
+
+def possible_rule_names(model, computed):
+    """
+    Returns the names of the possible rules of every timestep, from the
+    result of compute_possible_rules.
+    """
+    missing_rows, possible_masks = computed[1:]
+    return dict((timestep, [model.names[index] for index
+                            in rule_bitsets.bit_indexes(mask)])
+                for timestep, mask in zip(missing_rows, possible_masks))
+
+
+def lost_element_names(computed):
+    """
+    Returns the names of the missing elements of every timestep, from the
+    result of compute_possible_rules.
+    """
+    elements, missing_rows = computed[:2]
+    return dict((timestep, [elements[i] for i in missing])
+                for timestep, missing in missing_rows.items())
+
+
+def last_missing_elements(computed):
+    """
+    Returns the names of the missing elements of the last timestep, from the
+    result of compute_possible_rules.
+    """
+    elements, missing_rows = computed[:2]
+    return [elements[i] for i in list(missing_rows.values())[-1]]
+
+
+class Stages:
+    """
+    The stages of a pipeline, each one computed once when its result is
+    first asked for, and measured by the Metrics of the pipeline. The
+    inputs of a stage (the results of other stages) are computed before it
+    is measured, so that the stages are never measured one inside the
+    other.
+    """
+
+    def __init__(self, outdir=None, cache=None, metrics=None):
+        self.outdir = outdir
+        self.cache = cache
+        self.metrics = metrics if metrics is not None \
+            else run_metrics.Metrics("pipeline")
+        self._results = {}
+
+    def stage(self, name, function, *inputs):
+        """
+        Returns the result of a stage, computing it the first time as
+        function applied to the attributes named in inputs.
+        """
+        if name not in self._results:
+            args = [getattr(self, attribute) for attribute in inputs]
+            with self.metrics.stage(name):
+                self._results[name] = function(*args)
+        return self._results[name]
+
+    def done(self):
+        """
+        Returns the names of the stages already computed.
+        """
+        return list(self._results)
+
+    def output_dir(self, outdir=None):
+        """
+        Returns the directory where the files are written, creating it.
+        """
+        outdir = outdir if outdir is not None else self.outdir
+        if outdir is None:
+            raise ValueError("No output directory given")
+        os.makedirs(outdir, exist_ok=True)
+        return outdir
+
+
+class Pipeline(Stages):
+    """
+    The edit of a model2 file from the simulation of the original model.
+    Attributes (computed on demand) :
+        - model : The compiled model
+        - all_elts_list : The header of the Poe file
+        - dict_sugg_elt : The node annotations (see edit_model2.sugg_element)
+        - dict_to_weigh : The mean ratios of every rule
+        - changed : The changed weight of every rule, as in annot_edge.csv
+        - weights : The weights of the updated model2 file
+        - edited_model : The model with the updated weights
+        - annot_lines : The lines of annot_node.csv
+    """
+
+    def __init__(self, modelfile, poefile, outdir=None, cache=None,
+                 policy=weight_policies.DEFAULT_POLICY, metrics=None):
+        Stages.__init__(self, outdir, cache, metrics)
+        self.modelfile = modelfile
+        self.poefile = poefile
+        self.policy = policy
+
+    @property
+    def model(self):
+        """
+        The compiled model.
+        """
+        return self.stage("list_all_rules", model2.load_model2,
+                          'modelfile', 'cache')
+
+    @property
+    def all_elts_list(self):
+        """
+        The header of the Poe file.
+        """
+        return self.stage("list_all_elts", edit_model2.list_all_elts,
+                          'poefile')
+
+    @property
+    def dict_sugg_elt(self):
+        """
+        The node annotations of the elements.
+        """
+        return self.stage("sugg_element", edit_model2.sugg_element,
+                          'all_elts_list', 'model')
+
+    @property
+    def dict_to_weigh(self):
+        """
+        The mean ratios of every rule.
+        """
+        return self.stage("rules_to_weigh", edit_model2.rules_to_weigh,
+                          'model', 'dict_sugg_elt')
+
+    @property
+    def new_weights(self):
+        """
+        The changed weights and the weights of the updated file.
+        """
+        return self.stage("new_weights", edit_model2.new_weights,
+                          'model', 'dict_to_weigh', 'policy')
+
+    @property
+    def changed(self):
+        """
+        The changed weight of every rule.
+        """
+        return self.new_weights[0]
+
+    @property
+    def weights(self):
+        """
+        The weights of the updated model2 file.
+        """
+        return self.new_weights[1]
+
+    @property
+    def edited_model(self):
+        """
+        The model with the updated weights.
+        """
+        return self.stage("edited_model", model2.Model2.with_weights,
+                          'model', 'weights')
+
+    @property
+    def annot_lines(self):
+        """
+        The lines of annot_node.csv.
+        """
+        return self.stage("annot_lines", node_annotation_lines,
+                          'dict_sugg_elt')
+
+    def write_model2(self, outdir=None):
+        """
+        Writes the updated model2 file.
+        Returns :
+            - path : The path of the file
+        File generated :
+            - updated_modelfile.model2 : An updated model2 file with new
+              weights.
+        """
+        path = os.path.join(self.output_dir(outdir),
+                            "updated_modelfile.model2")
+        model, weights = self.model, self.weights
+        with self.metrics.stage("write_model2"):
+            model.write_model2(path, weights)
+        return path
+
+    def write_network(self, outdir=None,
+                      formats=cytoscape_export.FORMATS[:3], compress=False):
+        """
+        Writes the Cytoscape files (see cytoscape_export.export_network).
+        Returns :
+            - paths : The path of every generated file, by format
+        """
+        outdir = self.output_dir(outdir)
+        model, changed = self.model, self.changed
+        node_elements = self.dict_sugg_elt['Element']
+        with self.metrics.stage("export_network"):
+            return cytoscape_export.export_network(
+                model, changed, node_elements, outdir, formats, compress,
+                title=os.path.basename(self.modelfile))
+
+    def write_all(self, outdir=None, formats=cytoscape_export.FORMATS[:3],
+                  compress=False):
+        """
+        Writes all the files of edit_model2.py.
+        """
+        self.write_model2(outdir)
+        self.write_network(outdir, formats, compress)
+
+    def analyze(self, poefile, porfile, outdir=None):
+        """
+        Returns the Analysis of the simulation of the edited model, sharing
+        the cache and the Metrics of the pipeline. The files are written in
+        the directory of the pipeline by default.
+        """
+        return Analysis(self.edited_model, poefile, porfile,
+                        self.annot_lines,
+                        outdir if outdir is not None else self.outdir,
+                        self.cache, self.metrics)
+
+
+class Analysis(Stages):
+    """
+    The analysis of a simulation.
+    - model : A compiled model (see model2.load_model2)
+    - annot_lines : The lines of the node annotations, as in annot_node.csv
+    Attributes (computed on demand) :
+        - firing : The uses of the rules (see rule_firing.firing_matrix)
+        - computed : The missing elements and the possible rules of every
+          timestep (see analyze_model2.compute_possible_rules)
+        - possible_rules : The names of the possible rules of every timestep
+        - lost_reactives : The names of the missing elements of every
+          timestep
+        - missing_elements : The missing elements of the last timestep
+        - missing_summary : The lines of missing_elts_summary.txt
+    """
+
+    def __init__(self, model, poefile, porfile, annot_lines, outdir=None,
+                 cache=None, metrics=None):
+        Stages.__init__(self, outdir, cache, metrics)
+        self.model = model
+        self.poefile = poefile
+        self.porfile = porfile
+        self.annot_lines = annot_lines
+
+    @property
+    def firing(self):
+        """
+        The uses of the rules.
+        """
+        return self.stage("firing_matrix", rule_firing.firing_matrix,
+                          'porfile', 'cache')
+
+    @property
+    def computed(self):
+        """
+        The missing elements and possible rules of every timestep.
+        """
+        return self.stage("compute_possible_rules",
+                          analyze_model2.compute_possible_rules,
+                          'model', 'poefile', 'cache')
+
+    @property
+    def possible_rules(self):
+        """
+        The possible rules of every timestep.
+        """
+        return self.stage("possible_rules", possible_rule_names,
+                          'model', 'computed')
+
+    @property
+    def lost_reactives(self):
+        """
+        The missing elements of every timestep.
+        """
+        return self.stage("lost_reactives", lost_element_names, 'computed')
+
+    @property
+    def missing_elements(self):
+        """
+        The missing elements of the last timestep.
+        """
+        return self.stage("missing_elements", last_missing_elements,
+                          'computed')
+
+    @property
+    def missing_summary(self):
+        """
+        The lines of missing_elts_summary.txt.
+        """
+        return self.stage("missing_summary",
+                          analyze_model2.missing_summary_lines,
+                          'missing_elements', 'annot_lines')
+
+    def write_rules_applied(self, outdir=None):
+        """
+        Writes the uses of the rules : rules_applied.txt and the reports of
+        rule_firing.py.
+        """
+        outdir = self.output_dir(outdir)
+        firing = self.firing
+        with self.metrics.stage("rules_in_timesteps"):
+            analyze_model2.rules_in_timesteps(firing, outdir)
+        with self.metrics.stage("write_firing_reports"):
+            rule_firing.write_firing_reports(firing, outdir)
+
+    def write_possible_rules(self, outdir=None, delta=False):
+        """
+        Writes possible_rules.txt and lost_reactives.txt, or their delta
+        reports (see analyze_model2.sim_possible_rules).
+        """
+        outdir = self.output_dir(outdir)
+        computed = self.computed
+        with self.metrics.stage("sim_possible_rules"):
+            analyze_model2.sim_possible_rules(self.model, self.poefile, outdir,
+                                              computed, delta)
+
+    def write_missing_summary(self, outdir=None):
+        """
+        Writes missing_elts_summary.txt.
+        Returns :
+            - path : The path of the file
+        """
+        path = os.path.join(self.output_dir(outdir),
+                            "missing_elts_summary.txt")
+        summary_lines = self.missing_summary
+        with self.metrics.stage("summary_missing_elements"):
+            with open(path, "w") as missing_elts_file:
+                missing_elts_file.write(''.join(summary_lines))
+        return path
+
+    def write_all(self, outdir=None, delta=False):
+        """
+        Writes all the files of analyze_model2.py.
+        """
+        self.write_rules_applied(outdir)
+        self.write_possible_rules(outdir, delta)
+        self.write_missing_summary(outdir)
+
+
+def main():
+    """
+    Main function of the program. Edits the model, then analyzes the
+    simulation of the edited model if it is given, and writes the files of
+    both programs.
+    """
+    args = args_parse()
+    formats = cytoscape_export.FORMATS if args.xgmml \
+        else cytoscape_export.FORMATS[:3]
+    pipe = Pipeline(args.m2, args.poe, args.outdir,
+                    parse_cache.from_args(args),
+                    metrics=run_metrics.from_args(args, "pipeline",
+                                                  args.outdir))
+    pipe.write_all(formats=formats, compress=args.gzip)
+    if args.analyze is not None:
+        pipe.analyze(*args.analyze).write_all(delta=args.delta)
+    pipe.metrics.write()
+
+if __name__ == "__main__":
+    main()
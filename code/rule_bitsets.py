@@ -0,0 +1,75 @@
+"""
+This module compiles the reactives of the model2 rules into packed bitsets,
+so that the possible rules of every timestep of a simulation are resolved
+with a few integer operations instead of list lookups.
+Python integers are used as bitsets of arbitrary size : bit r of a consumer
+mask is rule r.
+"""
+
+
+def bit_indexes(mask):
+    """
+    Returns the list of the indexes of the bits set in a mask, in increasing
+    order.
+    """
+    bits = bin(mask)[:1:-1]
+    indexes = []
+    index = bits.find('1')
+    while index != -1:
+        indexes.append(index)
+        index = bits.find('1', index + 1)
+    return indexes
+
+
+def compile_model(model, elements):
+    """
+    This function compiles the reactive matrix of a compiled Model2 against
+    the elements of a simulation. The element ids of the model are
+    translated once into the column indexes of the simulation.
+    Returns :
+        - consumers : For each element, the bitset of the rules that need it
+          as a reactive
+        - never_possible : The bitset of the rules using a reactive that is
+          not part of the simulation, which can never be applied
+    """
+    column_index = {elt: index for index, elt in enumerate(elements)}
+    columns = [column_index.get(elt, -1) for elt in model.elements]
+    consumers = [0]*len(elements)
+    never_possible = 0
+    for num_rule in range(len(model.names)):
+        for elt in model.reactives(num_rule):
+            if columns[elt] != -1:
+                consumers[columns[elt]] |= 1 << num_rule
+            else:
+                never_possible |= 1 << num_rule
+    return consumers, never_possible
+
+
+def element_mask(indexes):
+    """
+    Packs a list of element indexes into a bitset.
+    """
+    mask = 0
+    for index in indexes:
+        mask |= 1 << index
+    return mask
+
+
+def possible_rules_masks(nb_rules, consumers, never_possible, missing_rows):
+    """
+    This function resolves the possible rules of every timestep in one pass.
+    A rule is blocked as soon as one of its reactives is missing, so the
+    blocked rules of a timestep are the union of the consumers of its missing
+    elements.
+    Returns :
+        - A list containing, for every timestep, the bitset of its possible
+          rules
+    """
+    all_rules = ((1 << nb_rules) - 1) & ~never_possible
+    masks = []
+    for missing in missing_rows:
+        blocked = 0
+        for index in missing:
+            blocked |= consumers[index]
+        masks.append(all_rules & ~blocked)
+    return masks
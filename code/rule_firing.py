@@ -0,0 +1,183 @@
+"""
+This module turns the percentages of the .por file and its #Evts column into
+a sparse matrix of the number of times every rule has been used in every
+timestep, computed column by column from the trajectory. The matrix is
+stored per rule (CSC : one column per rule, the rows being the timesteps),
+and gives the cumulative counts, the event rates, the most used rules of
+every window of timesteps and the rules that stop being used.
+"""
+import array
+import heapq
+import os
+import npz_io
+import trajectory_store
+
+
+class FiringMatrix:
+    """
+    The number of uses of every rule in every timestep.
+    Attributes :
+        - rules : The rule names, in the order of the Por file
+        - labels : The timestep labels
+        - times : The timesteps as floats
+        - nb_events : The number of events of every timestep
+        - varied : For every rule, False if its percentage was always 0 or
+          always 100 (the rules left out of rules_applied.txt)
+        - indptr, rows, counts : The CSC matrix of the uses. Only the
+          timesteps where the percentage of the rule is not 0 are stored.
+    """
+
+    def __init__(self, rules, labels, nb_events):
+        self.rules = rules
+        self.labels = labels
+        self.times = array.array('d', (float(label) for label in labels))
+        self.nb_events = nb_events
+        self.varied = []
+        self.indptr = array.array('q', [0])
+        self.rows = array.array('q')
+        self.counts = array.array('q')
+
+    def rule_entries(self, rule):
+        """
+        Returns the rows and counts of the timesteps where a rule is used.
+        """
+        start, end = self.indptr[rule], self.indptr[rule + 1]
+        return self.rows[start:end], self.counts[start:end]
+
+    def totals(self):
+        """
+        Returns the total number of uses of every rule.
+        """
+        return array.array('q', (sum(self.counts[self.indptr[rule]:
+                                                 self.indptr[rule + 1]])
+                                 for rule in range(len(self.rules))))
+
+    def cumulative(self):
+        """
+        Returns the cumulative number of uses of every rule, aligned with
+        the stored counts : at any timestep, it is the value of the last
+        stored row up to it.
+        """
+        cumulative = array.array('q', self.counts)
+        for rule in range(len(self.rules)):
+            for pos in range(self.indptr[rule] + 1, self.indptr[rule + 1]):
+                cumulative[pos] += cumulative[pos - 1]
+        return cumulative
+
+    def by_timestep(self):
+        """
+        Transposes the matrix, to read it timestep by timestep.
+        Returns :
+            - t_indptr, t_rules, t_counts : The CSR matrix of the uses
+        """
+        t_indptr = array.array('q', [0])*(len(self.labels) + 1)
+        for row in self.rows:
+            t_indptr[row + 1] += 1
+        for row in range(len(self.labels)):
+            t_indptr[row + 1] += t_indptr[row]
+        position = array.array('q', t_indptr)
+        t_rules = array.array('q', [0])*len(self.rows)
+        t_counts = array.array('q', [0])*len(self.rows)
+        for rule in range(len(self.rules)):
+            for pos in range(self.indptr[rule], self.indptr[rule + 1]):
+                row = self.rows[pos]
+                t_rules[position[row]] = rule
+                t_counts[position[row]] = self.counts[pos]
+                position[row] += 1
+        return t_indptr, t_rules, t_counts
+
+    def top_rules(self, window, nb_top):
+        """
+        Finds the most used rules in every window of timesteps.
+        Returns :
+            - A list giving, for each window, its first and last rows and
+              its (count, rule) pairs, the most used first
+        """
+        nb_windows = -(-len(self.labels) // window)
+        sums = [{} for _ in range(nb_windows)]
+        for rule in range(len(self.rules)):
+            for pos in range(self.indptr[rule], self.indptr[rule + 1]):
+                window_sums = sums[self.rows[pos] // window]
+                window_sums[rule] = window_sums.get(rule, 0) + self.counts[pos]
+        top = []
+        for index, window_sums in enumerate(sums):
+            best = heapq.nlargest(nb_top, ((count, -rule) for rule, count
+                                           in window_sums.items() if count))
+            top.append((index*window,
+                        min((index + 1)*window, len(self.labels)) - 1,
+                        [(count, -rule) for count, rule in best]))
+        return top
+
+
+def firing_matrix(porfile, cache=None):
+    """
+    This function builds the matrix of the uses of the rules from the Por
+    file, parsed or taken from the parse cache. The columns that are always
+    at 0 are skipped without being read, and the number of uses is computed
+    like in rules_applied.txt.
+    Returns :
+        - firing : The FiringMatrix of the simulation
+    """
+    por = trajectory_store.load_trajectory(porfile, cache)
+    nb_events = [int(value) for value in por.column(1)]
+    firing = FiringMatrix(por.names[2:], list(por.labels), nb_events)
+    for index in range(2, len(por.names)):
+        constant = por.constant(index)
+        firing.varied.append(constant not in (0, 100))
+        if constant != 0:
+            for row, value in enumerate(por.iter_column(index)):
+                if value != 0:
+                    firing.rows.append(row)
+                    firing.counts.append(int(round(value*nb_events[row])
+                                             /100))
+        firing.indptr.append(len(firing.rows))
+    por.close()
+    return firing
+
+
+def write_firing_reports(firing, outdir, window=10, nb_top=20):
+    """
+    This function writes the machine readable reports of the uses of the
+    rules.
+    Files generated :
+        - rules_firing.csv : For every rule, its total number of uses, its
+          rate per unit of time, its first and last use, and the timestep
+          where it stops being used if it does.
+        - rules_firing_top.csv : The most used rules of every window of
+          timesteps.
+        - rules_firing.npz : The matrix of the uses and cumulative uses (CSC,
+          one column per rule) with the rule names, timesteps and number of
+          events, to be loaded with numpy.load.
+    """
+    duration = firing.times[-1] if len(firing.times) else 0.0
+    last_row = len(firing.labels) - 1
+    with open(os.path.join(outdir, "rules_firing.csv"), "w") as outfile:
+        outfile.write("Rule,Total,Rate,First_used,Last_used,Stopped_at\n")
+        for rule, (name, total) in enumerate(zip(firing.rules,
+                                                 firing.totals())):
+            rows, counts = firing.rule_entries(rule)
+            used = [row for row, count in zip(rows, counts) if count]
+            first = firing.labels[used[0]] if used else 'NA'
+            last = firing.labels[used[-1]] if used else 'NA'
+            stopped = firing.labels[used[-1] + 1] \
+                if used and used[-1] < last_row else 'NA'
+            rate = '{0:.6f}'.format(total/duration) if duration else 'NA'
+            outfile.write(','.join([name, str(total), rate, first, last,
+                                    stopped]) + "\n")
+    with open(os.path.join(outdir, "rules_firing_top.csv"), "w") as outfile:
+        outfile.write("From,To,Rank,Rule,Count\n")
+        for first, last, best in firing.top_rules(window, nb_top):
+            for rank, (count, rule) in enumerate(best, 1):
+                outfile.write(','.join([firing.labels[first],
+                                        firing.labels[last], str(rank),
+                                        firing.rules[rule], str(count)])
+                              + "\n")
+    npz_io.write_npz(os.path.join(outdir, "rules_firing.npz"), {
+        'rules': firing.rules,
+        'timesteps': firing.times,
+        'nb_events': array.array('q', firing.nb_events),
+        'varied': array.array('B', firing.varied),
+        'indptr': firing.indptr,
+        'rows': firing.rows,
+        'counts': firing.counts,
+        'cumulative': firing.cumulative()})
@@ -0,0 +1,187 @@
+"""
+This module measures the stages of the programs : for every stage, its wall
+and CPU time and its throughput in rows (timesteps) and rules per second,
+with the peak resident memory of the whole run. The memory allocated by
+every stage can also be traced with tracemalloc, and every stage can be
+profiled with cProfile, one .prof file per stage. The measures are written
+as a JSON metrics file, to be followed from run to run.
+When nothing is asked for, the stages are not measured at all.
+"""
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    """
+    Returns the peak resident memory of the process in bytes, None where it
+    is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kilobytes, macOS gives bytes
+    return peak if sys.platform == 'darwin' else peak*1024
+
+
+class Stage:
+    """
+    The measures of one stage. The number of rows and rules it processed can
+    be set while it runs, to compute its throughput.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.rules = None
+        self.measures = {}
+
+    def to_dict(self):
+        """
+        Returns the measures of the stage with its throughputs.
+        """
+        result = {'stage': self.name}
+        result.update(self.measures)
+        wall = self.measures.get('wall')
+        for kind, count in (('rows', self.rows), ('rules', self.rules)):
+            if count is not None:
+                result[kind] = count
+                result[kind + '_per_s'] = count/wall if wall else None
+        return result
+
+
+class Metrics:
+    """
+    The measures of all the stages of a run.
+    Attributes :
+        - enabled : False if nothing is measured
+        - metrics_file : The JSON file written at the end, if any
+        - profile_dir : The directory of the cProfile files, if any
+        - trace_memory : True to trace the allocations of every stage
+        - results_dir : The directory of the JSON file when neither a file
+          nor a profile directory is given
+    """
+
+    def __init__(self, program, metrics_file=None, profile_dir=None,
+                 trace_memory=False, results_dir="./results"):
+        self.program = program
+        self.metrics_file = metrics_file
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.results_dir = results_dir
+        self.enabled = metrics_file is not None or profile_dir is not None \
+            or trace_memory
+        self.stages = []
+        self.started = time.time()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def stage(self, name):
+        """
+        Returns the context measuring a stage.
+        """
+        return StageContext(self, name)
+
+    def to_dict(self):
+        """
+        Returns all the measures of the run.
+        """
+        return {'program': self.program,
+                'argv': sys.argv[1:],
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                         time.localtime(self.started)),
+                'wall': time.perf_counter() - self.wall,
+                'cpu': time.process_time() - self.cpu,
+                'peak_rss': peak_rss(),
+                'stages': [stage.to_dict() for stage in self.stages]}
+
+    def write(self):
+        """
+        Writes the JSON metrics file (metrics.json in the profile directory,
+        or else in the results directory, if no file was given).
+        """
+        if not self.enabled:
+            return
+        path = self.metrics_file
+        if path is None:
+            directory = self.profile_dir or self.results_dir
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, 'metrics.json')
+        with open(path, 'w') as outfile:
+            json.dump(self.to_dict(), outfile, indent=1)
+
+
+class StageContext:
+    """
+    Measures a stage in a with block, and gives its Stage object.
+    """
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.stage = Stage(name)
+        self.profiler = None
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def __enter__(self):
+        metrics = self.metrics
+        if not metrics.enabled:
+            return self.stage
+        if metrics.trace_memory:
+            tracemalloc.start()
+        if metrics.profile_dir is not None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self.stage
+
+    def __exit__(self, *exc):
+        metrics = self.metrics
+        if not metrics.enabled:
+            return False
+        measures = self.stage.measures
+        measures['wall'] = time.perf_counter() - self.wall
+        measures['cpu'] = time.process_time() - self.cpu
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(os.path.join(metrics.profile_dir,
+                                                  self.stage.name + '.prof'))
+        if metrics.trace_memory:
+            measures['traced_peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        metrics.stages.append(self.stage)
+        return False
+
+
+def add_arguments(parser):
+    """
+    Adds the options of the measures to the parser of a program.
+    """
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help="Write the time, memory and throughput of every \
+                        stage in a JSON file")
+    parser.add_argument("--profile", default=None, metavar="DIR",
+                        help="Profile every stage with cProfile, in one .prof \
+                        file per stage in DIR")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Trace the memory allocated by every stage with \
+                        tracemalloc")
+
+
+def from_args(args, program, results_dir="./results"):
+    """
+    Returns the Metrics asked for by the options.
+    """
+    return Metrics(program, args.metrics, args.profile, args.trace_memory,
+                   results_dir)
@@ -0,0 +1,373 @@
+"""
+This module is a local stand-in for BESS5. It simulates a model2 file with
+the Gillespie algorithm (or tau-leaping) and writes .poe and .por files in
+the format read by the analysis programs, so that weight changes can be
+tested and the analysis benchmarked without the real simulator.
+The state is the quantity of every element, starting from the --INITIAL
+section. The propensity of a rule is its weight times the number of ways
+to pick its reactives (mass action). After an event, only the rules that
+consume an element whose quantity changed are recomputed (dependency graph),
+and the next rule is drawn from a Fenwick tree of the propensities.
+For each sampling interval, the .poe file gives the percentage of time every
+element was present and the .por file the percentage of the events done by
+every rule, with the number of events in the #Evts column.
+The .poe values differ from those of BESS5, which are the percentage of the
+events of the interval after which the element was present, not of the
+time. Both are 0 only when the element was missing during the whole
+interval, which is all the analysis programs use, but the values in between
+should not be compared between the two simulators.
+"""
+import argparse
+import array
+import math
+import random
+import model2
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Model2 file
+        - Prefix of the generated Poe and Por files
+        - Sampling, method and seed options
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("m2", metavar="MODEL2",
+                        help="Enter a valid model 2 file")
+    parser.add_argument("out", metavar="PREFIX",
+                        help="Prefix of the generated Poe and Por files")
+    parser.add_argument("--first", type=float, default=500.0,
+                        help="Time of the first sample")
+    parser.add_argument("--interval", type=float, default=1000.0,
+                        help="Time between two samples")
+    parser.add_argument("--samples", type=int, default=21,
+                        help="Number of samples")
+    parser.add_argument("--method", choices=["ssa", "tau"], default="ssa",
+                        help="Exact Gillespie algorithm or tau-leaping")
+    parser.add_argument("--tau", type=float, default=1.0,
+                        help="Time step of tau-leaping")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed of the random generator")
+    return parser.parse_args()
+
+
+class FenwickTree:
+    """
+    A binary indexed tree of non negative values, giving prefix sums and
+    the search of a cumulative value in O(log n).
+    """
+
+    def __init__(self, values):
+        self.size = len(values)
+        self.tree = array.array('d', [0.0])*(self.size + 1)
+        for index, value in enumerate(values):
+            self.tree[index + 1] += value
+            parent = index + 1 + ((index + 1) & -(index + 1))
+            if parent <= self.size:
+                self.tree[parent] += self.tree[index + 1]
+        self.top = 1 << max(self.size.bit_length() - 1, 0)
+
+    def add(self, index, delta):
+        """
+        Adds delta to the value at index.
+        """
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def total(self):
+        """
+        Returns the sum of all the values.
+        """
+        total = 0.0
+        index = self.size
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, target):
+        """
+        Returns the first index whose prefix sum exceeds target.
+        """
+        pos = 0
+        step = self.top
+        while step:
+            if pos + step <= self.size and self.tree[pos + step] <= target:
+                pos += step
+                target -= self.tree[pos]
+            step >>= 1
+        return min(pos, self.size - 1)
+
+
+def poisson(rand, mean):
+    """
+    Draws a Poisson random number, with the normal approximation for large
+    means.
+    """
+    if mean <= 0:
+        return 0
+    if mean > 30:
+        return max(0, int(round(rand.gauss(mean, math.sqrt(mean)))))
+    limit = math.exp(-mean)
+    count = 0
+    product = rand.random()
+    while product > limit:
+        count += 1
+        product *= rand.random()
+    return count
+
+
+class Simulator:
+    """
+    The state of a simulation of a compiled model.
+    Attributes :
+        - counts : The quantity of every element
+        - propensities : The propensity of every rule
+        - dependents : For every rule, the rules to recompute after it
+    """
+
+    def __init__(self, model, seed=None):
+        self.model = model
+        self.rand = random.Random(seed)
+        nb_elts = len(model.elements)
+        self.counts = array.array('q', [0])*nb_elts
+        for elt, quantity in model.initial.items():
+            if elt in model.element_index:
+                self.counts[model.element_index[elt]] = int(quantity)
+        # Net change of the quantities made by every rule
+        self.changes = []
+        for rule in range(len(model.names)):
+            change = {}
+            for elt in model.reactives(rule):
+                change[elt] = change.get(elt, 0) - 1
+            for elt in model.products(rule):
+                change[elt] = change.get(elt, 0) + 1
+            self.changes.append([(elt, delta) for elt, delta
+                                 in change.items() if delta != 0])
+        self.reactive_counts = []
+        # For every reactive of every rule : its multiplicity and the
+        # quantity consumed by one use of the rule
+        self.consumptions = []
+        for rule in range(len(model.names)):
+            multiplicity = {}
+            for elt in model.reactives(rule):
+                multiplicity[elt] = multiplicity.get(elt, 0) + 1
+            self.reactive_counts.append(list(multiplicity.items()))
+            change = dict(self.changes[rule])
+            self.consumptions.append([(elt, needed, -change.get(elt, 0))
+                                      for elt, needed in multiplicity.items()])
+        consumer_ptr, consumer_rules = model.consumers()
+        self.dependents = []
+        for rule in range(len(model.names)):
+            dependents = set()
+            for elt, _ in self.changes[rule]:
+                dependents.update(consumer_rules[consumer_ptr[elt]:
+                                                 consumer_ptr[elt + 1]])
+            self.dependents.append(sorted(dependents))
+        self.propensities = array.array('d', (self.propensity(rule) for rule
+                                              in range(len(model.names))))
+        self.tree = FenwickTree(self.propensities)
+
+    def propensity(self, rule):
+        """
+        Computes the propensity of a rule from the current quantities.
+        """
+        value = self.model.weights[rule]
+        for elt, multiplicity in self.reactive_counts[rule]:
+            count = self.counts[elt]
+            for index in range(multiplicity):
+                value *= count - index
+            if value <= 0:
+                return 0.0
+        return value
+
+    def max_firings(self, rule):
+        """
+        Computes how many times in a row a rule can be applied with the
+        current quantities : every use needs all its reactives, and takes
+        away the ones it consumes.
+        Returns :
+            - The number of uses, None if the rule consumes nothing
+        """
+        limit = None
+        for elt, needed, consumed in self.consumptions[rule]:
+            count = self.counts[elt]
+            if count < needed:
+                return 0
+            if consumed > 0:
+                firings = (count - needed)//consumed + 1
+                if limit is None or firings < limit:
+                    limit = firings
+        return limit
+
+    def fire(self, rule, times=1):
+        """
+        Applies a rule and recomputes the propensities that depend on it.
+        Returns :
+            - The list of the elements whose quantity changed
+        """
+        changed = []
+        for elt, delta in self.changes[rule]:
+            if self.counts[elt] + delta*times < 0:
+                raise ValueError(self.model.names[rule] + " used "
+                                 + str(times) + " times consumes more "
+                                 + self.model.elements[elt]
+                                 + " than available")
+        for elt, delta in self.changes[rule]:
+            self.counts[elt] += delta*times
+            changed.append(elt)
+        for dependent in self.dependents[rule]:
+            value = self.propensity(dependent)
+            self.tree.add(dependent, value - self.propensities[dependent])
+            self.propensities[dependent] = value
+        return changed
+
+
+class Sampler:
+    """
+    Collects, for the current sampling interval, the time every element is
+    present and the number of events of every rule.
+    """
+
+    def __init__(self, simulator, start):
+        self.simulator = simulator
+        nb_elts = len(simulator.counts)
+        self.present_time = array.array('d', [0.0])*nb_elts
+        self.since = array.array('d', [start])*nb_elts
+        self.events = array.array('q', [0])*len(simulator.model.names)
+        self.start = start
+
+    def record(self, rule, changed, time, times=1):
+        """
+        Records the events of a rule at the given time.
+        """
+        self.events[rule] += times
+        counts = self.simulator.counts
+        for elt in changed:
+            if counts[elt] == 0 and self.since[elt] >= 0:
+                self.present_time[elt] += time - self.since[elt]
+                self.since[elt] = -1.0
+            elif counts[elt] > 0 and self.since[elt] < 0:
+                self.since[elt] = time
+
+    def sample(self, time):
+        """
+        Closes the interval ending at the given time.
+        Returns :
+            - poe_values : The percentage of time every element was present
+            - por_values : The percentage of the events done by every rule
+            - nb_events : The number of events of the interval
+        """
+        length = time - self.start
+        counts = self.simulator.counts
+        poe_values = []
+        for elt in range(len(counts)):
+            if counts[elt] > 0:
+                self.present_time[elt] += time - max(self.since[elt],
+                                                     self.start)
+                self.since[elt] = time
+            else:
+                self.since[elt] = -1.0
+            poe_values.append(100*self.present_time[elt]/length
+                              if length > 0 else
+                              (100.0 if counts[elt] > 0 else 0.0))
+            self.present_time[elt] = 0.0
+        nb_events = sum(self.events)
+        por_values = [100*events/nb_events if nb_events else 0.0
+                      for events in self.events]
+        self.events = array.array('q', [0])*len(self.events)
+        self.start = time
+        return poe_values, por_values, nb_events
+
+
+def format_row(time, nb_events, values):
+    """
+    Formats a line of the Poe and Por files.
+    """
+    return '\t'.join('{0:.6f}'.format(value) for value
+                     in [time, nb_events] + values) + '\n'
+
+
+def simulate(model, outprefix, first=500.0, interval=1000.0, samples=21,
+             method="ssa", tau=1.0, seed=None):
+    """
+    This function simulates a model and writes its trajectory.
+    Returns :
+        - poefile, porfile : The paths of the generated files
+    Files generated :
+        - <outprefix>.poe : The presence of the elements in every interval.
+        - <outprefix>.por : The use of the rules in every interval.
+    """
+    simulator = Simulator(model, seed)
+    sampler = Sampler(simulator, 0.0)
+    for elt in range(len(simulator.counts)):
+        if simulator.counts[elt] == 0:
+            sampler.since[elt] = -1.0
+    rand = simulator.rand
+    poefile = outprefix + '.poe'
+    porfile = outprefix + '.por'
+    sample_times = [first + index*interval for index in range(samples)]
+    with open(poefile, 'w') as poe, open(porfile, 'w') as por:
+        poe.write('\t'.join(['#Tps', '#Evts'] + model.elements) + '\n')
+        por.write('\t'.join(['#Tps', '#Evts'] + model.names) + '\n')
+        time = 0.0
+        for sample_time in sample_times:
+            while True:
+                total = simulator.tree.total()
+                if total <= 0:
+                    break
+                if method == "ssa":
+                    step = rand.expovariate(total)
+                    if time + step > sample_time:
+                        break
+                    rule = simulator.tree.find(rand.random()*total)
+                    if simulator.propensities[rule] <= 0:
+                        # Rounding errors of the tree, which is rebuilt
+                        simulator.tree = FenwickTree(simulator.propensities)
+                        continue
+                    time += step
+                    changed = simulator.fire(rule)
+                    sampler.record(rule, changed, time)
+                else:
+                    step = min(tau, sample_time - time)
+                    if step <= 0:
+                        break
+                    firings = [(rule, poisson(rand, propensity*step))
+                               for rule, propensity
+                               in enumerate(simulator.propensities)
+                               if propensity > 0]
+                    time += step
+                    # The uses drawn for every rule are applied one rule
+                    # after the other, in a random order, each one limited
+                    # by the reactives left by the previous ones
+                    rand.shuffle(firings)
+                    for rule, times in firings:
+                        if times:
+                            limit = simulator.max_firings(rule)
+                            if limit is not None:
+                                times = min(times, limit)
+                        if times:
+                            changed = simulator.fire(rule, times)
+                            sampler.record(rule, changed, time, times)
+            time = sample_time
+            poe_values, por_values, nb_events = sampler.sample(sample_time)
+            poe.write(format_row(sample_time, nb_events, poe_values))
+            por.write(format_row(sample_time, nb_events, por_values))
+    return poefile, porfile
+
+
+def main():
+    """
+    Main function of the program. Simulates the model.
+    """
+    args = args_parse()
+    model = model2.load_model2(args.m2)
+    simulate(model, args.out, args.first, args.interval, args.samples,
+             args.method, args.tau, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+This module explores many weighting policies at once. The model2 file is
+parsed once, the mean reactive and product ratios of its rules are computed
+like in edit_model2.py, and every policy of the sweep (threshold policies
+for every combination of thresholds and factors, score policies, or the
+policies of a plugin module) writes its own updated_modelfile.model2. The
+variants are written on a pool of processes, from the reactions and the
+--INITIAL section of the parsed model, without reading the original file
+again. A summary of the changes made by every policy is written at the end.
+"""
+import argparse
+import csv
+import importlib
+import multiprocessing
+import os
+import edit_model2
+import model2
+import weight_policies
+
+SUMMARY_FIELDS = ["Policy", "Increased", "Decreased", "Unchanged", "Model2"]
+
+# Parsed model and ratio pairs shared with the worker processes
+SHARED = {}
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Model2 file
+        - Policy grid, plugin, output directory and number of processes
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("m2", metavar="MODEL2",
+                        help="Enter a valid model 2 file")
+    parser.add_argument("-o", "--outdir", default="./results/sweep",
+                        help="Directory where each policy gets its own folder")
+    parser.add_argument("--thresholds", type=float, nargs='*', default=[1.0],
+                        help="Thresholds of the threshold policies")
+    parser.add_argument("--strong", type=float, nargs='*', default=[4.0],
+                        help="Strong factors of the threshold policies")
+    parser.add_argument("--weak", type=float, nargs='*', default=[2.0],
+                        help="Weak factors of the threshold policies")
+    parser.add_argument("--exponents", type=float, nargs='*', default=[],
+                        help="Exponents of the score policies")
+    parser.add_argument("--limits", type=float, nargs='*', default=[4.0],
+                        help="Limits of the factors of the score policies")
+    parser.add_argument("--plugin", default=None,
+                        help="Module whose POLICIES list is added to the \
+                        sweep")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of worker processes (all cores by \
+                        default)")
+    return parser.parse_args()
+
+
+def init_worker(shared):
+    """
+    Receives the parsed model and the ratio pairs in a worker process.
+    """
+    SHARED.update(shared)
+
+
+def write_variant(task):
+    """
+    Applies a policy to the weights of the model and writes the variant.
+    Returns :
+        - A row of the summary table
+    """
+    policy, outdir = task
+    model = SHARED['model']
+    new_weights, factors = weight_policies.policy_weights(
+        model, model.weights, SHARED['pairs'], SHARED['pair_index'], policy,
+        edit_model2.NONE_WEIGHT)
+    folder = os.path.join(outdir, policy.name)
+    os.makedirs(folder, exist_ok=True)
+    outfile = os.path.join(folder, "updated_modelfile.model2")
+    with open(outfile, 'w') as model_out:
+        model_out.write(''.join(prefix + str(weight) + '\n' for prefix, weight
+                                in zip(SHARED['prefixes'], new_weights)))
+        model_out.write(SHARED['tail'])
+    factors = [factor for factor in factors if factor is not None]
+    return {"Policy": policy.name,
+            "Increased": sum(1 for factor in factors if factor > 1),
+            "Decreased": sum(1 for factor in factors if factor < 1),
+            "Unchanged": sum(1 for factor in factors if factor == 1),
+            "Model2": outfile}
+
+
+def sweep_weights(model, policies, outdir, jobs=None):
+    """
+    This function writes the model2 variant of every policy on a pool of
+    processes.
+    Returns :
+        - summary : The rows of the summary table, in the order of the
+          policies
+    Files generated :
+        - <policy>/updated_modelfile.model2 : The variant of every policy.
+        - sweep_summary.csv : The number of rules whose weight is increased,
+          decreased or unchanged by every policy.
+    """
+    names = [policy.name for policy in policies]
+    if len(set(names)) != len(names):
+        raise ValueError("Every policy of a sweep needs its own name")
+    dict_to_weigh = edit_model2.rules_to_weigh(
+        model, edit_model2.element_ratios(model))
+    pairs, pair_index = weight_policies.ratio_pairs(model, dict_to_weigh)
+    shared = {'model': model, 'pairs': pairs, 'pair_index': pair_index,
+              'prefixes': [reaction + '\t' for reaction in model.reactions],
+              'tail': ''.join(line + '\n' for line in model.initial_lines)}
+    os.makedirs(outdir, exist_ok=True)
+    with multiprocessing.Pool(jobs, init_worker, (shared,)) as pool:
+        summary = pool.map(write_variant,
+                           [(policy, outdir) for policy in policies],
+                           chunksize=max(1, len(policies)//64))
+    with open(os.path.join(outdir, "sweep_summary.csv"), "w", newline='') \
+         as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summary)
+    return summary
+
+
+def main():
+    """
+    Main function of the program. Builds the policies and writes the variants.
+    """
+    args = args_parse()
+    model = model2.load_model2(args.m2)
+    policies = weight_policies.policy_grid(args.thresholds, args.strong,
+                                           args.weak, args.exponents,
+                                           args.limits)
+    if args.plugin is not None:
+        policies.extend(importlib.import_module(args.plugin).POLICIES)
+    sweep_weights(model, policies, args.outdir, args.jobs)
+
+if __name__ == "__main__":
+    main()
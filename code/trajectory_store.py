@@ -0,0 +1,398 @@
+"""
+This module converts the .poe and .por trajectories generated by BESS5 into
+a compact columnar binary store, and loads them back for the analysis
+programs. The store holds a JSON header index (column names, timestep labels
+and the encoding of every column) followed by a float32 matrix that is
+memory-mapped when opened, so only the columns that are needed are read.
+Columns that never vary (the sparse all-0/all-100 columns) are stored as a
+single value and columns made of long runs are run-length encoded. A column
+is only stored in float32 when float32 holds every one of its values
+exactly, so that the analysis gets the same values as from the text file
+(the percentages of the .por file are multiplied by #Evts, where a rounding
+of the seventh digit can change the printed counts).
+"""
+import argparse
+import array
+import itertools
+import json
+import mmap
+import os
+import struct
+
+MAGIC = b'PLCOL1\n'
+STORE_EXT = '.col'
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - One or several Poe or Por files
+    Returns :
+        - The list of trajectory files to convert
+    """
+    parser = argparse.ArgumentParser()
+    # Argument for the Poe/Por files to convert
+    parser.add_argument("traj", metavar="POE/POR", nargs='+',
+                        help="Enter one or several valid Poe or Por files")
+    args = parser.parse_args()
+    return args.traj
+
+
+def store_path(trajfile):
+    """
+    Returns the path of the binary store associated with a trajectory file.
+    """
+    return trajfile + STORE_EXT
+
+
+def narrow_column(values):
+    """
+    Converts a column to float32 if every value is exactly a float32.
+    Returns :
+        - The column as an array of float32 or, failing that, of float64
+    """
+    narrow = array.array('f', values)
+    if narrow.tolist() != values.tolist():
+        return values
+    return narrow
+
+
+def encode_column(values):
+    """
+    This function chooses the encoding of one column of the trajectory.
+    Returns :
+        - A tuple ('const', value) if the column never varies, ('runs',
+          lengths, values) if it is made of long runs, or ('dense', values)
+          otherwise.
+    """
+    if not values:
+        return ('const', 0.0)
+    lengths = array.array('I')
+    run_values = array.array(values.typecode)
+    previous = values[0]
+    length = 0
+    for value in values:
+        if value == previous:
+            length += 1
+        else:
+            lengths.append(length)
+            run_values.append(previous)
+            previous = value
+            length = 1
+    lengths.append(length)
+    run_values.append(previous)
+    if len(lengths) == 1:
+        return ('const', float(previous))
+    # A run costs two values, so it is only kept if it saves space
+    if 2*len(lengths) < len(values):
+        return ('runs', lengths, run_values)
+    return ('dense', values)
+
+
+def decode_runs(lengths, run_values):
+    """
+    Decodes a run-length encoded column.
+    Returns :
+        - column : An array with one value per timestep.
+    """
+    column = array.array('d')
+    for length, value in zip(lengths, run_values):
+        column.extend(array.array('d', [value])*length)
+    return column
+
+
+class Trajectory:
+    """
+    A trajectory read from a .poe/.por file or from its binary store.
+    Attributes :
+        - names : The column names of the file, '#Tps' and '#Evts' included.
+        - labels : The timestep labels, as written in the original file.
+        - nrows : The number of timesteps.
+    Columns are only decoded when they are asked for.
+    """
+
+    def __init__(self, names, labels, columns, mapped=None):
+        self.names = names
+        self.labels = labels
+        self.nrows = len(labels)
+        self._columns = columns
+        self._mapped = mapped
+
+    def constant(self, index):
+        """
+        Returns the value of a column that never varies, None otherwise.
+        """
+        if self._columns[index][0] == 'const':
+            return self._columns[index][1]
+        return None
+
+    def column(self, index):
+        """
+        Returns the values of a column for every timestep.
+        """
+        encoded = self._columns[index]
+        if encoded[0] == 'const':
+            return array.array('d', [encoded[1]])*self.nrows
+        if encoded[0] == 'runs':
+            return decode_runs(encoded[1], encoded[2])
+        return encoded[1]
+
+    def iter_column(self, index):
+        """
+        Yields the values of a column one timestep after the other, without
+        decoding the whole column.
+        """
+        encoded = self._columns[index]
+        if encoded[0] == 'const':
+            yield from itertools.repeat(encoded[1], self.nrows)
+        elif encoded[0] == 'runs':
+            for length, value in zip(encoded[1], encoded[2]):
+                yield from itertools.repeat(value, length)
+        else:
+            yield from encoded[1]
+
+    def zero_rows(self, index):
+        """
+        Returns the list of timesteps (as row indexes) where a column is 0.
+        """
+        encoded = self._columns[index]
+        if encoded[0] == 'const':
+            return list(range(self.nrows)) if encoded[1] == 0 else []
+        if encoded[0] == 'runs':
+            rows = []
+            start = 0
+            for length, value in zip(encoded[1], encoded[2]):
+                if value == 0:
+                    rows.extend(range(start, start + length))
+                start += length
+            return rows
+        return [row for row, value in enumerate(encoded[1]) if value == 0]
+
+    def close(self):
+        """
+        Releases the memory map of the store, if any.
+        """
+        if self._mapped is not None:
+            for encoded in self._columns:
+                for block in encoded[1:]:
+                    if isinstance(block, memoryview):
+                        block.release()
+            self._columns = None
+            self._mapped.close()
+            self._mapped = None
+
+
+def parse_text(trajfile):
+    """
+    This function reads a .poe/.por file line by line and stores every
+    column as a float array instead of lists of strings.
+    Returns :
+        - names : The column names
+        - labels : The timestep labels
+        - columns : The list of float32 (or float64) arrays, one for each
+          column
+    """
+    with open(trajfile, 'r') as traj:
+        names = traj.readline().rstrip().split('\t')
+        labels = []
+        columns = [array.array('d') for _ in names]
+        for line in traj:
+            values = line.rstrip().split('\t')
+            if values == ['']:
+                continue
+            labels.append(values[0])
+            for index, value in enumerate(values):
+                columns[index].append(float(value))
+    return names, labels, [narrow_column(column) for column in columns]
+
+
+def convert_trajectory(trajfile, outfile=None):
+    """
+    This function converts a .poe/.por file into its columnar binary store.
+    Returns :
+        - outfile : The path of the generated store
+    File generated :
+        - <trajfile>.col : The binary store of the trajectory.
+    """
+    if outfile is None:
+        outfile = store_path(trajfile)
+    names, labels, columns = parse_text(trajfile)
+    header_columns = []
+    blocks = []
+    offset = 0
+    # Offsets are computed before writing, so that the header comes first.
+    # Every block is aligned on 8 bytes to be cast from the memory map.
+    for column in columns:
+        encoded = encode_column(column)
+        if encoded[0] == 'const':
+            header_columns.append({'kind': 'const', 'value': encoded[1]})
+            continue
+        header_columns.append({'kind': encoded[0], 'offset': offset,
+                               'type': column.typecode})
+        if encoded[0] == 'runs':
+            header_columns[-1]['nruns'] = len(encoded[1])
+        for block in encoded[1:]:
+            blocks.append(block)
+            offset += block.itemsize*len(block)
+            blocks.append(b'\0'*(-offset % 8))
+            offset += -offset % 8
+    source = os.stat(trajfile)
+    header = json.dumps({'source_size': source.st_size,
+                         'source_mtime': source.st_mtime,
+                         'names': names,
+                         'labels': labels,
+                         'columns': header_columns}).encode('utf-8')
+    # The data block is aligned on 8 bytes to be cast from the memory map
+    padding = -(len(MAGIC) + 8 + len(header)) % 8
+    with open(outfile, 'wb') as store:
+        store.write(MAGIC)
+        store.write(struct.pack('<Q', len(header)))
+        store.write(header)
+        store.write(b'\0'*padding)
+        for block in blocks:
+            store.write(block)
+    return outfile
+
+
+def read_store_header(storefile):
+    """
+    Reads the header index of a binary store.
+    Returns :
+        - header : The decoded header
+        - data_start : The position of the data block in the file
+    """
+    with open(storefile, 'rb') as store:
+        if store.read(len(MAGIC)) != MAGIC:
+            raise ValueError(storefile + " is not a trajectory store")
+        header_len = struct.unpack('<Q', store.read(8))[0]
+        header = json.loads(store.read(header_len).decode('utf-8'))
+    data_start = len(MAGIC) + 8 + header_len
+    data_start += -data_start % 8
+    return header, data_start
+
+
+def open_store(storefile):
+    """
+    Opens a binary store with a memory map.
+    Returns :
+        - A Trajectory whose dense columns are views over the memory map.
+    """
+    header, data_start = read_store_header(storefile)
+    nrows = len(header['labels'])
+    with open(storefile, 'rb') as store:
+        mapped = mmap.mmap(store.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    columns = []
+    for column in header['columns']:
+        if column['kind'] == 'const':
+            columns.append(('const', column['value']))
+            continue
+        start = data_start + column['offset']
+        size = array.array(column['type']).itemsize
+        if column['kind'] == 'runs':
+            nruns = column['nruns']
+            middle = start + 4*nruns
+            middle += -middle % 8
+            columns.append(('runs', view[start:start + 4*nruns].cast('I'),
+                            view[middle:middle + size*nruns]
+                            .cast(column['type'])))
+        else:
+            columns.append(('dense', view[start:start + size*nrows]
+                            .cast(column['type'])))
+    return Trajectory(header['names'], header['labels'], columns, mapped)
+
+
+def is_fresh(trajfile, storefile):
+    """
+    Checks that a store exists and was generated from the current version
+    of the trajectory file.
+    """
+    if not os.path.exists(storefile):
+        return False
+    if not os.path.exists(trajfile):
+        return True
+    header = read_store_header(storefile)[0]
+    source = os.stat(trajfile)
+    return header['source_size'] == source.st_size \
+        and header['source_mtime'] == source.st_mtime
+
+
+def parse_encoded(trajfile):
+    """
+    Parses a text trajectory and encodes its columns.
+    Returns :
+        - names, labels, columns : The arguments of a Trajectory
+    """
+    names, labels, columns = parse_text(trajfile)
+    return names, labels, [encode_column(column) for column in columns]
+
+
+def load_trajectory(trajfile, cache=None):
+    """
+    This function is the loader used by the analysis programs. It opens the
+    binary store of the trajectory if it is up to date, and parses the text
+    file otherwise, or takes it from the parse cache if one is given (see
+    parse_cache.py). The given file can also directly be a store.
+    Returns :
+        - A Trajectory object
+    """
+    if trajfile.endswith(STORE_EXT):
+        return open_store(trajfile)
+    if is_fresh(trajfile, store_path(trajfile)):
+        return open_store(store_path(trajfile))
+    if cache is not None:
+        return Trajectory(*cache.fetch('trajectory', trajfile, parse_encoded))
+    return Trajectory(*parse_encoded(trajfile))
+
+
+def iter_rows(trajfile):
+    """
+    This generator reads a trajectory one timestep after the other, from its
+    binary store if it is up to date and from the text file otherwise. Only
+    the current row is kept in memory.
+    Yields :
+        - The column names first, then for each timestep a tuple of its
+          label and the list of its values (the label column included)
+    """
+    if trajfile.endswith(STORE_EXT) \
+       or is_fresh(trajfile, store_path(trajfile)):
+        traj = open_store(trajfile if trajfile.endswith(STORE_EXT)
+                          else store_path(trajfile))
+        yield traj.names
+        iterators = [traj.iter_column(index)
+                     for index in range(len(traj.names))]
+        for label, values in zip(traj.labels, zip(*iterators)):
+            yield label, list(values)
+        iterators = None
+        traj.close()
+        return
+    with open(trajfile, 'r') as traj:
+        yield traj.readline().rstrip().split('\t')
+        for line in traj:
+            fields = line.rstrip().split('\t')
+            if fields == ['']:
+                continue
+            yield fields[0], [float(value) for value in fields]
+
+
+def read_names(trajfile):
+    """
+    Returns the column names of a trajectory without reading its values.
+    """
+    if trajfile.endswith(STORE_EXT):
+        return read_store_header(trajfile)[0]['names']
+    if is_fresh(trajfile, store_path(trajfile)):
+        return read_store_header(store_path(trajfile))[0]['names']
+    with open(trajfile, 'r') as traj:
+        return traj.readline().strip().split(sep='\t')
+
+
+def main():
+    """
+    Main function of the program. Converts every given trajectory file.
+    """
+    for trajfile in args_parse():
+        print(convert_trajectory(trajfile))
+
+if __name__ == "__main__":
+    main()
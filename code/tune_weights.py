@@ -0,0 +1,372 @@
+"""
+This module repeats the edit -> simulate -> analyze loop automatically until
+the simulation of a model no longer dies. At every iteration, candidate weight
+vectors are made from the best run so far (the ratio rules of change_weight,
+and the rescue of the elements missing when the run died), are simulated in
+parallel by a backend : the local simulator of simulate_model2.py, which
+gets the reweighted model directly, or any command such as BESS5, which gets
+it as a model2 file. The trivial rules (like
+NONE => NONE) are found in the model, and a run dies at the first timestep
+where no other rule can be applied. Every run is cached under the hash of
+its model and weights, so a weight vector of a model is never simulated
+twice.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import shlex
+import subprocess
+import analyze_model2
+import edit_model2
+import model2
+import simulate_model2
+
+LOG_FIELDS = ["Iteration", "Candidate", "Key", "Died", "Death",
+              "Possible_last", "Cached"]
+
+# Compiled model and backend shared with the worker processes
+SHARED = {}
+
+
+def args_parse():
+    """
+    Parses the given arguments when function is called.
+        - Model2 file
+        - Output and work directories, backend and stopping options
+    Returns :
+        - The parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("m2", metavar="MODEL2",
+                        help="Enter a valid model 2 file")
+    parser.add_argument("-o", "--outdir", default="./results/tuning",
+                        help="Directory of the tuned model and the log")
+    parser.add_argument("--work", default=None,
+                        help="Directory of the simulations and their cache \
+                        (<outdir>/runs by default)")
+    parser.add_argument("--command", default=None,
+                        help="Simulator command instead of the local one, \
+                        where {model2} is replaced by the model file and \
+                        {prefix} by the prefix of the Poe and Por files it \
+                        must write")
+    parser.add_argument("--max-iter", type=int, default=10,
+                        help="Maximum number of iterations")
+    parser.add_argument("--patience", type=int, default=3,
+                        help="Iterations without improvement before stopping")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of worker processes (all cores by \
+                        default)")
+    parser.add_argument("--first", type=float, default=500.0,
+                        help="Time of the first sample of the local simulator")
+    parser.add_argument("--interval", type=float, default=1000.0,
+                        help="Time between two samples of the local simulator")
+    parser.add_argument("--samples", type=int, default=21,
+                        help="Number of samples of the local simulator")
+    parser.add_argument("--method", choices=["ssa", "tau"], default="ssa",
+                        help="Algorithm of the local simulator")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed of the local simulator")
+    return parser.parse_args()
+
+
+class LocalBackend:
+    """
+    Simulates the candidates with simulate_model2.py.
+    """
+
+    def __init__(self, first=500.0, interval=1000.0, samples=21,
+                 method="ssa", seed=1):
+        self.options = (first, interval, samples, method, seed)
+
+    def signature(self):
+        """
+        Returns the text identifying the runs of this backend in the cache.
+        """
+        return "local " + " ".join(str(option) for option in self.options)
+
+    def run(self, model, prefix):
+        """
+        Simulates a compiled model.
+        Returns :
+            - poefile, porfile : The paths of the generated files
+        """
+        first, interval, samples, method, seed = self.options
+        return simulate_model2.simulate(model, prefix, first, interval,
+                                        samples, method, seed=seed)
+
+
+class CommandBackend:
+    """
+    Simulates the candidates with an external command, like BESS5. The
+    command must write <prefix>.poe and <prefix>.por.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def signature(self):
+        """
+        Returns the text identifying the runs of this backend in the cache.
+        """
+        return "command " + self.template
+
+    def run(self, model, prefix):
+        """
+        Writes the model in <prefix>.model2 and runs the command on it.
+        Returns :
+            - poefile, porfile : The paths of the generated files
+        """
+        modelfile = prefix + '.model2'
+        model.write_model2(modelfile)
+        command = self.template.format(model2=shlex.quote(modelfile),
+                                       prefix=shlex.quote(prefix))
+        subprocess.run(command, shell=True, check=True)
+        return prefix + '.poe', prefix + '.por'
+
+
+def model_digest(model):
+    """
+    Hashes the rules and the --INITIAL section of a model, which are the
+    same for all its weight vectors.
+    """
+    digest = hashlib.sha256()
+    for line in model.reactions + ['--INITIAL'] + model.initial_lines:
+        digest.update(line.encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+def weights_key(weights, signature, digest):
+    """
+    Hashes a weight vector with the backend that simulates it and the
+    digest of its model (see model_digest).
+    """
+    digest = hashlib.sha256((signature + '\n' + digest + '\n')
+                            .encode('utf-8'))
+    digest.update(','.join(repr(float(weight)) for weight
+                           in weights).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def run_death(model, poefile):
+    """
+    This function finds when a simulation dies, that is the first timestep
+    where only the trivial rules of the model can be applied.
+    Returns :
+        - death : The label of that timestep, None if the run does not die
+        - missing : The elements missing at that timestep (or at the last
+          one)
+        - nb_possible : The number of non trivial rules possible at that
+          timestep (or at the last one)
+    """
+    computed = analyze_model2.compute_possible_rules(model, poefile)
+    elements, missing_rows = computed[:2]
+    death, nb_possible = analyze_model2.find_death(model, computed)
+    labels = list(missing_rows)
+    row = labels.index(death) if death is not None else len(labels) - 1
+    missing = [elements[index] for index in missing_rows[labels[row]]]
+    return death, missing, nb_possible[row]
+
+
+def init_worker(shared):
+    """
+    Receives the compiled model and the backend in a worker process.
+    """
+    SHARED.update(shared)
+
+
+def evaluate(task):
+    """
+    Simulates a candidate weight vector and finds when it dies.
+    Returns :
+        - result : A dictionary with the key, death, missing elements and
+          number of possible rules of the run
+    """
+    key, weights, workdir = task
+    model = SHARED['model']
+    poefile = SHARED['backend'].run(model.with_weights(weights),
+                                    os.path.join(workdir, key))[0]
+    death, missing, nb_possible = run_death(model, poefile)
+    return {'key': key, 'death': death, 'missing': missing,
+            'possible_last': nb_possible}
+
+
+def score(result):
+    """
+    Orders the runs : the runs that do not die first, then the runs that die
+    later, then the runs with more possible rules.
+    """
+    if result['death'] is None:
+        return (1, 0.0, result['possible_last'])
+    return (0, float(result['death']), result['possible_last'])
+
+
+def rescue_weights(model, weights, missing, factor):
+    """
+    This function favours the production of the elements that were missing
+    when the run died : their producers are multiplied by factor and their
+    consumers divided by it. The trivial rules are left unchanged.
+    Returns :
+        - new_weights : The list of the new weights
+    """
+    new_weights = [float(weight) for weight in weights]
+    consumer_ptr, consumer_rules = model.consumers()
+    producer_ptr, producer_rules = model.producers()
+    boosted = set()
+    damped = set()
+    for name in missing:
+        elt = model.element_index.get(name)
+        if elt is None:
+            continue
+        boosted.update(producer_rules[producer_ptr[elt]:
+                                      producer_ptr[elt + 1]])
+        damped.update(consumer_rules[consumer_ptr[elt]:consumer_ptr[elt + 1]])
+    for rule in boosted.difference(damped):
+        if not model.is_trivial(rule):
+            new_weights[rule] *= factor
+    for rule in damped.difference(boosted):
+        if not model.is_trivial(rule):
+            new_weights[rule] /= factor
+    return new_weights
+
+
+def candidates(model, weights, result, dict_to_weigh):
+    """
+    This function makes the candidate weight vectors of the next iteration
+    from the best run so far.
+    Returns :
+        - A list of (name, weights) pairs
+    """
+    ratio = edit_model2.update_weights(model, weights, dict_to_weigh)
+    return [("ratio", ratio),
+            ("rescue", rescue_weights(model, weights, result['missing'], 2)),
+            ("rescue_x4", rescue_weights(model, weights, result['missing'],
+                                         4)),
+            ("ratio_rescue", rescue_weights(model, ratio, result['missing'],
+                                            2))]
+
+
+def load_cache(cachefile):
+    """
+    Reads the results of the previous runs, one JSON object per line.
+    """
+    cache = {}
+    if os.path.exists(cachefile):
+        with open(cachefile, 'r') as infile:
+            for line in infile:
+                if line.strip():
+                    result = json.loads(line)
+                    cache[result['key']] = result
+    return cache
+
+
+def tune_weights(model, backend, outdir, workdir=None, max_iter=10,
+                 patience=3, jobs=None):
+    """
+    This function tunes the weights of a model until its simulation no longer
+    dies, its best run stops improving for patience iterations, every
+    candidate of an iteration was already run, or max_iter iterations are
+    done.
+    Returns :
+        - best_weights : The weights of the best run
+        - best : The result of the best run
+    Files generated :
+        - tuned_model.model2 : The model2 file with the best weights.
+        - tuning_log.csv : Every candidate of every iteration.
+        - <workdir>/cache.jsonl : The results of all the runs, by key.
+    """
+    if workdir is None:
+        workdir = os.path.join(outdir, "runs")
+    os.makedirs(outdir, exist_ok=True)
+    os.makedirs(workdir, exist_ok=True)
+    cachefile = os.path.join(workdir, "cache.jsonl")
+    cache = load_cache(cachefile)
+    signature = backend.signature()
+    digest = model_digest(model)
+    dict_sugg_elt = edit_model2.element_ratios(model)
+    dict_to_weigh = edit_model2.rules_to_weigh(model, dict_sugg_elt)
+    log = []
+    best_weights = [float(weight) for weight in model.weights]
+    best = None
+    pending = [("initial", best_weights)]
+    stale = 0
+    # Keys simulated or read from the cache in this run, and keys whose
+    # candidates were already made
+    seen = set()
+    bases = set()
+    with multiprocessing.Pool(jobs, init_worker,
+                              ({'model': model, 'backend': backend},)) \
+            as pool, open(cachefile, 'a') as cache_out:
+        for iteration in range(max_iter + 1):
+            keys = [weights_key(weights, signature, digest)
+                    for _, weights in pending]
+            if seen.issuperset(keys):
+                # Nothing new to try
+                break
+            seen.update(keys)
+            tasks = []
+            for key, (_, weights) in zip(keys, pending):
+                if key not in cache and key not in [task[0] for task in tasks]:
+                    tasks.append((key, weights, workdir))
+            for result in pool.map(evaluate, tasks, chunksize=1):
+                cache[result['key']] = result
+                cache_out.write(json.dumps(result) + "\n")
+            cache_out.flush()
+            new_keys = set(task[0] for task in tasks)
+            improved = False
+            base = None
+            for key, (name, weights) in zip(keys, pending):
+                result = cache[key]
+                log.append({"Iteration": iteration, "Candidate": name,
+                            "Key": key, "Died": result['death'] is not None,
+                            "Death": result['death'] or 'NA',
+                            "Possible_last": result['possible_last'],
+                            "Cached": key not in new_keys})
+                if best is None or score(result) > score(best):
+                    best, best_weights = result, weights
+                    improved = True
+                if key not in bases and \
+                   (base is None or score(result) > score(base[1])):
+                    base = (key, result, weights)
+            stale = 0 if improved else stale + 1
+            if best['death'] is None or stale >= patience \
+               or iteration == max_iter or base is None:
+                break
+            # The next candidates are made from the best candidate of this
+            # iteration, which is the best run so far unless it did not
+            # improve : the search then goes on from there instead of
+            # making the same candidates again
+            bases.add(base[0])
+            pending = candidates(model, base[2], base[1], dict_to_weigh)
+    model.write_model2(os.path.join(outdir, "tuned_model.model2"),
+                       best_weights)
+    with open(os.path.join(outdir, "tuning_log.csv"), "w", newline='') \
+         as logfile:
+        writer = csv.DictWriter(logfile, fieldnames=LOG_FIELDS)
+        writer.writeheader()
+        writer.writerows(log)
+    return best_weights, best
+
+
+def main():
+    """
+    Main function of the program. Tunes the weights of the model.
+    """
+    args = args_parse()
+    model = model2.load_model2(args.m2)
+    if args.command is not None:
+        backend = CommandBackend(args.command)
+    else:
+        backend = LocalBackend(args.first, args.interval, args.samples,
+                               args.method, args.seed)
+    best = tune_weights(model, backend, args.outdir, args.work,
+                        args.max_iter, args.patience, args.jobs)[1]
+    if best['death'] is None:
+        print("The tuned model no longer dies")
+    else:
+        print("The best run still dies at " + best['death'])
+
+if __name__ == "__main__":
+    main()
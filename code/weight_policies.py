@@ -0,0 +1,191 @@
+"""
+This module defines the policies that change the weight of a rule from the
+mean ratios of its reactives and products (computed by rules_to_weigh in
+edit_model2.py). A policy gives a factor for every (mean reactive ratio,
+mean product ratio) pair. Many rules share the same pair, so the pairs of a
+model are gathered once and every policy is evaluated on the distinct pairs
+only, then spread back over the rules.
+New policies are made by subclassing WeightPolicy, or by wrapping a
+function(mean_reac_ratio, mean_prod_ratio) with FunctionPolicy. The policies
+are sent to the worker processes of sweep_weights.py, so they must be
+picklable : the wrapped functions are defined at the top level of a module
+(not lambdas or nested functions).
+"""
+import abc
+import array
+import sys
+
+# Weight of the rules that do not change the state, like NONE => NONE
+NONE_WEIGHT = '0.001'
+
+
+class WeightPolicy(abc.ABC):
+    """
+    The base class of the policies. Subclasses define factor and name.
+    """
+    name = "policy"
+
+    @abc.abstractmethod
+    def factor(self, mean_reac_ratio, mean_prod_ratio):
+        """
+        Returns the factor applied to the weight of a rule.
+        """
+
+    def description(self):
+        """
+        Returns the class of the policy and its parameters, which identify
+        the factors it gives.
+        """
+        return (type(self).__module__ + '.' + type(self).__qualname__,
+                sorted(vars(self).items()))
+
+    def factors(self, pairs):
+        """
+        Returns the factors of a list of (mean reactive ratio, mean product
+        ratio) pairs.
+        """
+        return array.array('d', (self.factor(mean_reac, mean_prod)
+                                 for mean_reac, mean_prod in pairs))
+
+
+class ThresholdPolicy(WeightPolicy):
+    """
+    The policy of change_weight, with its threshold and factors as
+    parameters. With the default values (threshold 1, factors 4 and 2) :
+        - reactives above 1 and products not : *4, the other way : /4
+        - both below 1 : *2 if the reactives are higher, /2 if lower
+        - both above 1 : /2 if the reactives are higher, *2 if lower
+        - otherwise the weight is not changed
+    """
+
+    def __init__(self, threshold=1.0, strong=4.0, weak=2.0):
+        self.threshold = threshold
+        self.strong = strong
+        self.weak = weak
+        self.name = 'threshold_t{0:g}_s{1:g}_w{2:g}'.format(threshold,
+                                                            strong, weak)
+
+    def factor(self, mean_reac_ratio, mean_prod_ratio):
+        threshold = self.threshold
+        if mean_reac_ratio > threshold and mean_prod_ratio <= threshold:
+            return self.strong
+        if mean_reac_ratio <= threshold and mean_prod_ratio > threshold:
+            return 1/self.strong
+        if mean_reac_ratio < threshold and mean_prod_ratio < threshold:
+            if mean_reac_ratio > mean_prod_ratio:
+                return self.weak
+            if mean_reac_ratio < mean_prod_ratio:
+                return 1/self.weak
+        if mean_reac_ratio > threshold and mean_prod_ratio > threshold:
+            if mean_reac_ratio > mean_prod_ratio:
+                return 1/self.weak
+            if mean_reac_ratio < mean_prod_ratio:
+                return self.weak
+        return 1
+
+
+class ScorePolicy(WeightPolicy):
+    """
+    A continuous policy : the factor is (mean reactive ratio / mean product
+    ratio) to the power exponent, bounded between 1/limit and limit. A rule
+    without product ratio gets the limit.
+    """
+
+    def __init__(self, exponent=1.0, limit=4.0):
+        self.exponent = exponent
+        self.limit = limit
+        self.name = 'score_e{0:g}_l{1:g}'.format(exponent, limit)
+
+    def factor(self, mean_reac_ratio, mean_prod_ratio):
+        if mean_prod_ratio <= 0:
+            return self.limit if mean_reac_ratio > 0 else 1
+        if mean_reac_ratio <= 0:
+            return 1/self.limit
+        value = (mean_reac_ratio/mean_prod_ratio)**self.exponent
+        return min(max(value, 1/self.limit), self.limit)
+
+
+class FunctionPolicy(WeightPolicy):
+    """
+    Wraps a function(mean_reac_ratio, mean_prod_ratio) returning a factor.
+    The function must be defined at the top level of a module, to be
+    pickled by reference.
+    """
+
+    def __init__(self, name, function):
+        module = sys.modules.get(getattr(function, '__module__', None))
+        if getattr(module, getattr(function, '__qualname__', ''), None) \
+           is not function:
+            raise ValueError("The function of the policy " + name
+                             + " must be defined at the top level of a "
+                             "module")
+        self.name = name
+        self.function = function
+
+    def description(self):
+        return (type(self).__module__ + '.' + type(self).__qualname__,
+                [('function', self.function.__module__ + '.'
+                  + self.function.__qualname__), ('name', self.name)])
+
+    def factor(self, mean_reac_ratio, mean_prod_ratio):
+        return self.function(mean_reac_ratio, mean_prod_ratio)
+
+
+DEFAULT_POLICY = ThresholdPolicy()
+
+
+def ratio_pairs(model, dict_to_weigh):
+    """
+    This function gathers the distinct (mean reactive ratio, mean product
+    ratio) pairs of the rules of a model.
+    Returns :
+        - pairs : The distinct pairs
+        - pair_index : For every rule, the index of its pair
+    """
+    pairs = []
+    position = {}
+    pair_index = array.array('l')
+    for rule in model.names:
+        pair = (dict_to_weigh[rule][0], dict_to_weigh[rule][1])
+        if pair not in position:
+            position[pair] = len(pairs)
+            pairs.append(pair)
+        pair_index.append(position[pair])
+    return pairs, pair_index
+
+
+def policy_weights(model, weights, pairs, pair_index, policy, none_weight):
+    """
+    This function applies a policy to the weights of a model. The weights
+    that are not changed are kept as given, and the trivial rules (like
+    NONE => NONE) get none_weight.
+    Returns :
+        - new_weights : The list of the new weights
+        - factors : The factor of every rule (None for the trivial rules)
+    """
+    pair_factors = policy.factors(pairs)
+    new_weights = []
+    factors = []
+    for rule, index in enumerate(pair_index):
+        if model.is_trivial(rule):
+            new_weights.append(float(none_weight))
+            factors.append(None)
+        else:
+            factor = pair_factors[index]
+            new_weights.append(weights[rule] if factor == 1
+                               else float(weights[rule])*factor)
+            factors.append(factor)
+    return new_weights, factors
+
+
+def policy_grid(thresholds, strongs, weaks, exponents=(), limits=()):
+    """
+    Builds the threshold policies of every combination of thresholds and
+    factors, and the score policies of every exponent and limit.
+    """
+    policies = [ThresholdPolicy(threshold, strong, weak)
+                for threshold in thresholds for strong in strongs
+                for weak in weaks]
+    policies.extend(ScorePolicy(exponent, limit)
+                    for exponent in exponents for limit in limits)
+    return policies
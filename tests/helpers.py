@@ -0,0 +1,76 @@
+"""
+Shared fixtures of the tests : the paths of the programs and of the example
+files, and a test case working in a temporary directory, where the model2,
+Poe and Por files of a test are written and the programs are run.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CODE_DIR = os.path.join(ROOT, 'code')
+SIMULATION_FILES = os.path.join(ROOT, 'simulation_files')
+ARCHIVE = os.path.join(ROOT, 'results', 'archive')
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+# pylint: disable=wrong-import-position
+import model2
+
+
+class TempDirTestCase(unittest.TestCase):
+    """
+    A test case with its own temporary directory, removed at its end.
+    """
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dir = tmpdir.name
+
+    def path(self, *names):
+        """
+        Returns the path of a file of the temporary directory.
+        """
+        return os.path.join(self.dir, *names)
+
+    def write(self, name, text):
+        """
+        Writes a file in the temporary directory.
+        Returns :
+            - path : The path of the file
+        """
+        path = self.path(name)
+        with open(path, 'w') as outfile:
+            outfile.write(text)
+        return path
+
+    def read(self, *names):
+        """
+        Returns the text of a file of the temporary directory.
+        """
+        with open(self.path(*names)) as infile:
+            return infile.read()
+
+    def load_model(self, text, name='model.model2'):
+        """
+        Writes a model2 file and compiles it.
+        """
+        return model2.load_model2(self.write(name, text))
+
+    def run_program(self, program, *args, cwd=None):
+        """
+        Runs one of the programs of ./code, in the temporary directory by
+        default, and fails the test if it fails.
+        Returns :
+            - The standard output of the program
+        """
+        result = subprocess.run([sys.executable,
+                                 os.path.join(CODE_DIR, program)]
+                                + list(args),
+                                cwd=cwd or self.dir, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
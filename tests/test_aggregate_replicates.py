@@ -0,0 +1,75 @@
+"""
+Tests of the summary of the replicates of a model : the online accumulators
+give the statistics computed on all the replicates at once.
+"""
+import statistics
+import unittest
+import helpers
+import aggregate_replicates
+
+MODEL = ('A => B\t1.0\n'
+         'B => C\t1.0\n'
+         '--INITIAL\n'
+         'A\t1\n')
+# Three replicates : A is depleted at 2.0 in the second one, B at 2.0 and C
+# at 1.0 in the first two
+REPLICATES = (((1.0, 4.0, 0.0), (2.0, 0.0, 3.0)),
+              ((3.0, 2.0, 0.0), (0.0, 0.0, 0.0)),
+              ((5.0, 1.0, 1.0), (6.0, 2.0, 1.0)))
+
+
+class AggregateTest(helpers.TempDirTestCase):
+    """
+    Replicates written by hand.
+    """
+
+    def setUp(self):
+        helpers.TempDirTestCase.setUp(self)
+        self.aggregator = aggregate_replicates.ReplicateAggregator(
+            self.load_model(MODEL))
+        for run, rows in enumerate(REPLICATES):
+            self.aggregator.add_replicate(self.write(
+                'run' + str(run) + '.poe',
+                '#Tps\t#Evts\tA\tB\tC\n'
+                + ''.join(str(time + 1.0) + '\t1\t'
+                          + '\t'.join(str(value) for value in values) + '\n'
+                          for time, values in enumerate(rows))))
+
+    def summary(self):
+        """
+        Returns the lines of replicates_summary.tsv, by timestep and element.
+        """
+        self.aggregator.write_summary(self.dir)
+        return dict(((fields[0], fields[1]), fields[2:]) for fields in
+                    (line.split('\t') for line in
+                     self.read('replicates_summary.tsv').splitlines()[1:]))
+
+    def test_mean_and_deviation(self):
+        summary = self.summary()
+        for row, time in enumerate(('1.0', '2.0')):
+            for elt, name in enumerate('ABC'):
+                values = [rows[row][elt] for rows in REPLICATES]
+                fields = summary[(time, name)]
+                self.assertEqual(fields[0], '3')
+                self.assertAlmostEqual(float(fields[1]),
+                                       statistics.mean(values), places=6)
+                self.assertAlmostEqual(float(fields[2]),
+                                       statistics.stdev(values), places=6)
+                self.assertAlmostEqual(float(fields[5]),
+                                       values.count(0.0)/3, places=3)
+
+    def test_depletion_and_death(self):
+        self.aggregator.write_depletion_times(self.dir)
+        self.aggregator.write_rule_death(self.dir)
+        self.assertEqual(self.read('depletion_times.csv').splitlines()[1:],
+                         ['A,33.3,2.000000,2.000000,2.000000',
+                          'B,66.7,2.000000,2.000000,2.000000',
+                          'C,66.7,1.000000,1.000000,1.000000'])
+        # A is missing at the end of the second run, B of the first two
+        self.assertEqual([line.split(',')[:2] for line in
+                          self.read('rules_death.csv').splitlines()[1:]],
+                         [['R0', '33.3'], ['R1', '66.7']])
+
+
+if __name__ == "__main__":
+    unittest.main()
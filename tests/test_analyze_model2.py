@@ -0,0 +1,97 @@
+"""
+Tests of analyze_model2.py : reading the .poe and .por files row by row
+gives the same files as the default mode, and the node annotation file of
+edit_model2.py can be given compressed.
+"""
+import gzip
+import os
+import unittest
+import helpers
+import model2
+import simulate_model2
+
+TEXT_FILES = ("rules_applied.txt", "possible_rules.txt", "lost_reactives.txt",
+              "missing_elts_summary.txt")
+
+
+class StreamTest(helpers.TempDirTestCase):
+    """
+    analyze_model2.py with and without --stream.
+    """
+
+    def analyze(self, name, modelfile, poefile, porfile, *options):
+        """
+        Runs analyze_model2.py in its own directory.
+        Returns :
+            - The text of the generated files
+        """
+        os.makedirs(self.path(name, "results"))
+        self.run_program("analyze_model2.py", modelfile, poefile, porfile,
+                         os.path.join(helpers.ARCHIVE, "annot_node.csv"),
+                         *options, cwd=self.path(name))
+        return dict((text_file, self.read(name, "results", text_file))
+                    for text_file in TEXT_FILES)
+
+    def assert_same_as_default(self, modelfile, poefile, porfile):
+        """
+        Checks that both modes write the same files.
+        """
+        self.assertEqual(self.analyze("stream", modelfile, poefile, porfile,
+                                      "--stream"),
+                         self.analyze("default", modelfile, poefile, porfile))
+
+    def test_archive(self):
+        self.assert_same_as_default(
+            os.path.join(helpers.ARCHIVE, "e_coli_core_new.model2"),
+            os.path.join(helpers.ARCHIVE, "test_model_ecoli_new.poe"),
+            os.path.join(helpers.ARCHIVE, "test_model_ecoli_new.por"))
+
+    def test_first_row_at_zero(self):
+        modelfile = os.path.join(helpers.SIMULATION_FILES,
+                                 "e_coli_core.model2")
+        poefile, porfile = simulate_model2.simulate(
+            model2.load_model2(modelfile), self.path("run"), first=0.0,
+            samples=4, seed=1)
+        self.assert_same_as_default(modelfile, poefile, porfile)
+        self.assertEqual(self.read("stream", "results", "possible_rules.txt")
+                         .count("Timestep : "), 4)
+
+
+class GzipHandoffTest(helpers.TempDirTestCase):
+    """
+    edit_model2.py --gzip followed by analyze_model2.py.
+    """
+
+    def analyze(self, annot_node, *options):
+        """
+        Analyzes the example simulation with a node annotation file.
+        Returns :
+            - The text of missing_elts_summary.txt
+        """
+        self.run_program("analyze_model2.py",
+                         os.path.join(helpers.ARCHIVE,
+                                      "e_coli_core_new.model2"),
+                         os.path.join(helpers.ARCHIVE,
+                                      "test_model_ecoli_new.poe"),
+                         os.path.join(helpers.ARCHIVE,
+                                      "test_model_ecoli_new.por"),
+                         annot_node, *options)
+        return self.read("results", "missing_elts_summary.txt")
+
+    def test_compressed_node_annotations(self):
+        os.makedirs(self.path("results"))
+        self.run_program("edit_model2.py",
+                         os.path.join(helpers.SIMULATION_FILES,
+                                      "e_coli_core.model2"),
+                         os.path.join(helpers.SIMULATION_FILES,
+                                      "test_model_ecoli.poe"), "--gzip")
+        annot_node = self.path("results", "annot_node.csv.gz")
+        with gzip.open(annot_node, "rt") as infile:
+            expected = self.analyze(self.write("annot_node.csv",
+                                               infile.read()))
+        self.assertEqual(self.analyze(annot_node), expected)
+        self.assertEqual(self.analyze(annot_node, "--cache-dir",
+                                      self.path("cache")), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests of the analysis of many simulations at once : every run gets its own
+folder, with the files analyze_model2.py writes for it alone.
+"""
+import os
+import unittest
+import helpers
+import batch_analysis
+import model2
+import simulate_model2
+
+
+class RunNamesTest(unittest.TestCase):
+    """
+    Names of the runs folders.
+    """
+
+    def test_unique_names(self):
+        runs = [('m', os.path.join(directory, poe), 'r', None)
+                for directory, poe in (('x', 'a.poe'), ('y', 'a.poe'),
+                                       ('z', 'a_2.poe'))]
+        self.assertEqual(batch_analysis.run_names(runs),
+                         ['a', 'a_2', 'a_2_2'])
+
+
+class BatchTest(helpers.TempDirTestCase):
+    """
+    Two replicates of the example model, analyzed on two processes.
+    """
+
+    def test_same_as_single_runs(self):
+        modelfile = os.path.join(helpers.SIMULATION_FILES,
+                                 "e_coli_core.model2")
+        model = model2.load_model2(modelfile)
+        runs = []
+        os.makedirs(self.path('sims'))
+        for seed in (1, 2):
+            poefile, porfile = simulate_model2.simulate(
+                model, self.path('sims', 'run' + str(seed)), samples=4,
+                seed=seed)
+            runs.append((modelfile, poefile, porfile, None))
+            os.makedirs(self.path('single' + str(seed), 'results'))
+            self.run_program("analyze_model2.py", modelfile, poefile,
+                             porfile, os.path.join(helpers.ARCHIVE,
+                                                   "annot_node.csv"),
+                             cwd=self.path('single' + str(seed)))
+        summary = batch_analysis.batch_analysis(runs, self.path('batch'),
+                                                jobs=2)
+        self.assertEqual([row["Run"] for row in summary], ['run1', 'run2'])
+        self.assertEqual([row["Timesteps"] for row in summary], [4, 4])
+        for seed in (1, 2):
+            for text_file in ("rules_applied.txt", "possible_rules.txt",
+                              "lost_reactives.txt"):
+                self.assertEqual(
+                    self.read('batch', 'run' + str(seed), text_file),
+                    self.read('single' + str(seed), 'results', text_file))
+        self.assertTrue(os.path.exists(self.path('batch', 'summary.csv')))
+
+
+if __name__ == "__main__":
+    unittest.main()
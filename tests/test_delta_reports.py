@@ -0,0 +1,73 @@
+"""
+Tests of the delta reports : every timestep is rebuilt from its checkpoint
+and the changes after it, from the .npz archive and from the JSON-lines
+file, and a report converts back into the text file.
+"""
+import random
+import unittest
+import helpers
+import delta_reports
+
+NAMES = ['E' + str(index) for index in range(40)]
+
+
+class RoundTripTest(helpers.TempDirTestCase):
+    """
+    A report of 30 random sets, with a checkpoint every 4 timesteps.
+    """
+
+    def setUp(self):
+        helpers.TempDirTestCase.setUp(self)
+        rand = random.Random(0)
+        self.sets = []
+        mask = 0
+        for _ in range(30):
+            for _ in range(3):
+                mask ^= 1 << rand.randrange(len(NAMES))
+            self.sets.append(mask)
+        self.labels = ['{0:.6f}'.format(500.0 + 1000*row)
+                       for row in range(len(self.sets))]
+        writer = delta_reports.DeltaWriter(self.path('lost'),
+                                           'lost_reactives', NAMES, every=4)
+        for label, mask in zip(self.labels, self.sets):
+            writer.add(label, mask)
+        self.paths = writer.close()
+
+    def expected(self, row):
+        """
+        Returns the label and sorted indexes of a timestep.
+        """
+        return (self.labels[row], [index for index in range(len(NAMES))
+                                   if self.sets[row] >> index & 1])
+
+    def test_state_and_iteration(self):
+        for path in self.paths:
+            report = delta_reports.open_delta(path)
+            self.assertEqual(report.nrows, len(self.sets))
+            for row in (29, 0, 5, 8, 3):
+                self.assertEqual(tuple(report.state(row)),
+                                 self.expected(row))
+            self.assertEqual([(label, list(indexes))
+                              for label, indexes in report],
+                             [self.expected(row)
+                              for row in range(len(self.sets))])
+
+    def test_rows_out_of_range(self):
+        for path in self.paths:
+            report = delta_reports.open_delta(path)
+            for row in (-1, len(self.sets)):
+                with self.assertRaises(IndexError):
+                    report.state(row)
+
+    def test_text(self):
+        expected = ''.join(delta_reports.lost_reactives_text(
+            label, [NAMES[index] for index in indexes])
+                           for label, indexes in map(self.expected,
+                                                     range(len(self.sets))))
+        for path in self.paths:
+            delta_reports.delta_to_text(path, self.path('lost.txt'))
+            self.assertEqual(self.read('lost.txt'), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
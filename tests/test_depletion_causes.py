@@ -0,0 +1,52 @@
+"""
+Tests of the sorting of the newly missing elements into root causes and
+consequences.
+"""
+import unittest
+import helpers
+import depletion_causes
+
+# A is only produced by R0, B only by R1 (which consumes A), C only by R2
+# (which consumes B). D and E only produce each other.
+MODEL = ('S => A\t1.0\n'
+         'A => B\t1.0\n'
+         'B => C\t1.0\n'
+         'D => E\t1.0\n'
+         'E => D\t1.0\n'
+         '--INITIAL\n'
+         'S\t1\n')
+
+
+class CascadeTest(helpers.TempDirTestCase):
+    """
+    Elements missing since the same timestep.
+    """
+
+    def setUp(self):
+        helpers.TempDirTestCase.setUp(self)
+        self.model = self.load_model(MODEL)
+        self.index = depletion_causes.DepletionIndex(self.model)
+
+    def ids(self, *names):
+        """
+        Returns the ids of elements.
+        """
+        return [self.model.element_index[name] for name in names]
+
+    def test_same_timestep_chain(self):
+        elt_a, elt_b, elt_c = self.ids('A', 'B', 'C')
+        # C is listed first, it is still starved by A through B
+        elt_cause = self.index.cascade([[], [elt_c, elt_b, elt_a]])[1]
+        self.assertEqual(elt_cause[elt_a], elt_a)
+        self.assertEqual(elt_cause[elt_b], elt_a)
+        self.assertEqual(elt_cause[elt_c], elt_a)
+
+    def test_cycle_keeps_a_root(self):
+        elt_d, elt_e = self.ids('D', 'E')
+        elt_cause = self.index.cascade([[], [elt_e, elt_d]])[1]
+        self.assertEqual(elt_cause[elt_d], elt_e)
+        self.assertEqual(elt_cause[elt_e], elt_e)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+"""
+Tests of the following of a simulation : the uses of the rules are written in
+the output directory, which is created if needed.
+"""
+import os
+import unittest
+import helpers
+import simulate_model2
+
+MODEL = ('A => B\t1.0\n'
+         '--INITIAL\n'
+         'A\t5\n')
+
+
+class OutdirTest(helpers.TempDirTestCase):
+    """
+    follow_simulation.py on a finished simulation.
+    """
+
+    def test_rules_fired_in_outdir(self):
+        model = self.load_model(MODEL)
+        poefile, porfile = simulate_model2.simulate(model, self.path('run'),
+                                                    samples=3, seed=0)
+        self.run_program("follow_simulation.py", self.path('model.model2'),
+                         poefile, porfile, "--interval", "0", "--timeout",
+                         "0", "-o", self.path('out', 'follow'))
+        self.assertTrue(self.read('out', 'follow', 'rules_fired.csv')
+                        .startswith("Rule,Nb_fired\n"))
+        self.assertFalse(os.path.exists(self.path('results')))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Tests of the incremental mode of edit_model2.py : after any change of the
+model2 file, the files are those of a full edit, and a state made with
+another weight policy is not reused.
+"""
+import os
+import unittest
+import helpers
+import edit_model2
+import incremental_edit
+import weight_policies
+
+MODELFILE = os.path.join(helpers.SIMULATION_FILES, "e_coli_core.model2")
+POEFILE = os.path.join(helpers.SIMULATION_FILES, "test_model_ecoli.poe")
+OUTPUT_FILES = ("cytoscape_network.sif", "annot_node.csv", "annot_edge.csv",
+                "updated_modelfile.model2")
+
+
+class IncrementalTest(helpers.TempDirTestCase):
+    """
+    Successive edits of the example model.
+    """
+
+    def setUp(self):
+        helpers.TempDirTestCase.setUp(self)
+        with open(MODELFILE) as infile:
+            self.lines = infile.read().splitlines(True)
+        os.makedirs(self.path('incremental'))
+
+    def edit(self, *changes):
+        """
+        Writes the example model with some lines changed, and edits it
+        incrementally and fully.
+        Returns :
+            - The number of rules recomputed by the incremental edit
+        """
+        lines = list(self.lines)
+        for index, line in changes:
+            lines[index] = line
+        modelfile = self.write('model.model2', ''.join(lines))
+        nb_recomputed = incremental_edit.incremental_edit(
+            modelfile, POEFILE, self.path('incremental'))[1]
+        os.makedirs(self.path('full', 'results'), exist_ok=True)
+        self.run_program("edit_model2.py", modelfile, POEFILE,
+                         cwd=self.path('full'))
+        for name in OUTPUT_FILES:
+            self.assertEqual(self.read('incremental', name),
+                             self.read('full', 'results', name), name)
+        return nb_recomputed
+
+    def test_same_as_full_edit(self):
+        nb_rules = self.edit()
+        reaction, weight = self.lines[3].rstrip('\n').split('\t')
+        self.assertLess(self.edit((3, reaction + '\t'
+                                   + str(float(weight)*3) + '\n')), nb_rules)
+        # A reactive of the first rule is replaced
+        reaction = self.lines[0].split('\t')[0]
+        first = reaction.split()[0]
+        other = self.lines[5].split('\t')[0].split()[0]
+        self.edit((0, self.lines[0].replace(first, other, 1)))
+
+    def test_other_policy(self):
+        nb_rules = self.edit()
+        policy = weight_policies.ScorePolicy(0.5)
+        self.assertEqual(incremental_edit.incremental_edit(
+            MODELFILE, POEFILE, self.path('incremental'), policy=policy)[1],
+                         nb_rules)
+        model = edit_model2.list_all_rules(MODELFILE)
+        weights = edit_model2.new_weights(
+            model, edit_model2.rules_to_weigh(
+                model, edit_model2.sugg_element(
+                    edit_model2.list_all_elts(POEFILE), model)), policy)[1]
+        self.assertEqual([line.split('\t')[1] for line in
+                          self.read('incremental', "updated_modelfile.model2")
+                          .splitlines()[:len(weights)]],
+                         [str(float(weight)) for weight in weights])
+
+
+if __name__ == "__main__":
+    unittest.main()
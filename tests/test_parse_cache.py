@@ -0,0 +1,75 @@
+"""
+Tests of the cache of the parsed files : an entry is found by the content of
+its file, and the least recently used entries are removed with their
+digests when the cache is full.
+"""
+import json
+import os
+import shutil
+import unittest
+import helpers
+import parse_cache
+
+
+class ParseCacheTest(helpers.TempDirTestCase):
+    """
+    A cache of at most two entries of about 1 kB.
+    """
+
+    def setUp(self):
+        helpers.TempDirTestCase.setUp(self)
+        self.cache = parse_cache.ParseCache(self.path('cache'), 2500)
+        self.built = []
+
+    def build(self, path):
+        """
+        Parses a file, remembering that it was built.
+        """
+        self.built.append(os.path.basename(path))
+        with open(path) as infile:
+            return infile.read()*100
+
+    def index(self):
+        """
+        Returns the base names of the files of the digest index.
+        """
+        with open(self.path('cache', parse_cache.DIGEST_INDEX)) as index:
+            return sorted(os.path.basename(path) for path in json.load(index))
+
+    def test_hit_by_content(self):
+        first = self.write('first.txt', 'content\n')
+        self.assertEqual(self.cache.fetch('text', first, self.build),
+                         'content\n'*100)
+        copy = self.path('copy.txt')
+        shutil.copy(first, copy)
+        self.assertEqual(self.cache.fetch('text', copy, self.build),
+                         'content\n'*100)
+        self.assertEqual(self.built, ['first.txt'])
+        self.write('first.txt', 'changed\n')
+        self.cache.fetch('text', first, self.build)
+        self.assertEqual(self.built, ['first.txt', 'first.txt'])
+
+    def test_eviction_prunes_the_index(self):
+        paths = [self.write(name, name*2) for name in
+                 ('a.txt', 'b.txt', 'c.txt')]
+        for path in paths[:2]:
+            self.cache.fetch('text', path, self.build)
+        # a.txt is used again, so b.txt is the least recently used
+        os.utime(self.cache.entry_path('text', self.cache.digest(paths[0])),
+                 (0, 1e9 + 10))
+        os.utime(self.cache.entry_path('text', self.cache.digest(paths[1])),
+                 (0, 1e9))
+        self.cache.fetch('text', paths[2], self.build)
+        self.assertEqual(len(self.cache.entries()), 2)
+        self.assertEqual(self.index(), ['a.txt', 'c.txt'])
+        reopened = parse_cache.ParseCache(self.path('cache'), 2500)
+        reopened.fetch('text', paths[0], self.build)
+        self.assertEqual(self.built, ['a.txt', 'b.txt', 'c.txt'])
+        reopened.clear()
+        self.assertEqual(reopened.entries(), [])
+        self.assertFalse(os.path.exists(self.path('cache',
+                                                  parse_cache.DIGEST_INDEX)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Tests of the pipeline : the edit and the analysis computed in one process,
+with the edit given to the analysis in memory, give the files of
+edit_model2.py and analyze_model2.py, and nothing is written unless asked
+for.
+"""
+import os
+import unittest
+import helpers
+import model2
+import pipeline
+import simulate_model2
+
+MODELFILE = os.path.join(helpers.SIMULATION_FILES, "e_coli_core.model2")
+POEFILE = os.path.join(helpers.SIMULATION_FILES, "test_model_ecoli.poe")
+EDIT_FILES = ("cytoscape_network.sif", "annot_node.csv", "annot_edge.csv",
+              "updated_modelfile.model2")
+ANALYSIS_FILES = ("rules_applied.txt", "possible_rules.txt",
+                  "lost_reactives.txt", "missing_elts_summary.txt")
+
+
+class PipelineTest(helpers.TempDirTestCase):
+    """
+    The example model edited, simulated locally and analyzed.
+    """
+
+    def setUp(self):
+        helpers.TempDirTestCase.setUp(self)
+        os.makedirs(self.path('cli', 'results'))
+        self.run_program("edit_model2.py", MODELFILE, POEFILE,
+                         cwd=self.path('cli'))
+        self.edited = self.path('cli', 'results', 'updated_modelfile.model2')
+        self.poefile, self.porfile = simulate_model2.simulate(
+            model2.load_model2(self.edited), self.path('run'), samples=4,
+            seed=1)
+        self.run_program("analyze_model2.py", self.edited, self.poefile,
+                         self.porfile,
+                         self.path('cli', 'results', 'annot_node.csv'),
+                         cwd=self.path('cli'))
+
+    def test_in_memory(self):
+        os.makedirs(self.path('memory'))
+        cwd = os.getcwd()
+        os.chdir(self.path('memory'))
+        self.addCleanup(os.chdir, cwd)
+        pipe = pipeline.Pipeline(MODELFILE, POEFILE)
+        self.assertEqual(pipe.done(), [])
+        self.assertEqual(''.join(pipe.annot_lines),
+                         self.read('cli', 'results', 'annot_node.csv'))
+        analysis = pipe.analyze(self.poefile, self.porfile)
+        self.assertEqual(''.join(analysis.missing_summary),
+                         self.read('cli', 'results',
+                                   'missing_elts_summary.txt'))
+        self.assertIn("edited_model", pipe.done())
+        self.assertEqual(os.listdir(self.path('memory')), [])
+        with self.assertRaises(ValueError):
+            analysis.write_missing_summary()
+
+    def test_written_files(self):
+        pipe = pipeline.Pipeline(MODELFILE, POEFILE, self.path('pipe'))
+        pipe.write_all()
+        pipe.analyze(self.poefile, self.porfile).write_all()
+        for name in EDIT_FILES + ANALYSIS_FILES:
+            self.assertEqual(self.read('pipe', name),
+                             self.read('cli', 'results', name), name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Tests of the measures of the stages : the JSON metrics file goes to the
+results directory by default, with the peak resident memory of the run and
+the measures of every stage.
+"""
+import json
+import os
+import unittest
+import helpers
+import run_metrics
+
+
+class MetricsTest(helpers.TempDirTestCase):
+    """
+    Metrics of a run of two stages.
+    """
+
+    def run_stages(self, metrics):
+        """
+        Measures two stages and writes the metrics.
+        """
+        with metrics.stage("build") as stage:
+            stage.rows = 10
+            data = [0]*100000
+        with metrics.stage("sum") as stage:
+            stage.rules = len(data)
+            sum(data)
+        metrics.write()
+
+    def test_trace_memory_in_results_dir(self):
+        self.run_stages(run_metrics.Metrics(
+            "test", trace_memory=True, results_dir=self.path("results")))
+        with open(self.path("results", "metrics.json")) as infile:
+            measures = json.load(infile)
+        self.assertEqual([stage['stage'] for stage in measures['stages']],
+                         ["build", "sum"])
+        build, total = measures['stages']
+        self.assertGreater(build['traced_peak'], 100000*8)
+        self.assertEqual(build['rows'], 10)
+        self.assertEqual(total['rules'], 100000)
+        # The peak resident memory is the one of the process, given once
+        self.assertIn('peak_rss', measures)
+        self.assertNotIn('peak_rss', build)
+
+    def test_disabled(self):
+        self.run_stages(run_metrics.Metrics(
+            "test", results_dir=self.path("results")))
+        self.assertFalse(os.path.exists(self.path("results")))
+
+    def test_program_option(self):
+        os.makedirs(self.path("results"))
+        self.run_program("analyze_model2.py",
+                         os.path.join(helpers.ARCHIVE,
+                                      "e_coli_core_new.model2"),
+                         os.path.join(helpers.ARCHIVE,
+                                      "test_model_ecoli_new.poe"),
+                         os.path.join(helpers.ARCHIVE,
+                                      "test_model_ecoli_new.por"),
+                         os.path.join(helpers.ARCHIVE, "annot_node.csv"),
+                         "--trace-memory")
+        self.assertTrue(os.path.exists(self.path("results", "metrics.json")))
+        self.assertFalse(os.path.exists(self.path("metrics.json")))
+
+
+if __name__ == "__main__":
+    unittest.main()
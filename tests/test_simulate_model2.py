@@ -0,0 +1,80 @@
+"""
+Tests of the tau-leaping of the local simulator : a leap never uses more
+reactives than there are, and the quantities of the elements are conserved
+through the uses of the rules.
+"""
+import unittest
+import helpers
+import simulate_model2
+
+# R0 consumes A much faster than one leap, R1 needs two A for one B and R2
+# is catalysed by C
+MODEL = ('A => B\t1000.0\n'
+         'A + A => B\t1000.0\n'
+         'C + B => C + D\t1000.0\n'
+         '--INITIAL\n'
+         'A\t7\n'
+         'C\t1\n')
+
+
+class TauLeapingTest(helpers.TempDirTestCase):
+    """
+    Leaps of a model whose reactives run out within one leap.
+    """
+
+    def setUp(self):
+        helpers.TempDirTestCase.setUp(self)
+        self.model = self.load_model(MODEL)
+
+    def test_max_firings(self):
+        simulator = simulate_model2.Simulator(self.model, seed=0)
+        self.assertEqual(simulator.max_firings(0), 7)
+        self.assertEqual(simulator.max_firings(1), 3)
+        self.assertEqual(simulator.max_firings(2), 0)
+
+    def rule_uses(self, porfile):
+        """
+        Returns the number of uses of every rule in the whole simulation,
+        from its percentages of the events of every interval.
+        """
+        uses = [0, 0, 0]
+        with open(porfile) as por:
+            for line in list(por)[1:]:
+                fields = [float(field) for field in line.split('\t')]
+                interval = [round(fields[1]*percent/100)
+                            for percent in fields[2:]]
+                self.assertEqual(sum(interval), fields[1])
+                uses = [total + count for total, count in zip(uses, interval)]
+        return uses
+
+    def test_quantities_are_conserved(self):
+        for seed in range(20):
+            poefile, porfile = simulate_model2.simulate(
+                self.model, self.path('run'),
+                samples=3, method="tau", tau=10.0, seed=seed)
+            uses_r0, uses_r1, uses_r2 = self.rule_uses(porfile)
+            # A is only consumed, by R0 and twice by R1, B is made by both
+            # and consumed by R2, and C is kept by R2
+            quantity_a = 7 - uses_r0 - 2*uses_r1
+            quantity_b = uses_r0 + uses_r1 - uses_r2
+            self.assertGreaterEqual(quantity_a, 0)
+            self.assertGreaterEqual(quantity_b, 0)
+            with open(poefile) as poe:
+                rows = poe.readlines()
+            self.assertEqual(len(rows), 4)
+            # Every rule is done within the first interval : the last one
+            # shows the quantities left at the end
+            present = dict(zip(rows[0].split(), rows[-1].split()))
+            self.assertEqual(float(present['A']) > 0, quantity_a > 0)
+            self.assertEqual(float(present['B']) > 0, quantity_b > 0)
+            self.assertEqual(float(present['C']), 100.0)
+            self.assertEqual(float(present['D']) > 0, uses_r2 > 0)
+
+    def test_fire_rejects_missing_reactives(self):
+        simulator = simulate_model2.Simulator(self.model, seed=0)
+        with self.assertRaises(ValueError):
+            simulator.fire(0, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
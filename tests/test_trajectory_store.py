@@ -0,0 +1,53 @@
+"""
+Golden output tests of the reading of the .por files : the uses of the rules
+written in rules_applied.txt must be the ones computed from the text file in
+double precision, with or without the binary store, even for large numbers
+of events.
+"""
+import unittest
+import helpers
+import analyze_model2
+import rule_firing
+import trajectory_store
+
+POR = ('#Tps\t#Evts\tR0\tR1\n'
+       '500.000000\t1715835\t6.425501\t93.574499\n'
+       '1500.000000\t1715835\t0.000000\t100.000000\n')
+RULES_APPLIED = ('At 500.000000, the rule(s) R0, R1 has or have been used '
+                 '110251, 1605584 times\nrespectively\n'
+                 'At 1500.000000, the rule(s) R1 has or have been used '
+                 '1715835 times respectively\n')
+
+
+class LargeEventCountsTest(helpers.TempDirTestCase):
+    """
+    rules_applied.txt of a .por file with more than a million events.
+    """
+
+    def setUp(self):
+        helpers.TempDirTestCase.setUp(self)
+        self.porfile = self.write('run.por', POR)
+
+    def rules_applied(self):
+        """
+        Returns the text of rules_applied.txt for the .por file.
+        """
+        firing = rule_firing.firing_matrix(self.porfile)
+        analyze_model2.rules_in_timesteps(firing, self.dir)
+        return self.read('rules_applied.txt')
+
+    def test_text_file(self):
+        self.assertEqual(self.rules_applied(), RULES_APPLIED)
+
+    def test_binary_store(self):
+        trajectory_store.convert_trajectory(self.porfile)
+        self.assertEqual(self.rules_applied(), RULES_APPLIED)
+
+    def test_columns_kept_exact(self):
+        columns = trajectory_store.parse_text(self.porfile)[2]
+        self.assertEqual(columns[2].typecode, 'd')
+        self.assertEqual(columns[2][0], 6.425501)
+
+
+if __name__ == "__main__":
+    unittest.main()
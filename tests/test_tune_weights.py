@@ -0,0 +1,41 @@
+"""
+Tests of the automatic tuning of the weights : when the best run stops
+improving, the next iterations try new weight vectors until the patience
+runs out, instead of running the same candidates again.
+"""
+import csv
+import unittest
+import helpers
+import tune_weights
+
+# A is never present, so every run dies at its first timestep whatever the
+# weights
+MODEL = ('A => B\t1.0\n'
+         'B => C\t1.0\n'
+         '--INITIAL\n'
+         'C\t1\n')
+
+
+class PlateauTest(helpers.TempDirTestCase):
+    """
+    Tuning of a model whose runs always die at the same time.
+    """
+
+    def test_new_candidates_until_patience(self):
+        model = self.load_model(MODEL)
+        backend = tune_weights.LocalBackend(first=10.0, interval=10.0,
+                                            samples=3)
+        best = tune_weights.tune_weights(model, backend, self.path('out'),
+                                         max_iter=10, patience=2, jobs=1)[1]
+        self.assertIsNotNone(best['death'])
+        with open(self.path('out', 'tuning_log.csv')) as logfile:
+            log = list(csv.DictReader(logfile))
+        self.assertEqual(log[-1]['Iteration'], '2')
+        # Every iteration simulates weight vectors that were not run before
+        for iteration in ('0', '1', '2'):
+            self.assertIn('False', [row['Cached'] for row in log
+                                    if row['Iteration'] == iteration])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Tests of the weight policies : the updated weights of edit_model2.py are the
+factors of the policy applied rule by rule, and the policies can be sent to
+the worker processes of sweep_weights.py.
+"""
+import pickle
+import unittest
+import helpers
+import edit_model2
+import sweep_weights
+import weight_policies
+
+MODEL = ('A => B\t1\n'
+         'B + B => C\t2.0\n'
+         'C => A + D\t0.5\n'
+         'D + A => A + A\t3\n'
+         'NONE => NONE\t1\n'
+         '--INITIAL\n'
+         'A\t10\n')
+
+
+def halve(mean_reac_ratio, mean_prod_ratio):
+    """
+    Halves the weight of the rules with more reactives than products.
+    """
+    return 0.5 if mean_reac_ratio > mean_prod_ratio else 1
+
+
+class PolicyTest(helpers.TempDirTestCase):
+    """
+    Policies applied to a small model.
+    """
+
+    def setUp(self):
+        helpers.TempDirTestCase.setUp(self)
+        self.model = self.load_model(MODEL)
+        self.dict_to_weigh = edit_model2.rules_to_weigh(
+            self.model, edit_model2.element_ratios(self.model))
+
+    def test_new_weights_rule_by_rule(self):
+        policy = weight_policies.ThresholdPolicy(0.5)
+        changed, weights = edit_model2.new_weights(self.model,
+                                                   self.dict_to_weigh, policy)
+        for rule, name in enumerate(self.model.names):
+            text = self.model.weight_text[rule]
+            factor = policy.factor(*self.dict_to_weigh[name][:2])
+            if self.model.is_trivial(rule):
+                self.assertEqual(changed[rule], text)
+                self.assertEqual(weights[rule], 0.001)
+            else:
+                expected = text if factor == 1 else float(text)*factor
+                self.assertEqual(changed[rule], expected)
+                self.assertEqual(weights[rule], expected)
+        self.assertNotEqual(changed[:4], self.model.weight_text[:4])
+
+    def test_base_class_is_abstract(self):
+        with self.assertRaises(TypeError):
+            weight_policies.WeightPolicy()
+
+    def test_function_policy_is_picklable(self):
+        policy = pickle.loads(pickle.dumps(
+            weight_policies.FunctionPolicy("halve", halve)))
+        self.assertEqual(policy.factor(2.0, 1.0), 0.5)
+        with self.assertRaises(ValueError):
+            weight_policies.FunctionPolicy("lambda", lambda reac, prod: 1)
+
+    def test_sweep_with_function_policy(self):
+        summary = sweep_weights.sweep_weights(
+            self.model, [weight_policies.DEFAULT_POLICY,
+                         weight_policies.FunctionPolicy("halve", halve)],
+            self.path('sweep'), jobs=2)
+        self.assertEqual([row["Policy"] for row in summary],
+                         [weight_policies.DEFAULT_POLICY.name, "halve"])
+        self.assertEqual(summary[1]["Increased"], 0)
+        self.assertEqual(summary[1]["Decreased"] + summary[1]["Unchanged"],
+                         4)
+
+
+if __name__ == "__main__":
+    unittest.main()